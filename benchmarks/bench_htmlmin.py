@@ -0,0 +1,79 @@
+"""
+Benchmark: processor.optimize.htmlmin over a saved mirror.
+
+Usage:
+    python -m benchmarks.bench_htmlmin <backup_root> [--inline] [--no-strip]
+                                       [--limit 2000] [--parse]
+
+Runs the optimiser on every HTML file under <backup_root> (pages saved
+before the optimiser existed, or any folder of forum HTML) and reports the
+bytes saved and the time per page. --parse also times a BeautifulSoup
+re-parse of each page, the cost the streaming pass avoids.
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import time
+from pathlib import Path
+
+from processor.optimize.htmlmin import minify
+
+
+def load_pages(root: Path, limit: int) -> list[str]:
+    pages = []
+    for f in sorted(root.rglob("*.html")):
+        pages.append(f.read_text("utf-8", errors="replace"))
+        if len(pages) >= limit:
+            break
+    return pages
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("root", type=Path)
+    ap.add_argument("--inline", action="store_true", help="minify inline CSS/JS")
+    ap.add_argument("--no-strip", action="store_true", help="keep offline-dead code")
+    ap.add_argument("--limit", type=int, default=2000)
+    ap.add_argument("--parse", action="store_true", help="time a bs4 re-parse too")
+    args = ap.parse_args()
+
+    pages = load_pages(args.root, args.limit)
+    if not pages:
+        raise SystemExit(f"no HTML files under {args.root}")
+
+    times, before, after = [], 0, 0
+    for html in pages:
+        t0 = time.perf_counter()
+        out = minify(html, strip_offline=not args.no_strip, inline=args.inline)
+        times.append(time.perf_counter() - t0)
+        before += len(html.encode("utf-8"))
+        after += len(out.encode("utf-8"))
+
+    total = sum(times)
+    p95 = sorted(times)[int(len(times) * 0.95) - 1] if len(times) > 1 else times[0]
+    saved = before - after
+    print(f"{len(pages):,} pages, {before / 1e6:,.2f} MB -> {after / 1e6:,.2f} MB")
+    print(
+        f"saved {saved / 1e6:,.2f} MB ({saved / before:.1%}), {saved / len(pages):,.0f} B/page"
+    )
+    print(
+        f"htmlmin  {total * 1000 / len(pages):8.2f} ms/page"
+        f"  median {statistics.median(times) * 1000:.2f}  p95 {p95 * 1000:.2f}"
+        f"  ({before / total / 1e6:,.1f} MB/s)"
+    )
+    if args.parse:
+        from bs4 import BeautifulSoup
+
+        t0 = time.perf_counter()
+        for html in pages:
+            str(BeautifulSoup(html, "html.parser"))
+        dt = time.perf_counter() - t0
+        print(
+            f"bs4 parse {dt * 1000 / len(pages):8.2f} ms/page ({dt / total:.1f}x htmlmin)"
+        )
+
+
+if __name__ == "__main__":
+    main()
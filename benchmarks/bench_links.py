@@ -0,0 +1,113 @@
+"""
+Micro-benchmark: rewrite_links on a large topic page, per-anchor relpath
+(the previous implementation) vs the folder-prefix table.
+
+Usage:
+    python -m benchmarks.bench_links [page.html] [--anchors 3000] [-n 30]
+
+Without a page, a synthetic topic page is built: `anchors` links to
+profiles, posts, categories and other topics, many of them repeated, as
+on a long forumeiros thread. Every target has a State record.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+from bs4 import BeautifulSoup
+
+import config.settings as settings
+from core.pathutils import rel_to_abs
+from core.redirects import redirects
+from core.state import REL, State
+from core.urlfilter import EXTERNAL, SKIP, TRACKER, UrlFilter
+from processor.rewrite.links import rewrite_links
+
+FORUM = "https://sm-portugal.forumeiros.com"
+
+
+def legacy_rewrite_links(soup: BeautifulSoup, cur_file: str, state: State):
+    """Copy of rewrite_links before the prefix table."""
+    cur_dir = os.path.dirname(cur_file)
+    classify = settings.URL_FILTER.classify
+    for a in soup.find_all("a", href=True):
+        v = classify(a["href"])
+        if v.kind in (SKIP, EXTERNAL, TRACKER):
+            continue
+        rec = state.urls.get(redirects.resolve(v.key))
+        if not rec:
+            continue
+        target_file = rel_to_abs(rec[REL])
+        rel_link = os.path.relpath(target_file, cur_dir).replace(os.sep, "/")
+        if rel_link.endswith("/index.html"):
+            rel_link = rel_link[: -len("index.html")] or "./"
+        if v.fragment:
+            rel_link += "#" + v.fragment
+        a["href"] = rel_link
+
+
+def synthetic_page(state: State, anchors: int) -> str:
+    rnd = random.Random(42)
+    kinds = [("u", "users", 80), ("t", "topicos", 200), ("f", "categorias", 20)]
+    hrefs = []
+    for prefix, folder, n in kinds:
+        for i in range(1, n + 1):
+            path = f"/{prefix}{i}-slug-{i}"
+            state.add_url(path, f"{folder}/{prefix}{i}-slug-{i}.html")
+            hrefs.append(path)
+    state.add_url("/", "index.html")
+    hrefs += ["/", "/t1-slug-1#p{}", "https://example.org/out"]
+    parts = []
+    for i in range(anchors):
+        h = rnd.choice(hrefs).replace("{}", str(i % 50))
+        parts.append(f'<div class="post"><a href="{h}">link {i}</a></div>')
+    return "<html><body>" + "\n".join(parts) + "</body></html>"
+
+
+def _time(label: str, fn, html: str, cur: str, state: State, n: int) -> float:
+    soups = [BeautifulSoup(html, "html.parser") for _ in range(n)]
+    anchors = len(soups[0].find_all("a", href=True))
+    t0 = time.perf_counter()
+    for soup in soups:
+        fn(soup, cur, state)
+    dt = time.perf_counter() - t0
+    print(
+        f"{label:<22} {dt * 1000 / n:8.2f} ms/page  {anchors * n / dt:12,.0f} anchors/s"
+    )
+    return dt
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("page", nargs="?", type=Path)
+    ap.add_argument("--anchors", type=int, default=3000)
+    ap.add_argument("-n", type=int, default=30)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench_links_") as tmp:
+        root = Path(tmp)
+        settings.BACKUP_ROOT = root
+        settings.URL_FILTER = UrlFilter(FORUM, (), (), ())
+        state = State(SimpleNamespace(retry_limit=3), str(root / "s.json"), "")
+        if args.page:
+            html = args.page.read_text("utf-8", errors="replace")
+            synthetic_page(state, 0)  # records for the usual targets
+        else:
+            html = synthetic_page(state, args.anchors)
+        cur = str(root / "topicos" / "t1-slug-1.html")
+
+        base = _time(
+            "per-anchor relpath", legacy_rewrite_links, html, cur, state, args.n
+        )
+        new = _time("prefix table", rewrite_links, html, cur, state, args.n)
+        print(f"speedup: {base / new:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
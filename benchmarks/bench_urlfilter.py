@@ -0,0 +1,83 @@
+"""
+Micro-benchmark: legacy `_is_valid_link` vs compiled `UrlFilter.classify`.
+
+Usage:
+    python -m benchmarks.bench_urlfilter <backup_root> [forum_url] [-n 1000000]
+
+Collects every href from the HTML files saved under <backup_root> and
+classifies them until `n` hrefs have been processed.
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import re
+import time
+from pathlib import Path
+from urllib.parse import parse_qsl, urljoin, urlparse
+
+import config.settings as settings
+
+HREF_RE = re.compile(rb"""<a\s[^>]*?href\s*=\s*["']([^"']+)["']""", re.IGNORECASE)
+
+
+def collect_hrefs(root: Path) -> list[str]:
+    hrefs: list[str] = []
+    for f in root.rglob("*.html"):
+        for m in HREF_RE.finditer(f.read_bytes()):
+            hrefs.append(m.group(1).decode("utf-8", "ignore"))
+    return hrefs
+
+
+def legacy_is_valid_link(href: str) -> bool:
+    """Copy of the pre-UrlFilter check in crawler.discover."""
+    if href.startswith(("mailto:", "javascript:", "#")):
+        return False
+    abs_url = urljoin(settings.BASE_URL, href)
+    p = urlparse(abs_url.split("#", 1)[0])
+    if p.netloc and p.netloc != settings.BASE_DOMAIN:
+        return False
+    if any(p.path.startswith(pref) for pref in settings.IGNORED_PREFIXES):
+        return False
+    if p.query:
+        keys = {k for k, _ in parse_qsl(p.query)}
+        if keys & settings.BLACKLIST_PARAMS:
+            return False
+    return True
+
+
+def _time(label: str, fn, hrefs: list[str], n: int) -> float:
+    t0 = time.perf_counter()
+    for href in itertools.islice(itertools.cycle(hrefs), n):
+        fn(href)
+    dt = time.perf_counter() - t0
+    print(f"{label:<24} {dt:8.3f}s  {n / dt:12,.0f} hrefs/s")
+    return dt
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("root", type=Path)
+    ap.add_argument(
+        "forum_url", nargs="?", default="https://sm-portugal.forumeiros.com"
+    )
+    ap.add_argument("-n", type=int, default=1_000_000)
+    args = ap.parse_args()
+
+    yaml_path = args.root / "settings.yaml"
+    settings.init(args.root, yaml_path if yaml_path.exists() else None, args.forum_url)
+    hrefs = collect_hrefs(args.root)
+    if not hrefs:
+        raise SystemExit(f"no hrefs found under {args.root}")
+    print(f"{len(hrefs):,} hrefs ({len(set(hrefs)):,} unique), {args.n:,} lookups")
+
+    uf = settings.URL_FILTER
+    base = _time("legacy _is_valid_link", legacy_is_valid_link, hrefs, args.n)
+    cold = _time("UrlFilter (uncached)", uf._classify, hrefs, args.n)
+    warm = _time("UrlFilter.classify", uf.classify, hrefs, args.n)
+    print(f"speedup: {base / cold:.1f}x uncached, {base / warm:.1f}x memoised")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,12 @@
 #!/usr/bin/env python3
 """
 Entry-point for Forum-Mirror CLI.
-Usage: python -m cli
+Usage: python -m cli [--processes N | --serve HOST:PORT] [--token T]
+       python -m cli --worker http://HOST:PORT [--token T]
+       python -m cli --relink BACKUP_DIR
+       python -m cli --migrate-layout BACKUP_DIR
+       python -m cli --extract BACKUP_DIR
+       python -m cli --view BACKUP_DIR [--port 8000]
 """
 
 from __future__ import annotations
@@ -12,10 +17,14 @@ from utils.logging import setup as log_setup
 log_setup("DEBUG")
 
 # ─── Standard library imports ───────────────────────────────────────────────
+import argparse
 import asyncio
+import ipaddress
+import json
 import os
 import platform
 import shutil
+import signal
 import subprocess
 import sys
 from pathlib import Path
@@ -23,12 +32,28 @@ from pathlib import Path
 # ─── Third-party & local imports ────────────────────────────────────────────
 import config.settings as settings
 from cli.auth import handle_authentication
+from cli.viewer import serve
 from config.settings import init as init_settings
 from core.adblock import update_hosts
 from core.fetcher import Fetcher
 from core.state import State
 from core.throttle import ThrottleController
-from crawler.scheduler import run_discovery_phase, run_download_phase
+from crawler.budget import CrawlBudget, coverage_report
+from crawler.distributed import run_coordinator, run_worker
+from crawler.multiproc import run_sharded
+from crawler.scheduler import run_discovery_phase, run_download_phase, run_pipelined
+from processor.cache import open_cache
+from processor.layout import migrate_layout
+from processor.linkindex import open_index, relink
+from processor.optimize.chrome import chrome_report
+from utils.archive import (
+    PackedArchive,
+    is_packed,
+    open_packed,
+    start_packing,
+    stop_packing,
+)
+from utils.writer import close_writer, writer_report
 
 
 # ─────────────────────────────────────────────────────────────
@@ -51,14 +76,194 @@ def prompt_forum_and_folder(last_url: str | None = None) -> tuple[str, Path]:
     return forum, backup_root
 
 
-# ─────────────────────────────────────────────────────────────
-# Main
-# ─────────────────────────────────────────────────────────────
-async def main():
-    # 1) Prompt for forum URL and backup folder
-    forum_url, backup_root = prompt_forum_and_folder()
+def _install_stop_signals():
+    """
+    Turn SIGTERM (and SIGINT) into cancellation of the main task so state is
+    flushed and leases released. Not available on Windows, where Ctrl+C
+    already cancels the main task via asyncio.run().
+    """
+    loop = asyncio.get_running_loop()
+    task = asyncio.current_task()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, task.cancel)
+        except (NotImplementedError, RuntimeError):
+            pass
 
-    # 2) Load config + per-forum settings
+
+def _parse_args(argv=None) -> argparse.Namespace:
+    ap = argparse.ArgumentParser(prog="python -m cli")
+    ap.add_argument(
+        "--processes",
+        type=int,
+        default=1,
+        metavar="N",
+        help="crawl with N worker processes, each owning a hash shard of the URLs",
+    )
+    ap.add_argument(
+        "--serve",
+        metavar="HOST:PORT",
+        help="coordinate the crawl: hand out URLs to --worker nodes over HTTP"
+        " (HOST defaults to 127.0.0.1; any other address needs --token)",
+    )
+    ap.add_argument(
+        "--worker",
+        metavar="URL",
+        help="crawl for the coordinator at URL (no prompts, nothing stored here)",
+    )
+    ap.add_argument(
+        "--token",
+        default=os.environ.get("FORUM_MIRROR_TOKEN"),
+        help="shared secret between coordinator and workers",
+    )
+    ap.add_argument(
+        "--relink",
+        type=Path,
+        metavar="BACKUP_DIR",
+        help="fix the links of saved pages after redirects/renames, then exit",
+    )
+    ap.add_argument(
+        "--migrate-layout",
+        type=Path,
+        metavar="BACKUP_DIR",
+        help="move saved pages to the `sharding` layout in settings.yaml, then exit",
+    )
+    ap.add_argument(
+        "--extract",
+        type=Path,
+        metavar="BACKUP_DIR",
+        help="write the pages and assets of a packed backup out as files, then exit",
+    )
+    ap.add_argument(
+        "--view",
+        type=Path,
+        metavar="BACKUP_DIR",
+        help="browse a backup (folder or packed) on http://127.0.0.1:PORT",
+    )
+    ap.add_argument("--port", type=int, default=8000, help="port for --view")
+    args = ap.parse_args(argv)
+    if args.serve:
+        host, _, port = args.serve.rpartition(":")
+        if not port.isdigit():
+            ap.error("--serve expects HOST:PORT")
+        host = host.strip("[]") or "127.0.0.1"
+        if not args.token and not _is_loopback(host):
+            ap.error(f"--serve on {host} needs --token (or FORUM_MIRROR_TOKEN)")
+        args.serve = (host, int(port))
+    return args
+
+
+def _is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False  # a host name: may resolve to anything
+
+
+async def _run_single(state: State, cookies: dict, budget: CrawlBudget):
+    throttle = ThrottleController(settings)
+    fetcher = Fetcher(settings, throttle, cookies, budget=budget)
+    autosave = asyncio.create_task(state.autosave())
+    try:
+        if settings.PIPELINE.get("enabled"):
+            await run_pipelined(settings, state, fetcher)
+        else:
+            await run_discovery_phase(settings, state, fetcher)
+            await run_download_phase(settings, state, fetcher)
+    finally:
+        autosave.cancel()
+        state.release_all()
+        await state.save()
+        await fetcher.close()
+
+
+def _load_backup_settings(backup_root: Path):
+    yaml_path = backup_root / "settings.yaml"
+    init_settings(backup_root, yaml_path if yaml_path.exists() else None)
+
+
+async def _open_backup(backup_root: Path) -> State:
+    """Settings and state of an existing backup, for the offline commands."""
+    _load_backup_settings(backup_root)
+    state = State(
+        settings,
+        str(backup_root / "crawl_state.json"),
+        str(backup_root / "assets_cache.json"),
+    )
+    await state.load()
+    return state
+
+
+async def _relink(backup_root: Path):
+    """
+    Rewrite, in place, the hrefs of saved pages that link to a URL that has
+    since been redirected or given another local file.
+    """
+    state = await _open_backup(backup_root)
+    cache = open_cache(backup_root) if settings.REWRITE_CACHE else None
+    archive = open_packed(backup_root)  # pages are read and rewritten in place
+    try:
+        stats = await relink(state, open_index(backup_root), cache)
+    finally:
+        stop_packing(archive)
+    print(
+        f"🔗 Relinked {stats['hrefs']} links in {stats['pages']} pages "
+        f"({stats['keys']} changed targets)."
+    )
+
+
+async def _migrate_layout(backup_root: Path):
+    """Move the saved pages to the configured `sharding` layout, in place."""
+    if is_packed(backup_root):
+        print(
+            f"{backup_root} is packed: pages in the archive cannot be moved. "
+            "Run --extract, delete its archive folder, then --migrate-layout."
+        )
+        return
+    state = await _open_backup(backup_root)
+    index = open_index(backup_root)
+    cache = open_cache(backup_root) if settings.REWRITE_CACHE else None
+    stats = await migrate_layout(state, backup_root, index, cache)
+    mode = (settings.SHARDING or {}).get("mode") or "none"
+    print(
+        f"🗂️  Layout '{mode}': moved {stats['moved']} of {stats['records']} pages, "
+        f"{stats['links']} links fixed in {stats['rewritten']} files."
+    )
+
+
+async def _extract(backup_root: Path):
+    """Unpack a packed_output backup into the normal folder tree."""
+    await _open_backup(backup_root)
+    if not is_packed(backup_root):
+        print(f"No archive in {backup_root}.")
+        return
+    archive = PackedArchive(backup_root)
+    n = await archive.extract(backup_root)
+    print(f"📂 Extracted {n} files into {backup_root}.")
+
+
+async def _offline_command(args: argparse.Namespace) -> bool:
+    """Run the command that needs no prompts, if one was given."""
+    if args.worker:
+        await run_worker(args.worker, args.token)
+    elif args.relink:
+        await _relink(args.relink.expanduser())
+    elif args.migrate_layout:
+        await _migrate_layout(args.migrate_layout.expanduser())
+    elif args.extract:
+        await _extract(args.extract.expanduser())
+    elif args.view:
+        _load_backup_settings(args.view.expanduser())  # its FOLDER_MAPPING
+        await serve(args.view.expanduser(), args.port)
+    else:
+        return False
+    return True
+
+
+def _settings_file(backup_root: Path) -> Path:
+    """The backup's settings.yaml, created from the defaults on first run."""
     yaml_path = backup_root / "settings.yaml"
     if not yaml_path.exists():
         # create from defaults
@@ -70,6 +275,105 @@ async def main():
                 "notepad" if platform.system() == "Windows" else "nano"
             )
             subprocess.call([editor, str(yaml_path)])
+    return yaml_path
+
+
+async def _run_phases(args, state: State, cookies: dict, budget: CrawlBudget, run):
+    """Crawl in one process, in shards, or as the coordinator."""
+    backup_root, yaml_path, forum_url = run
+    if args.processes > 1:
+        init_args = (str(backup_root), str(yaml_path), forum_url)
+        try:
+            totals = await run_sharded(state, cookies, args.processes, init_args)
+        finally:
+            await state.save()
+        budget.pages, budget.assets, budget.bytes = (
+            totals["pages"],
+            totals["assets"],
+            totals["bytes"],
+        )
+        budget.reason = totals["stopped_by"]
+    elif args.serve:
+        host, port = args.serve
+        config = {
+            "yaml": yaml_path.read_text("utf-8"),
+            "forum_url": forum_url,
+            "cookies": cookies,
+        }
+        try:
+            await run_coordinator(state, budget, config, host, port, args.token)
+        finally:
+            state.release_all()
+            await state.save()
+    else:
+        await _run_single(state, cookies, budget)
+
+
+def _print_report(report: dict):
+    print(f"📊 Coverage: {report['urls']}")
+    chrome = report.get("shared_chrome")
+    if chrome is not None:
+        print(
+            f"🧩 Shared chrome: {chrome['bytes_saved'] / 1e6:,.1f} MB saved "
+            f"({chrome['reduction']:.0%}) over {chrome['pages']:,} pages, "
+            f"{chrome['fragments']} fragments"
+        )
+    pk = report.get("packed_output")
+    if pk is not None:
+        print(
+            f"📦 Archive: {pk['files']:,} files in {pk['parts']} parts, "
+            f"{pk['bytes'] / 1e6:,.1f} MB packed to {pk['packed_bytes'] / 1e6:,.1f} MB"
+        )
+    writes = report.get("file_writer")
+    if writes is not None:
+        lat = writes["latency_ms"]
+        print(
+            f"💾 Writes: {writes['writes']:,} files, {writes['bytes'] / 1e6:,.1f} MB, "
+            f"latency avg {lat['avg']:.1f} ms / p95 {lat['p95']:.1f} ms, "
+            f"queue peak {writes['queue_max']} (full {writes['waited']}x)"
+        )
+
+
+async def _finalize(state: State, budget: CrawlBudget, backup_root: Path, packed):
+    await close_writer()  # flush queued writes before they are reported
+    shutil.copy(
+        backup_root / "crawl_state.json", backup_root / "crawl_state_final.json"
+    )
+    report = coverage_report(state, budget)
+    chrome = chrome_report(backup_root)
+    if chrome is not None:
+        report["shared_chrome"] = chrome
+    writes = writer_report()
+    if writes is not None:
+        report["file_writer"] = writes
+    if packed is not None:
+        report["packed_output"] = packed.report()
+    (backup_root / "crawl_report.json").write_text(
+        json.dumps(report, indent=2, ensure_ascii=False), "utf-8"
+    )
+    _print_report(report)
+    if not report["complete"]:
+        why = budget.reason or "errors"
+        print(
+            f"⏱️  Stopped early ({why}): {len(report['missing'])} URLs not yet "
+            "downloaded, see crawl_report.json. Run again to resume."
+        )
+        return
+    print("🎉 Backup complete! Open index.html in the backup folder to browse offline.")
+
+
+# ─────────────────────────────────────────────────────────────
+# Main
+# ─────────────────────────────────────────────────────────────
+async def main(args: argparse.Namespace):
+    if await _offline_command(args):
+        return
+
+    # 1) Prompt for forum URL and backup folder
+    forum_url, backup_root = prompt_forum_and_folder()
+
+    # 2) Load config + per-forum settings
+    yaml_path = _settings_file(backup_root)
     # lock to prevent mid-run edits
     (backup_root / "settings.yaml.lock").write_text("")
     init_settings(backup_root, yaml_path, forum_url)
@@ -87,30 +391,33 @@ async def main():
     cache_file = backup_root / "assets_cache.json"
     state = State(settings, str(state_file), str(cache_file))
     await state.load()
+    if state.recovered:
+        print(f"♻️  Resuming {len(state.recovered)} URLs left in flight last run.")
 
     # 6) Handle resume, reset, status prompts (could add flags later)
     if not state.urls:
         state.add_url("/", "index.html")
         await state.save()
 
-    # 7) Setup fetcher & throttle
-    throttle = ThrottleController(settings)
-    fetcher = Fetcher(settings, throttle, cookies)
+    # 7) Run budget
+    budget = CrawlBudget.from_settings(settings)
 
-    # 8) Run phases
-    await run_discovery_phase(settings, state, fetcher)
-    await run_download_phase(settings, state, fetcher)
+    # 8) Run phases; SIGINT/SIGTERM cancel this task and land in `finally`
+    _install_stop_signals()
+    packed = start_packing(backup_root)  # None unless packed_output.enabled
+    try:
+        run = (backup_root, yaml_path, forum_url)
+        await _run_phases(args, state, cookies, budget, run)
+    finally:
+        stop_packing(packed)
 
     # 9) Finalize
-    await state.save()
-    await fetcher.close()
-    shutil.copy(state_file, backup_root / "crawl_state_final.json")
-    print("🎉 Backup complete! Open index.html in the backup folder to browse offline.")
+    await _finalize(state, budget, backup_root, packed)
 
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
-    except KeyboardInterrupt:
-        print("\nInterrupted by user. Saving state...")
+        asyncio.run(main(_parse_args()))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        print("\nInterrupted. State saved, in-flight URLs will resume next run.")
         sys.exit(1)
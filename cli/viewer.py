@@ -0,0 +1,137 @@
+"""
+Local viewer: browse a backup at http://127.0.0.1:PORT without unpacking it.
+
+    python -m cli --view BACKUP_DIR [--port 8000]
+
+Files come from the packed archive when the backup has one (parts are
+memory-mapped and looked up through archive/index.sqlite). Anything not in
+the archive comes from the folder. Only the mirror's output is served (see
+core.pathutils.is_output_rel): crawl state, settings, cookies and the
+archive index are not, and requests whose Host is not localhost get a 403,
+so other sites cannot read the backup through DNS rebinding. Deflated
+entries go to browsers that accept gzip exactly as stored, inside a gzip
+wrapper, so nothing is compressed per request. Every response has an ETag.
+Pages are revalidated on each visit and assets are cached for a day. The
+viewer serves local files only and never contacts the forum.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import mimetypes
+import struct
+import zipfile
+import zlib
+from pathlib import Path
+
+from aiohttp import web
+
+from core.pathutils import is_output_rel
+from utils.archive import ArchiveReader
+
+ASSET_MAX_AGE = 86400
+GZIP_HEADER = b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff"  # deflate, no name/mtime
+BIG = 1 << 20  # bodies above this are assembled off the event loop
+LOCAL_HOSTS = {"localhost", "127.0.0.1", "::1"}
+
+
+def _gzip(raw: memoryview, crc: int, size: int) -> bytes:
+    """A stored raw-deflate ZIP entry as a gzip body (no recompression)."""
+    return b"".join((GZIP_HEADER, raw, struct.pack("<LL", crc, size & 0xFFFFFFFF)))
+
+
+def _inflate(raw: memoryview) -> bytes:
+    return zlib.decompress(raw, -15)
+
+
+class Viewer:
+    def __init__(self, root: str | Path):
+        self.root = Path(root).resolve()
+        db = self.root / "archive" / "index.sqlite"
+        self.archive = ArchiveReader(self.root) if db.exists() else None
+
+    @staticmethod
+    def _rel(tail: str) -> str | None:
+        """BACKUP_ROOT-relative file for a URL path, None if it escapes."""
+        parts = [p for p in tail.split("/") if p not in ("", ".")]
+        if ".." in parts or any("\\" in p or ":" in p for p in parts):
+            return None
+        if not parts or tail.endswith("/"):
+            parts.append("index.html")
+        return "/".join(parts)
+
+    def _cache_headers(self, rel: str) -> dict:
+        ctype = mimetypes.guess_type(rel)[0] or "application/octet-stream"
+        if ctype.startswith("text/") or ctype.endswith(("javascript", "+xml")):
+            ctype += "; charset=utf-8"
+        cache = (
+            f"public, max-age={ASSET_MAX_AGE}"
+            if rel.startswith("assets/")
+            else "no-cache"
+        )
+        return {"Content-Type": ctype, "Cache-Control": cache}
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        tail = request.match_info["tail"]
+        if request.url.host not in LOCAL_HOSTS:
+            raise web.HTTPForbidden()
+        rel = self._rel(tail)
+        if rel is None:
+            raise web.HTTPForbidden()
+        folder = not tail.endswith("/") and is_output_rel(rel + "/index.html")
+        if not is_output_rel(rel) and not folder:
+            raise web.HTTPNotFound()
+        hit = self.archive.entry(rel) if self.archive is not None else None
+        if hit is not None:
+            return await self._from_archive(request, rel, *hit)
+        path = self.root.joinpath(*rel.split("/"))
+        if is_output_rel(rel) and path.is_file():
+            return web.FileResponse(path, headers=self._cache_headers(rel))
+        # a folder link without its slash
+        if folder and (
+            path.is_dir()
+            or (self.archive is not None and self.archive.entry(rel + "/index.html"))
+        ):
+            raise web.HTTPFound("/" + rel + "/")
+        raise web.HTTPNotFound()
+
+    async def _from_archive(self, request, rel, raw, method, crc, size):
+        headers = self._cache_headers(rel)
+        headers["ETag"] = etag = f'"{crc:08x}-{size:x}"'
+        if etag in request.headers.get("If-None-Match", ""):
+            return web.Response(status=304, headers=headers)
+        if method == zipfile.ZIP_DEFLATED:
+            headers["Vary"] = "Accept-Encoding"
+            if "gzip" in request.headers.get("Accept-Encoding", ""):
+                headers["Content-Encoding"] = "gzip"
+                build, args = _gzip, (raw, crc, size)
+            else:
+                build, args = _inflate, (raw,)
+            if len(raw) > BIG:
+                body = await asyncio.to_thread(build, *args)
+            else:
+                body = build(*args)
+        else:
+            body = raw  # stored as-is: straight from the mapped part
+        return web.Response(body=body, headers=headers)
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/{tail:.*}", self.handle)
+        return app
+
+
+async def serve(root: Path, port: int = 8000, host: str = "127.0.0.1"):
+    """Serve `root` until cancelled (Ctrl-C)."""
+    viewer = Viewer(root)
+    runner = web.AppRunner(viewer.make_app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    source = "archive + folder" if viewer.archive is not None else "folder"
+    print(f"🌐 Serving {root} ({source}) on http://{host}:{port}/  (Ctrl-C to stop)")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+        if viewer.archive is not None:
+            viewer.archive.close()
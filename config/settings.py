@@ -1,9 +1,13 @@
 from __future__ import annotations
 
 from pathlib import Path
+from typing import TYPE_CHECKING
 
 import yaml
 
+if TYPE_CHECKING:
+    from core.urlfilter import UrlFilter
+
 # Globals to be populated by init()
 BACKUP_ROOT: Path | None = None
 BASE_URL: str = ""
@@ -15,14 +19,36 @@ min_delay: float = 0.1
 max_delay: float = 10.0
 retry_limit: int = 3
 
-FOLDER_MAPPING: dict[str, str] = {}
+FOLDER_MAPPING: dict[str, str] = {
+    "f": "categorias",
+    "t": "topicos",
+    "u": "users",
+    "g": "grupos",
+}
 IGNORED_PREFIXES: tuple[str, ...] = ()
 BLACKLIST_PARAMS: set[str] = set()
 AD_HOSTS: set[str] = set()
+AD_ALLOW_HOSTS: set[str] = set()
 TRACKER_PATTERNS: list[str] = []
 AD_SOURCES: list[dict] = []
 MAX_ASSET_KB: int | None = None
+LARGE_ASSET_MB: float = 8
+RANGE_SEGMENTS: int = 1
+ASSET_WORKERS: int = 8
+ASSET_CONCURRENCY: int = 16
+SHARED_ASSET_STORE: str | None = None
 SLUG_MAX_LEN: int = 120
+BUDGET: dict = {}
+PIPELINE: dict = {}
+REWRITE_CACHE: bool = True
+HTML_OPTIMIZE: dict = {}
+SHARED_CHROME: dict = {}
+FILE_WRITER: dict = {}
+SHARDING: dict = {}
+PACKED_OUTPUT: dict = {}
+LEASE_SECONDS: float = 600
+MAX_RPS: float | None = None
+URL_FILTER: UrlFilter | None = None
 
 
 def _load_yaml(path: Path) -> dict:
@@ -42,6 +68,7 @@ def init(backup_root: Path, user_yaml: Path | None = None, forum_url: str = "")
 
     - Sets BACKUP_ROOT, BASE_URL, BASE_DOMAIN based on user input.
     - Reads `defaults.yaml` and merges with `user_yaml` if provided.
+    - Compiles URL_FILTER from the ignore/blacklist/tracker rules.
 
     Args:
         backup_root: Path to the forum's output folder.
@@ -64,16 +91,37 @@ def init(backup_root: Path, user_yaml: Path | None = None, forum_url: str = "")
     cfg = {**defaults, **overrides}
 
     # 3. Other config values
-    fm = cfg.get("folder_mapping", {})
+    fm = cfg.get("folder_mapping", FOLDER_MAPPING)
     ip = tuple(cfg.get("ignored_prefixes", []))
     bp = set(cfg.get("blacklist_params", []))
-    ah = set(cfg.get("ad_hosts", []))
+    ah = {h.lower() for h in cfg.get("ad_hosts") or []}
+    aa = {h.lower() for h in cfg.get("ad_allow_hosts") or []}
     tp = cfg.get("tracker_patterns", [])
     srcs = cfg.get("ad_sources", [])
     mb = cfg.get("max_asset_kb")
+    lm = cfg.get("large_asset_mb") or LARGE_ASSET_MB
+    rs = cfg.get("range_segments") or RANGE_SEGMENTS
+    aw = cfg.get("asset_workers") or ASSET_WORKERS
+    ac = cfg.get("asset_concurrency") or ASSET_CONCURRENCY
+    sas = cfg.get("shared_asset_store")
     sl = cfg.get("slug_max_len", SLUG_MAX_LEN)
+    bg = cfg.get("budget") or {}
+    pl = cfg.get("pipeline") or {}
+    rc = bool(cfg.get("rewrite_cache", REWRITE_CACHE))
+    ho = cfg.get("html_optimize") or {}
+    sc = cfg.get("shared_chrome") or {}
+    fw = cfg.get("file_writer") or {}
+    sh = cfg.get("sharding") or {}
+    po = cfg.get("packed_output") or {}
+    ls = cfg.get("lease_seconds") or LEASE_SECONDS
+    rps = cfg.get("max_rps")
+
+    # 4. Compile the shared URL filter once
+    from core.urlfilter import UrlFilter
+
+    uf = UrlFilter(forum_url, ip, bp, tp)
 
-    # 4. Update module globals
+    # 5. Update module globals
     globals().update(
         BACKUP_ROOT=BACKUP_ROOT,
         BASE_URL=BASE_URL,
@@ -82,8 +130,25 @@ def init(backup_root: Path, user_yaml: Path | None = None, forum_url: str = "")
         IGNORED_PREFIXES=ip,
         BLACKLIST_PARAMS=bp,
         AD_HOSTS=ah,
+        AD_ALLOW_HOSTS=aa,
         TRACKER_PATTERNS=tp,
         AD_SOURCES=srcs,
         MAX_ASSET_KB=mb,
+        LARGE_ASSET_MB=lm,
+        RANGE_SEGMENTS=rs,
+        ASSET_WORKERS=aw,
+        ASSET_CONCURRENCY=ac,
+        SHARED_ASSET_STORE=sas,
         SLUG_MAX_LEN=sl,
+        BUDGET=bg,
+        PIPELINE=pl,
+        REWRITE_CACHE=rc,
+        HTML_OPTIMIZE=ho,
+        SHARED_CHROME=sc,
+        FILE_WRITER=fw,
+        SHARDING=sh,
+        PACKED_OUTPUT=po,
+        LEASE_SECONDS=ls,
+        MAX_RPS=rps,
+        URL_FILTER=uf,
     )
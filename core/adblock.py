@@ -1,41 +1,193 @@
+import asyncio
+import hashlib
+import json
 import re
 import time
+from functools import lru_cache
 from pathlib import Path
+from typing import Container, Iterable
 
 import aiohttp
 
-from config.settings import AD_HOSTS, AD_SOURCES
+import config.settings as settings
+from core.hostlist import HostList, compile_hosts
+from utils.files import safe_file_write
 
-HOSTLINE_RE = re.compile(r"^[0-9.]+\\s+([^#\\s]+)")
+HOSTLINE_RE = re.compile(r"^[0-9.]+\s+([^#\s]+)")
 
 
-async def _fetch_and_cache(src: dict, cache_file: Path):
+class HostMatcher:
+    """
+    Suffix matcher over blocked/allowed domain names.
+
+    A host is checked together with all of its parent domains
+    (`x.y.doubleclick.net` → `y.doubleclick.net` → `doubleclick.net`), one
+    hash lookup per label. The most specific listed name wins, so an allow-list
+    entry exempts a host even when a parent domain is blocked.
+    Results are cached per host.
+    """
+
+    def __init__(self, blocked: Container[str], allowed: Iterable[str] = ()):
+        self.blocked = blocked
+        self.allowed = frozenset(h.lower() for h in allowed if h)
+        self.is_blocked = lru_cache(maxsize=8192)(self._is_blocked)
+
+    def _is_blocked(self, host: str) -> bool:
+        host = host.lower().rstrip(".").split(":", 1)[0]
+        if not host:
+            return False
+        labels = host.split(".")
+        # stop before the bare TLD: single-label entries never match
+        for i in range(max(1, len(labels) - 1)):
+            name = ".".join(labels[i:])
+            if name in self.allowed:
+                return False
+            if name in self.blocked:
+                return True
+        return False
+
+
+_matcher: HostMatcher | None = None
+
+
+def _build_matcher(blocked: Container[str]) -> HostMatcher:
+    allowed = set(settings.AD_ALLOW_HOSTS)
+    if settings.BASE_DOMAIN:
+        # never block the forum being mirrored
+        allowed.add(settings.BASE_DOMAIN.split(":", 1)[0])
+    return HostMatcher(blocked, allowed)
+
+
+class _AnyOf:
+    """Membership over several host containers (compiled list + config)."""
+
+    def __init__(self, *sets: Container[str]):
+        self.sets = sets
+
+    def __contains__(self, name: object) -> bool:
+        return any(name in s for s in self.sets)
+
+
+def _load_meta(meta_file: Path) -> dict:
+    try:
+        return json.loads(meta_file.read_text("utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+async def _refresh_source(
+    session: aiohttp.ClientSession, src: dict, cache_file: Path
+) -> str:
+    """
+    Make sure `cache_file` holds a current copy of `src` and return the
+    SHA-256 of its contents ("" if nothing could be obtained).
+
+    A stale cache is revalidated with If-None-Match / If-Modified-Since, so a
+    304 only bumps the check time and leaves the compiled list valid.
+    """
+    meta_file = cache_file.with_suffix(".meta.json")
+    meta = _load_meta(meta_file)
     max_age = src.get("cache_days", 7) * 86400
-    if cache_file.exists() and time.time() - cache_file.stat().st_mtime < max_age:
-        return cache_file.read_text("utf-8").splitlines()
-    async with aiohttp.ClientSession() as s:
-        async with s.get(src["url"]) as r:
-            txt = await r.text()
-    cache_file.write_text(txt, "utf-8")
-    return txt.splitlines()
+    if cache_file.exists():
+        if not meta.get("sha256"):
+            # cache written by an older version: adopt it
+            data = await asyncio.to_thread(cache_file.read_bytes)
+            meta["sha256"] = hashlib.sha256(data).hexdigest()
+            meta["checked"] = cache_file.stat().st_mtime
+            await safe_file_write(meta_file, json.dumps(meta))
+        if time.time() - meta.get("checked", 0) < max_age:
+            return meta["sha256"]
+
+    headers = {}
+    if cache_file.exists():
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+    try:
+        async with session.get(src["url"], headers=headers) as r:
+            if r.status == 304 and cache_file.exists():
+                data = None
+            else:
+                r.raise_for_status()
+                data = await r.read()
+            validators = {
+                "etag": r.headers.get("ETag"),
+                "last_modified": r.headers.get("Last-Modified"),
+            }
+    except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+        print(f"[Adblock] {src['url']}: {type(exc).__name__}: {exc}")
+        return meta.get("sha256", "")
+
+    if data is not None:
+        await safe_file_write(cache_file, data, mode="wb")
+        meta["sha256"] = hashlib.sha256(data).hexdigest()
+    meta["checked"] = time.time()
+    # a 304 need not repeat the validators: keep the stored ones then
+    meta.update((k, v) for k, v in validators.items() if v)
+    await safe_file_write(meta_file, json.dumps(meta))
+    return meta["sha256"]
+
+
+def _iter_hosts(cache_files: Iterable[Path]):
+    for cache in cache_files:
+        if not cache.exists():
+            continue
+        with open(cache, "r", encoding="utf-8", errors="ignore") as f:
+            for ln in f:
+                m = HOSTLINE_RE.match(ln)
+                if m:
+                    yield m.group(1).lower()
 
 
 async def update_hosts(backup_root: Path):
     """
-    Download or use cached host files, parse out hostnames,
-    merge into AD_HOSTS.
+    Refresh the AD_SOURCES caches concurrently, recompile `hosts.bin` if any
+    source changed, then map it and rebuild the host matcher.
+
+    Config `ad_hosts` stay in the in-memory AD_HOSTS set; the downloaded
+    lists are only ever read through the mapped file.
     """
-    ad_hosts = set()
-    for src in AD_SOURCES:
-        fname = "hosts_" + Path(src["url"]).stem + ".txt"
-        cache = Path(backup_root) / fname
-        lines = await _fetch_and_cache(src, cache)
-        for ln in lines:
-            m = HOSTLINE_RE.match(ln)
-            if m:
-                ad_hosts.add(m.group(1).lower())
-    AD_HOSTS.update(ad_hosts)
+    global _matcher
+    root = Path(backup_root)
+    caches = [
+        root / ("hosts_" + Path(src["url"]).stem + ".txt")
+        for src in settings.AD_SOURCES
+    ]
+    async with aiohttp.ClientSession() as s:
+        digests = await asyncio.gather(
+            *(
+                _refresh_source(s, src, c)
+                for src, c in zip(settings.AD_SOURCES, caches, strict=True)
+            )
+        )
+    signature = hashlib.sha256("\n".join(digests).encode()).digest()
+
+    if _matcher is not None:
+        _close_matcher(_matcher)
+        _matcher = None
+    blob = root / "hosts.bin"
+    hosts = HostList.open(blob, signature)
+    if hosts is None:
+        n = await asyncio.to_thread(compile_hosts, _iter_hosts(caches), blob, signature)
+        print(f"[Adblock] compiled {n} hosts → {blob.name}")
+        hosts = HostList.open(blob, signature)
+    if hosts is None:
+        print(f"[Adblock] {blob.name} unreadable: blocking only config ad_hosts")
+        _matcher = _build_matcher(settings.AD_HOSTS)
+    else:
+        _matcher = _build_matcher(_AnyOf(hosts, settings.AD_HOSTS))
+
+
+def _close_matcher(m: HostMatcher):
+    blocked = m.blocked
+    for s in getattr(blocked, "sets", (blocked,)):
+        if isinstance(s, HostList):
+            s.close()
 
 
 def is_blocked_host(host: str) -> bool:
-    return host.lower() in AD_HOSTS
+    global _matcher
+    if _matcher is None:
+        _matcher = _build_matcher(settings.AD_HOSTS)
+    return _matcher.is_blocked(host)
@@ -0,0 +1,62 @@
+"""
+Resolve the character encoding of an HTML body without decoding it.
+
+Order, as browsers do it: byte-order mark, Content-Type charset, then a
+<meta charset> / <meta http-equiv="Content-Type"> in the first 1024 bytes.
+Labels are normalised the WHATWG way (latin-1 and ascii mean windows-1252,
+a UTF-16 meta means UTF-8), and anything unknown falls back to UTF-8.
+"""
+
+from __future__ import annotations
+
+import codecs
+import re
+
+DEFAULT = "utf-8"
+PRESCAN = 1024
+
+BOMS = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+META_RE = re.compile(rb"""<meta[^>]*?charset\s*=\s*["']?\s*([\w.:-]+)""", re.I)
+HEADER_RE = re.compile(r"""charset\s*=\s*["']?\s*([\w.:-]+)""", re.I)
+# WHATWG aliases that differ from Python's codec of the same name
+ALIASES = {
+    "iso8859_1": "cp1252",
+    "ascii": "cp1252",
+    "iso8859_9": "cp1254",
+    "iso8859_11": "cp874",
+    "gb2312": "gbk",
+}
+
+
+def normalise(label: str | None) -> str | None:
+    """Python codec name for an encoding label, or None if unknown."""
+    if not label:
+        return None
+    try:
+        name = codecs.lookup(label.strip().strip("\"'")).name
+    except LookupError:
+        return None
+    name = name.replace("-", "_")
+    return ALIASES.get(name, name)
+
+
+def resolve(content_type: str | None, body: bytes) -> str:
+    """Encoding to decode `body` with (see the module docstring)."""
+    for bom, enc in BOMS:
+        if body.startswith(bom):
+            return enc
+    if content_type:
+        m = HEADER_RE.search(content_type)
+        enc = normalise(m.group(1)) if m else None
+        if enc:
+            return enc
+    m = META_RE.search(body, 0, PRESCAN)
+    if m:
+        enc = normalise(m.group(1).decode("ascii", "ignore"))
+        if enc and not enc.startswith("utf_16"):
+            return enc
+    return DEFAULT
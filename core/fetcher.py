@@ -1,25 +1,66 @@
+import asyncio
+from collections import Counter
 from typing import Optional, Tuple
 
 import aiohttp
 from aiohttp import ClientTimeout, TCPConnector
 
+from core.charset import resolve as resolve_charset
+
 # Create module-level #logger
 # logger = logging.get#logger(__name__)
 
 
+# full-body copies made of page bodies in this process: pages fetched, and
+# how many of them (and how many bytes) were decoded to str
+BODY_STATS: Counter = Counter()
+
+
+class Page:
+    """
+    A fetched HTML page: the raw `body` bytes and the `encoding` they are in.
+    text() decodes on first use only, so a page that is just saved or found
+    unchanged is never decoded.
+    """
+
+    __slots__ = ("status", "body", "encoding", "url", "_text")
+
+    def __init__(self, status: int, body: bytes | None, encoding: str, url: str):
+        self.status = status
+        self.body = body
+        self.encoding = encoding
+        self.url = url  # final URL, after redirects
+        self._text: str | None = None
+        if body is not None:
+            BODY_STATS["pages"] += 1
+            BODY_STATS["bytes"] += len(body)
+
+    def text(self) -> str | None:
+        if self._text is None and self.body is not None:
+            self._text = self.body.decode(self.encoding, "replace")
+            BODY_STATS["decodes"] += 1
+            BODY_STATS["decoded_bytes"] += len(self.body)
+        return self._text
+
+
 class Fetcher:
     """
     Re-usable aiohttp session with adaptive throttle-awareness and cookies.
     Methods:
+      fetch_page(url, allow_redirects=True) -> Page (bytes + encoding)
       fetch_text(url, allow_redirects=True) -> (status, text|None, final_url)
-      fetch_bytes(url)                     -> (status, bytes|None)
+      fetch_bytes(url, max_bytes=None)     -> (status, bytes|None)
+      head(url)                            -> (status, {length, ranges, etag})
+      fetch_range(url, fh, start, end)     -> (status, bytes written)
       close()                              -> closes session
+    Successful fetches are charged to `budget` (a CrawlBudget) when given.
     """
 
-    def __init__(self, cfg, throttle, cookies: dict):
+    def __init__(self, cfg, throttle, cookies: dict, budget=None):
         self.cfg = cfg
         self.throttle = throttle
         self.cookies = cookies
+        self.budget = budget
         self.session: Optional[aiohttp.ClientSession] = None
         # logger.info(f"Fetcher initialized with cookies: {list(cookies.keys())}")
         # logger.info(f"User-Agent available: {hasattr(cfg, 'USER_AGENT')}")
@@ -46,56 +87,35 @@ class Fetcher:
             # for cookie in self.session.cookie_jar:
             # logger.debug("  %s = %s", cookie.key, cookie.value)
 
-    async def fetch_text(
-        self, url: str, allow_redirects: bool = True
-    ) -> Tuple[int, Optional[str], str]:
+    async def fetch_page(self, url: str, allow_redirects: bool = True) -> Page:
         """
-        Fetch text content from URL. Returns (status, text, final_url).
+        Fetch an HTML page as bytes, with its encoding resolved from the
+        headers / meta tag but the body left undecoded (see Page).
         """
         await self._ensure_session()
-
-        # logger.info(f"→ [FETCH-TEXT] {url}")
-        # logger.debug(f"Request headers: {dict(self.session.headers)}")
-        # logger.debug("Request cookies:")
-        # for cookie in self.session.cookie_jar:
-        # logger.debug("  %s = %s", cookie.key, cookie.value)
-
-        # logger.debug(f"Allow redirects: {allow_redirects}")
-
         await self.throttle.before_request()
 
         status = 500  # Default error status
-        text = None
+        body = None
         final = url
+        content_type = None
 
         try:
             async with self.session.get(url, allow_redirects=allow_redirects) as resp:
                 status = resp.status
                 final = str(resp.url)
-
-                # logger.info(f"Response: {status} {resp.reason} for {url}")
-                # logger.debug(f"Final URL: {final}")
-                # logger.debug(f"Response headers: {dict(resp.headers)}")
-
                 if status == 200:
-                    text = await resp.text(errors="ignore")
-                    # print(f"Response text length: {len(text) if text else 0}")
-                    # if text and len(text) < 500:  # Log short responses completely
-                    # print(f"Response body: {text}")
-                    # elif text:
-                    # print(f"Response body preview: {text[:200]}...")
+                    body = await resp.read()
+                    content_type = resp.headers.get("Content-Type")
+                    if self.budget is not None:
+                        self.budget.charge_page(len(body))
                 else:
-                    # For non-200 responses, try to get error details
-                    error_text = await resp.text(errors="ignore")
                     print(f"HTTP {status} error for {url}")
-                    # print(f"Error response headers: {dict(resp.headers)}")
-                    # if error_text:
-                    # print(f"Error response body: {error_text[:1000]}")
 
         except aiohttp.ClientError as exc:
             print(f"aiohttp ClientError for {url}: {type(exc).__name__}: {exc}")
             print(f"Exception details: {exc}")
-            status, text, final = 500, None, url
+            status, body, final = 500, None, url
 
         except Exception as exc:
             print(f"Unexpected error fetching {url}: {type(exc).__name__}: {exc}")
@@ -103,17 +123,30 @@ class Fetcher:
             import traceback
 
             print(f"Traceback: {traceback.format_exc()}")
-            status, text, final = 500, None, url
+            status, body, final = 500, None, url
 
         finally:
             self.throttle.after_response(status)
-            # logger.debug(f"Request completed: {url} -> {status}")
 
-        return status, text, final
+        encoding = resolve_charset(content_type, body) if body else "utf-8"
+        return Page(status, body, encoding, final)
 
-    async def fetch_bytes(self, url: str) -> Tuple[int, Optional[bytes]]:
+    async def fetch_text(
+        self, url: str, allow_redirects: bool = True
+    ) -> Tuple[int, Optional[str], str]:
+        """
+        Fetch text content from URL. Returns (status, text, final_url).
+        """
+        page = await self.fetch_page(url, allow_redirects)
+        return page.status, page.text(), page.url
+
+    async def fetch_bytes(
+        self, url: str, max_bytes: Optional[int] = None
+    ) -> Tuple[int, Optional[bytes]]:
         """
         Fetch binary content. Returns (status, data).
+        With `max_bytes`, a body announced (Content-Length) or found to be
+        larger is not transferred: the status is 413.
         """
         await self._ensure_session()
 
@@ -129,7 +162,21 @@ class Fetcher:
                 # logger.info(f"Binary response: {status} {resp.reason} for {url}")
 
                 if status == 200:
-                    data = await resp.read()
+                    if max_bytes is not None and (resp.content_length or 0) > max_bytes:
+                        return 413, None
+                    if max_bytes is None:
+                        data = await resp.read()
+                    else:
+                        # read() with a size returns only what is buffered:
+                        # collect chunks until EOF, stopping past the cap
+                        buf = bytearray()
+                        async for chunk in resp.content.iter_chunked(1 << 16):
+                            buf += chunk
+                            if len(buf) > max_bytes:
+                                return 413, None
+                        data = bytes(buf)
+                    if self.budget is not None:
+                        self.budget.charge_asset(len(data))
                     # logger.debug(f"Binary data length: {len(data) if data else 0}")
                 else:
                     print(f"HTTP {status} error for binary fetch: {url}")
@@ -147,6 +194,75 @@ class Fetcher:
 
         return status, data
 
+    async def head(self, url: str) -> Tuple[int, dict]:
+        """
+        HEAD pre-flight. Returns (status, info) with info["length"] (None if
+        unknown), info["ranges"] (byte ranges supported) and info["etag"].
+        """
+        await self._ensure_session()
+        await self.throttle.before_request()
+        status, info = 500, {"length": None, "ranges": False, "etag": None}
+        try:
+            async with self.session.head(url, allow_redirects=True) as resp:
+                status = resp.status
+                h = resp.headers
+                info = {
+                    "length": resp.content_length,
+                    "ranges": h.get("Accept-Ranges", "").lower() == "bytes",
+                    "etag": h.get("ETag") or h.get("Last-Modified"),
+                }
+        except Exception as exc:
+            print(f"Error in HEAD {url}: {type(exc).__name__}: {exc}")
+            status = 500
+        finally:
+            self.throttle.after_response(status)
+        return status, info
+
+    async def fetch_range(
+        self,
+        url: str,
+        fh,
+        start: int,
+        end: Optional[int] = None,
+        if_range: Optional[str] = None,
+        on_chunk=None,
+        chunk_size: int = 256 * 1024,
+    ) -> Tuple[int, int]:
+        """
+        Stream bytes `start`..`end` (inclusive, None = to the end) of `url`
+        into the open binary file `fh` at the same offset. A 200 reply (the
+        server ignored the range, or the file changed under If-Range) is
+        written from offset 0. `on_chunk(n)` is called after every chunk of
+        a 206 reply. Returns (status, bytes written); a dropped connection
+        returns the reply's status and what was written so far.
+        """
+        await self._ensure_session()
+        await self.throttle.before_request()
+        rng = f"bytes={start}-" + ("" if end is None else str(end))
+        headers = {"Range": rng}
+        if if_range:
+            headers["If-Range"] = if_range
+        status, written = 500, 0
+        try:
+            # no total timeout: large bodies take as long as they take
+            timeout = ClientTimeout(total=None, sock_connect=30, sock_read=60)
+            async with self.session.get(url, headers=headers, timeout=timeout) as resp:
+                status = resp.status
+                if status not in (200, 206):
+                    print(f"HTTP {status} error for range fetch: {url}")
+                    return status, 0
+                fh.seek(start if status == 206 else 0)
+                async for chunk in resp.content.iter_chunked(chunk_size):
+                    fh.write(chunk)
+                    written += len(chunk)
+                    if on_chunk is not None and status == 206:
+                        on_chunk(len(chunk))
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+            print(f"Range fetch {url} interrupted at +{written}: {exc}")
+        finally:
+            self.throttle.after_response(status)
+        return status, written
+
     async def close(self):
         """Close the aiohttp session."""
         if self.session and not self.session.closed:
@@ -0,0 +1,122 @@
+"""
+Compiled, memory-mapped ad host list.
+
+File layout (little-endian):
+    header   MAGIC(8) | signature(32) | count(u32)
+    offsets  (count + 1) × u32, relative to the start of the data block
+    data     sorted, de-duplicated ASCII host names, concatenated
+Lookups binary-search the offsets table directly in the mapping, so opening
+the list costs one mmap regardless of its size.
+"""
+
+from __future__ import annotations
+
+import mmap
+import os
+import struct
+import tempfile
+from pathlib import Path
+from typing import Iterable
+
+MAGIC = b"FMHOSTS1"
+HEADER = struct.Struct("<8s32sI")
+OFFSET = struct.Struct("<I")
+
+
+def _key(host: str) -> bytes | None:
+    try:
+        return host.encode("ascii")
+    except UnicodeEncodeError:
+        try:
+            return host.encode("idna")
+        except UnicodeError:
+            return None
+
+
+def compile_hosts(hosts: Iterable[str], out: Path, signature: bytes) -> int:
+    """
+    Write `hosts` to `out` in the binary format above; returns the entry count.
+    """
+    names = sorted({k for k in map(_key, hosts) if k})
+    offsets = [0]
+    for n in names:
+        offsets.append(offsets[-1] + len(n))
+    out = Path(out)
+    fd, tmp = tempfile.mkstemp(dir=out.parent, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(HEADER.pack(MAGIC, signature, len(names)))
+        f.write(struct.pack(f"<{len(offsets)}I", *offsets))
+        f.write(b"".join(names))
+    os.replace(tmp, out)
+    return len(names)
+
+
+def read_signature(path: Path) -> bytes | None:
+    """The signature `path` was compiled from, None if it is not a host list."""
+    try:
+        with open(path, "rb") as f:
+            magic, signature, _ = HEADER.unpack(f.read(HEADER.size))
+    except (OSError, struct.error):
+        return None
+    return signature if magic == MAGIC else None
+
+
+class HostList:
+    """
+    Read-only view over a compiled host list; supports `in` and `len()`.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._fh = open(self.path, "rb")
+        self._mm = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.signature, self._count = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"not a compiled host list: {path}")
+        self._offs = HEADER.size
+        self._data = self._offs + (self._count + 1) * OFFSET.size
+
+    @classmethod
+    def open(cls, path: Path, signature: bytes) -> HostList | None:
+        """
+        Map `path` if it exists and was compiled from `signature`, else None.
+        """
+        try:
+            hl = cls(path)
+        except (OSError, ValueError, struct.error):
+            return None
+        if hl.signature != signature:
+            hl.close()
+            return None
+        return hl
+
+    def _entry(self, i: int) -> bytes:
+        start, end = struct.unpack_from("<2I", self._mm, self._offs + i * OFFSET.size)
+        return self._mm[self._data + start : self._data + end]
+
+    def __contains__(self, host: object) -> bool:
+        if not isinstance(host, str):
+            return False
+        key = _key(host)
+        if not key:
+            return False
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            cur = self._entry(mid)
+            if cur == key:
+                return True
+            if cur < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return False
+
+    def __len__(self) -> int:
+        return self._count
+
+    def close(self):
+        if not self._mm.closed:
+            self._mm.close()
+        self._fh.close()
@@ -1,9 +1,48 @@
+import hashlib
+import os
+import re
 from pathlib import Path
 from urllib.parse import urlparse
 
 from slugify import slugify
 
-from config.settings import BACKUP_ROOT, FOLDER_MAPPING, SLUG_MAX_LEN
+import config.settings as settings
+
+ID_RE = re.compile(r"^[a-z]+(\d+)")  # t1234-slug -> 1234
+DUP_RE = re.compile(r"-dup\d+$")
+
+
+def shard_dirs(filename: str) -> list[str]:
+    """
+    Subfolders for a page file under settings.SHARDING: by the numeric id
+    (t1234-slug.html -> ["12", "34"]; its last levels*width digits), or by
+    hash for names without one. [] when the layout is flat. Collision
+    suffixes are ignored, so t1-x-dup1.html sits next to t1-x.html.
+    """
+    opts = settings.SHARDING or {}
+    mode = opts.get("mode") or "none"
+    if mode == "none":
+        return []
+    levels = max(1, int(opts.get("levels", 2)))
+    width = max(1, int(opts.get("width", 2)))
+    stem = DUP_RE.sub("", filename.rsplit(".", 1)[0])
+    m = ID_RE.match(stem) if mode == "id" else None
+    if m:
+        key = m.group(1).zfill(levels * width)[-levels * width :]
+    else:
+        key = hashlib.md5(stem.encode("utf-8")).hexdigest()
+    return [key[i * width : (i + 1) * width] for i in range(levels)]
+
+
+def shard_rel(rel: str) -> str:
+    """
+    Where the page at REL `rel` (in any layout) goes in the current one.
+    Top-level files and legacy absolute RELs stay where they are.
+    """
+    if os.path.isabs(rel) or "/" not in rel:
+        return rel
+    folder, name = rel.split("/", 1)[0], rel.rsplit("/", 1)[1]
+    return "/".join([folder, *shard_dirs(name), name])
 
 
 def url_to_local_path(url: str) -> str:
@@ -12,16 +51,17 @@ def url_to_local_path(url: str) -> str:
     - lowercase
     - slugify each segment (max SLUG_MAX_LEN)
     - choose folder via FOLDER_MAPPING, fallback to 'misc'
+    - subfolders per the SHARDING layout (see shard_dirs)
     - on name collision append -dupN
     """
     parsed = urlparse(url)
     route = parsed.path.lstrip("/").lower()
     if not route:
-        return str((Path(BACKUP_ROOT) / "index.html").resolve())
+        return str((Path(settings.BACKUP_ROOT) / "index.html").resolve())
 
     # slugify segments
     segments = route.split("/")
-    slugged = [slugify(seg, max_length=SLUG_MAX_LEN) for seg in segments]
+    slugged = [slugify(seg, max_length=settings.SLUG_MAX_LEN) for seg in segments]
     slug = "_".join(slugged)
     if parsed.query:
         q = parsed.query.replace("=", "-").replace("&", "_")
@@ -29,11 +69,11 @@ def url_to_local_path(url: str) -> str:
 
     # choose folder
     key = segments[0]
-    folder = FOLDER_MAPPING.get(key[0] if key else "", "misc")
-    out_dir = Path(BACKUP_ROOT) / folder
+    folder = settings.FOLDER_MAPPING.get(key[0] if key else "", "misc")
+    filename = slug + ".html"
+    out_dir = Path(settings.BACKUP_ROOT, folder, *shard_dirs(filename))
     out_dir.mkdir(parents=True, exist_ok=True)
 
-    filename = slug + ".html"
     path = out_dir / filename
     # handle collisions
     dup = 1
@@ -41,3 +81,37 @@ def url_to_local_path(url: str) -> str:
         path = out_dir / f"{slug}-dup{dup}.html"
         dup += 1
     return str(path)
+
+
+def local_rel_path(url: str) -> str:
+    """
+    url_to_local_path() relative to BACKUP_ROOT, with "/" separators.
+    This is what State stores as REL, so records do not depend on where the
+    backup folder (or a remote worker's scratch folder) lives.
+    """
+    full = os.path.realpath(url_to_local_path(url))
+    root = os.path.realpath(settings.BACKUP_ROOT)
+    return os.path.relpath(full, root).replace(os.sep, "/")
+
+
+def is_output_rel(rel: str) -> bool:
+    """
+    True if `rel` (BACKUP_ROOT-relative, "/" separators) is part of the
+    mirror's output: index.html, the FOLDER_MAPPING folders, misc/ or
+    assets/. Crawl state, settings, cookies, caches and the asset content
+    store (assets/objects) are not.
+    """
+    head, sep, rest = rel.partition("/")
+    if not sep:
+        return rel == "index.html"
+    if head == "assets":
+        return not rest.startswith("objects/")
+    return head in {"misc", *settings.FOLDER_MAPPING.values()}
+
+
+def rel_to_abs(rel: str) -> str:
+    """
+    Absolute output path for a State REL. Records written before REL became
+    relative hold absolute paths, which pass through unchanged.
+    """
+    return os.path.join(settings.BACKUP_ROOT, rel)
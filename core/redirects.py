@@ -1,7 +1,7 @@
 import asyncio
 import json
 import os
-from typing import Dict
+from typing import Callable, Dict, List
 
 
 class RedirectMap:
@@ -13,6 +13,8 @@ class RedirectMap:
     def __init__(self, filename: str = "redirects.json"):
         self.path = os.path.join(os.getcwd(), filename)
         self.map: Dict[str, str] = {}
+        # called with (src, dst) for every new entry (remote workers)
+        self.listeners: List[Callable[[str, str], None]] = []
         self._lock = asyncio.Lock()
         self._load()
 
@@ -31,12 +33,24 @@ class RedirectMap:
         async with self._lock:
             self.map[src] = dst
             await asyncio.to_thread(self._persist)
+        for fn in self.listeners:
+            fn(src, dst)
 
     def _persist(self):
         os.makedirs(os.path.dirname(self.path), exist_ok=True)
         with open(self.path, "w", encoding="utf-8") as f:
             json.dump(self.map, f, ensure_ascii=False, indent=2, sort_keys=True)
 
+    def merge_file(self, path: str):
+        """Add the entries of another redirects file (e.g. a shard's)."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (json.JSONDecodeError, IOError):
+            return
+        if isinstance(data, dict):
+            self.map.update(data)
+
     def resolve(self, path: str) -> str:
         visited = set()
         cur = path
@@ -0,0 +1,254 @@
+"""
+SQLite-backed crawl store shared by several processes.
+
+Used by the multi-process mode: the coordinator copies the JSON `State` into
+`crawl_state.sqlite`, worker processes crawl against it concurrently (WAL
+mode, leased claims per hash shard), and the coordinator copies the result
+back to the JSON files when all workers have exited.
+
+`SharedState` exposes the same methods the workers, rewriters and
+AssetManager use on `State`.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+import time
+import zlib
+
+from core.state import State
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS urls (
+    path    TEXT PRIMARY KEY,
+    rel     TEXT NOT NULL,
+    redir   INTEGER NOT NULL DEFAULT 0,
+    sta     TEXT NOT NULL,
+    retry   INTEGER NOT NULL DEFAULT 0,
+    err     TEXT NOT NULL DEFAULT '',
+    shard   INTEGER NOT NULL,
+    owner   TEXT,
+    expires REAL
+);
+CREATE INDEX IF NOT EXISTS urls_claim ON urls (shard, sta);
+CREATE INDEX IF NOT EXISTS urls_sta ON urls (sta);
+CREATE TABLE IF NOT EXISTS assets (url TEXT PRIMARY KEY, rel TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS stopped (
+    shard INTEGER NOT NULL,
+    phase TEXT NOT NULL,
+    PRIMARY KEY (shard, phase)
+);
+"""
+
+
+def shard_of(path: str, nshards: int) -> int:
+    """Stable hash partition of the URL space (same in every process)."""
+    return zlib.crc32(path.encode("utf-8")) % nshards if nshards > 1 else 0
+
+
+class _UrlView:
+    """Read-only mapping view of the urls table: path -> compact record."""
+
+    def __init__(self, db: sqlite3.Connection):
+        self._db = db
+
+    def get(self, path: str, default=None):
+        row = self._db.execute(
+            "SELECT rel, redir, sta, retry, err FROM urls WHERE path=?", (path,)
+        ).fetchone()
+        return list(row) if row else default
+
+    def __getitem__(self, path: str) -> list:
+        rec = self.get(path)
+        if rec is None:
+            raise KeyError(path)
+        return rec
+
+    def __contains__(self, path: object) -> bool:
+        return self.get(path) is not None
+
+    def __len__(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM urls").fetchone()[0]
+
+    def items(self):
+        cur = self._db.execute("SELECT path, rel, redir, sta, retry, err FROM urls")
+        for path, *rec in cur:
+            yield path, rec
+
+
+class SharedState:
+    """
+    Process-safe crawl store. Every write is its own short transaction;
+    claims use BEGIN IMMEDIATE so two processes never lease the same URL.
+    """
+
+    def __init__(self, cfg, db_path: str, nshards: int = 1):
+        self.cfg = cfg
+        self.db_path = db_path
+        self.nshards = nshards
+        self.recovered: list[str] = []
+        self._db = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self.urls = _UrlView(self._db)
+
+    # ----- JSON State <-> SQLite -----
+    @classmethod
+    def from_state(cls, state: State, db_path: str, nshards: int) -> SharedState:
+        """
+        (Re)build the shared store from a loaded JSON State. Leases are not
+        copied: the processes that held them are gone.
+        """
+        shared = cls(state.cfg, db_path, nshards)
+        db = shared._db
+        db.execute("BEGIN")
+        db.execute("DELETE FROM urls")
+        db.execute("DELETE FROM assets")
+        db.execute("DELETE FROM stopped")
+        db.executemany(
+            "INSERT INTO urls (path, rel, redir, sta, retry, err, shard)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                (path, *rec[:5], shard_of(path, nshards))
+                for path, rec in state.urls.items()
+            ),
+        )
+        db.executemany("INSERT INTO assets VALUES (?, ?)", state.assets.items())
+        db.execute("COMMIT")
+        return shared
+
+    def to_state(self, state: State):
+        """Copy every record back into the JSON State (save() it afterwards)."""
+        state.urls = dict(self.urls.items())
+        state.assets = dict(self._db.execute("SELECT url, rel FROM assets"))
+        state.leases = {}
+        state._index()
+
+    def close(self):
+        self._db.close()
+
+    # ----- State-compatible API -----
+    async def save(self):
+        # autocommit: every write is already durable
+        return None
+
+    def add_url(self, path: str, rel: str):
+        self._db.execute(
+            "INSERT OR IGNORE INTO urls (path, rel, sta, shard) VALUES (?, ?, 'l', ?)",
+            (path, rel, shard_of(path, self.nshards)),
+        )
+
+    def _set_status(self, path: str, sta: str):
+        self._db.execute("UPDATE urls SET sta=? WHERE path=?", (sta, path))
+
+    def mark_discovered(self, path: str):
+        self._set_status(path, "d")
+
+    def mark_downloaded(self, path: str):
+        self._set_status(path, "p")
+
+    def mark_redirect_source(self, path: str):
+        self._db.execute("UPDATE urls SET redir=1, sta='e' WHERE path=?", (path,))
+
+    def update_after_fetch(self, path: str, success: bool, err: str = ""):
+        if success:
+            self._set_status(path, "d")
+            return
+        self._db.execute(
+            "UPDATE urls SET retry=retry+1, err=?,"
+            " sta=CASE WHEN retry+1 < ? THEN 'l' ELSE 'e' END WHERE path=?",
+            (err, self.cfg.retry_limit, path),
+        )
+
+    def pending_count(self) -> int:
+        return self.count_status("l") + self.count_status("d")
+
+    def count_status(self, sta: str) -> int:
+        return self._db.execute(
+            "SELECT COUNT(*) FROM urls WHERE sta=?", (sta,)
+        ).fetchone()[0]
+
+    def count_open(self, sta: str, phase: str) -> int:
+        """
+        URLs in `sta` that some process will still work on, i.e. not in a
+        shard that stopped `phase` early (budget spent, worker gone).
+        """
+        return self._db.execute(
+            "SELECT COUNT(*) FROM urls WHERE sta=? AND shard NOT IN"
+            " (SELECT shard FROM stopped WHERE phase=?)",
+            (sta, phase),
+        ).fetchone()[0]
+
+    def mark_stopped(self, shard: int, phase: str):
+        self._db.execute("INSERT OR IGNORE INTO stopped VALUES (?, ?)", (shard, phase))
+
+    def paths_with_status(self, sta: str) -> list[str]:
+        return [
+            r[0] for r in self._db.execute("SELECT path FROM urls WHERE sta=?", (sta,))
+        ]
+
+    # ----- leases -----
+    def claim(
+        self, shard: int, sta: str, owner: str, ttl: float, limit: int
+    ) -> list[str]:
+        """
+        Lease up to `limit` URLs of `shard` in status `sta` that are not
+        leased, or whose lease expired.
+        """
+        now = time.time()
+        db = self._db
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            rows = db.execute(
+                "SELECT path FROM urls WHERE shard=? AND sta=?"
+                " AND (owner IS NULL OR expires <= ?) LIMIT ?",
+                (shard, sta, now, limit),
+            ).fetchall()
+            paths = [r[0] for r in rows]
+            db.executemany(
+                "UPDATE urls SET owner=?, expires=? WHERE path=?",
+                ((owner, now + ttl, p) for p in paths),
+            )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return paths
+
+    def lease(self, path: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        cur = self._db.execute(
+            "UPDATE urls SET owner=?, expires=? WHERE path=?"
+            " AND (owner IS NULL OR owner=? OR expires <= ?)",
+            (owner, now + ttl, path, owner, now),
+        )
+        return cur.rowcount == 1
+
+    def release(self, path: str, owner: str | None = None):
+        if owner is None:
+            self._db.execute(
+                "UPDATE urls SET owner=NULL, expires=NULL WHERE path=?", (path,)
+            )
+        else:
+            self._db.execute(
+                "UPDATE urls SET owner=NULL, expires=NULL WHERE path=? AND owner=?",
+                (path, owner),
+            )
+
+    def reap_expired(self) -> list[str]:
+        # expired leases are reclaimed by claim() itself
+        return []
+
+    def release_owner(self, owner: str):
+        self._db.execute(
+            "UPDATE urls SET owner=NULL, expires=NULL WHERE owner=?", (owner,)
+        )
+
+    # ----- asset cache ops -----
+    def get_asset(self, url: str) -> str | None:
+        row = self._db.execute("SELECT rel FROM assets WHERE url=?", (url,)).fetchone()
+        return row[0] if row else None
+
+    def add_asset(self, url: str, rel: str):
+        self._db.execute("INSERT OR REPLACE INTO assets VALUES (?, ?)", (url, rel))
@@ -2,6 +2,8 @@ import asyncio
 import json
 import os
 import tempfile
+import time
+from typing import Callable
 
 # record indices
 REL, REDIR, STA, RETRY, ERR = 0, 1, 2, 3, 4
@@ -13,16 +15,31 @@ class State:
     Manages two JSON stores:
       - crawl_state.json: mapping URL->compact record
       - assets_cache.json: mapping assetURL->relPath
+    plus crawl_state_leases.json, the URLs being worked on at the last save.
     Thread-safe via asyncio.Lock.
+
+    Claims are leases (owner, expiry): a URL's status only changes once its
+    work is done, so a crash leaves it in its input status, and the lease file
+    tells the next run which URLs were in flight.
     """
 
     def __init__(self, cfg, state_path: str, cache_path: str):
         self.cfg = cfg
         self.state_path = state_path
         self.cache_path = cache_path
+        self.lease_path = os.path.splitext(state_path)[0] + "_leases.json"
         self.urls: dict[str, list] = {}
         self.assets: dict[str, str] = {}
+        # path -> [owner, expires_at (epoch seconds)]
+        self.leases: dict[str, list] = {}
+        # leases left behind by an interrupted run, re-examined on resume
+        self.recovered: list[str] = []
         self._lock = asyncio.Lock()
+        self._dirty = False
+        # status -> callbacks fired when a URL enters that status
+        self._watchers: dict[str, list[Callable[[str], None]]] = {}
+        # status -> insertion-ordered set of paths
+        self._by_status: dict[str, dict[str, None]] = {}
 
     async def load(self):
         # load URLs
@@ -33,6 +50,15 @@ class State:
             self.urls = {}
         if not os.path.exists(self.state_path):
             await self.save()
+        self._index()
+        # leases of the previous run: its workers are gone, so all are stale
+        try:
+            with open(self.lease_path, "r", encoding="utf-8") as f:
+                stale = json.load(f)
+        except (json.JSONDecodeError, IOError):
+            stale = {}
+        self.recovered = [p for p in stale if p in self.urls]
+        self.leases = {}
         # load assets
         try:
             with open(self.cache_path, "r", encoding="utf-8") as f:
@@ -42,7 +68,13 @@ class State:
         if not os.path.exists(self.state_path):
             await self.save()
 
+    def _index(self):
+        self._by_status = {}
+        for path, rec in self.urls.items():
+            self._by_status.setdefault(rec[STA], {})[path] = None
+
     async def save(self):
+        self._dirty = False
         async with self._lock:
             # atomic write of state
             fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.state_path))
@@ -54,56 +86,123 @@ class State:
             with os.fdopen(fd2, "w", encoding="utf-8") as f2:
                 json.dump(self.assets, f2, separators=(",", ":"))
             os.replace(tmp2, self.cache_path)
+            # in-flight set
+            fd3, tmp3 = tempfile.mkstemp(dir=os.path.dirname(self.lease_path))
+            with os.fdopen(fd3, "w", encoding="utf-8") as f3:
+                json.dump(self.leases, f3, separators=(",", ":"))
+            os.replace(tmp3, self.lease_path)
+
+    async def autosave(self, interval: float = 5.0):
+        """
+        Persist every `interval` seconds while there are unsaved changes.
+        Run as a background task; cancel it and call save() to flush.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            if self._dirty:
+                await self.save()
+
+    # ----- leases -----
+    def lease(self, path: str, owner: str, ttl: float) -> bool:
+        """
+        Claim `path` for `owner` for `ttl` seconds. Fails if another owner
+        holds a live lease.
+        """
+        now = time.time()
+        cur = self.leases.get(path)
+        if cur and cur[0] != owner and cur[1] > now:
+            return False
+        self.leases[path] = [owner, now + ttl]
+        self._dirty = True
+        return True
+
+    def release(self, path: str, owner: str | None = None):
+        cur = self.leases.get(path)
+        if cur and (owner is None or cur[0] == owner):
+            del self.leases[path]
+            self._dirty = True
+
+    def release_all(self):
+        if self.leases:
+            self.leases.clear()
+            self._dirty = True
+
+    def reap_expired(self) -> list[str]:
+        """
+        Drop expired leases and re-announce their URLs to the watchers of
+        their (unchanged) status, so a work queue picks them up again.
+        """
+        now = time.time()
+        expired = [p for p, (_, exp) in self.leases.items() if exp <= now]
+        for path in expired:
+            del self.leases[path]
+            sta = self.urls[path][STA]
+            for fn in self._watchers.get(sta, ()):
+                fn(path)
+        if expired:
+            self._dirty = True
+        return expired
+
+    # ----- status watchers -----
+    def watch(self, status: str, fn: Callable[[str], None]):
+        """
+        Call fn(path) whenever a URL enters `status` (used by work queues).
+        """
+        self._watchers.setdefault(status, []).append(fn)
+
+    def unwatch(self, status: str, fn: Callable[[str], None]):
+        fns = self._watchers.get(status, [])
+        if fn in fns:
+            fns.remove(fn)
+
+    def _set_status(self, path: str, sta: str):
+        rec = self.urls[path]
+        self._by_status.get(rec[STA], {}).pop(path, None)
+        rec[STA] = sta
+        self._by_status.setdefault(sta, {})[path] = None
+        self._dirty = True
+        for fn in self._watchers.get(sta, ()):
+            fn(path)
+
+    def paths_with_status(self, sta: str) -> list[str]:
+        return list(self._by_status.get(sta, ()))
+
+    def iter_status(self, sta: str):
+        """Paths in `sta`, oldest first, without copying the index."""
+        return iter(self._by_status.get(sta, ()))
+
+    def count_status(self, sta: str) -> int:
+        return len(self._by_status.get(sta, ()))
 
     # ----- URL queue operations -----
     def add_url(self, path: str, rel: str):
         if path in self.urls:
             return
         self.urls[path] = [rel, 0, "l", 0, ""]
-        import asyncio
-
-        asyncio.create_task(self.save())
-
-    async def get_next(self, phase: str) -> str | None:
-        """
-        Reserva e devolve uma URL:
-          - discover → 'l' → muda para 'd'
-          - download  → 'd' → muda para 'p'
-        """
-        want = "l" if phase == "discover" else "d"
-        async with self._lock:
-            for path, rec in self.urls.items():
-                if rec[STA] == want:
-                    # reserva imediatamente
-                    rec[STA] = "d" if phase == "discover" else "p"
-                    await self.save()
-                    return path
-        return None
+        self._set_status(path, "l")
 
     def pending_count(self) -> int:
-        return sum(1 for v in self.urls.values() if v[STA] in ("l", "d"))
+        return len(self._by_status.get("l", ())) + len(self._by_status.get("d", ()))
 
     def mark_discovered(self, path: str):
-        rec = self.urls[path]
-        rec[STA] = "d"
+        self._set_status(path, "d")
 
     def mark_downloaded(self, path: str):
-        rec = self.urls[path]
-        rec[STA] = "p"
+        self._set_status(path, "p")
 
     def mark_redirect_source(self, path: str):
         rec = self.urls[path]
         rec[REDIR] = 1
-        rec[STA] = "e"
+        self._set_status(path, "e")
 
     def update_after_fetch(self, path: str, success: bool, err: str = ""):
         rec = self.urls[path]
         if success:
-            rec[STA] = "d"
+            self._set_status(path, "d")
         else:
             rec[RETRY] += 1
             rec[ERR] = err
-            rec[STA] = "l" if rec[RETRY] < self.cfg.retry_limit else "e"
+            self._set_status(path, "l" if rec[RETRY] < self.cfg.retry_limit else "e")
 
     # ----- asset cache ops -----
     def get_asset(self, url: str) -> str | None:
@@ -111,3 +210,4 @@ class State:
 
     def add_asset(self, url: str, rel: str):
         self.assets[url] = rel
+        self._dirty = True
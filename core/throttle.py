@@ -1,4 +1,28 @@
 import asyncio
+import time
+
+
+class GlobalRateLimiter:
+    """
+    Cross-process request pacing: at most `rate` requests per second in
+    total. The next free slot time lives in shared memory, so the coordinator
+    creates one instance and hands it to every worker process.
+    """
+
+    def __init__(self, ctx, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = ctx.Value("d", 0.0, lock=False)
+        self._lock = ctx.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.time()
+            slot = max(now, self._next.value)
+            self._next.value = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
 
 
 class ThrottleController:
@@ -8,11 +32,12 @@ class ThrottleController:
       - min/max_delay: clamp
       - workers: current parallel worker count
     API:
-      before_request()  -> async sleep(current delay)
+      before_request()  -> async sleep(current delay), then wait for the
+                           shared `limiter` slot when one is attached
       after_response(status) -> adjust delay/workers
     """
 
-    def __init__(self, cfg):
+    def __init__(self, cfg, limiter: GlobalRateLimiter | None = None):
         self.cfg = cfg
         self.delay = cfg.base_delay
         self.min = cfg.min_delay
@@ -20,9 +45,12 @@ class ThrottleController:
         self.workers = cfg.workers
         self._success_count = 0
         self._rtt = self.delay
+        self.limiter = limiter
 
     async def before_request(self):
         await asyncio.sleep(self.delay)
+        if self.limiter is not None:
+            await self.limiter.wait()
 
     def after_response(self, status: int):
         # measure rough RTT adaptation
@@ -0,0 +1,129 @@
+"""
+Compiled URL filter shared by the discoverer and both rewriters.
+
+Built once by `config.settings.init` from `ignored_prefixes`,
+`blacklist_params` and `tracker_patterns`; callers only use `classify()`.
+"""
+
+from __future__ import annotations
+
+import re
+from functools import lru_cache
+from typing import Iterable, NamedTuple
+from urllib.parse import unquote_plus, urljoin, urlsplit
+
+# verdict kinds
+SKIP = "skip"  # mailto:, javascript:, data:, bare fragments
+TRACKER = "tracker"  # matches one of TRACKER_PATTERNS
+EXTERNAL = "external"  # other host
+IGNORED = "ignored"  # internal, path under an ignored prefix
+BLACKLISTED = "blacklisted"  # internal, carries a blacklisted query param
+INTERNAL = "internal"  # internal and crawlable
+
+SKIP_SCHEMES = ("mailto:", "javascript:", "data:", "#")
+_END = ""  # terminal marker inside the prefix trie
+
+
+class Verdict(NamedTuple):
+    kind: str
+    url: str  # absolute URL without fragment ("" for SKIP)
+    key: str  # path+query for internal URLs, "" otherwise
+    fragment: str
+
+
+_SKIPPED = Verdict(SKIP, "", "", "")
+
+
+def _build_trie(prefixes: Iterable[str]) -> dict:
+    root: dict = {}
+    for pref in prefixes:
+        node = root
+        for ch in pref:
+            node = node.setdefault(ch, {})
+        node[_END] = True
+    return root
+
+
+def _build_tracker_re(patterns: Iterable[str]):
+    pats = [p for p in patterns if p]
+    if not pats:
+        return None
+    return re.compile("|".join(f"(?:{p})" for p in pats), re.IGNORECASE)
+
+
+class UrlFilter:
+    """
+    Classify hrefs against the forum's crawl rules.
+
+    - ignored prefixes: character trie, one walk per path
+    - blacklisted params: frozenset lookup per query key
+    - tracker patterns: one combined regex over the absolute URL
+    Results are memoised per (href, base) since forum pages repeat the same
+    navigation links on every page.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        ignored_prefixes: Iterable[str] = (),
+        blacklist_params: Iterable[str] = (),
+        tracker_patterns: Iterable[str] = (),
+        cache_size: int = 65536,
+    ):
+        self.base_url = base_url
+        self.base_domain = urlsplit(base_url).netloc.lower()
+        self._trie = _build_trie(ignored_prefixes)
+        self._params = frozenset(blacklist_params)
+        self._tracker = _build_tracker_re(tracker_patterns)
+        self.classify = lru_cache(maxsize=cache_size)(self._classify)
+
+    def _classify(self, href: str, base: str | None = None) -> Verdict:
+        """
+        Return the Verdict for `href`, resolved against `base` (default
+        BASE_URL).
+        """
+        href = href.strip()
+        if not href or href.startswith(SKIP_SCHEMES):
+            return _SKIPPED
+        abs_url = urljoin(base or self.base_url, href)
+        url, _, frag = abs_url.partition("#")
+        if self._tracker is not None and self._tracker.search(url):
+            return Verdict(TRACKER, url, "", frag)
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https", ""):
+            return _SKIPPED
+        if parts.netloc and parts.netloc.lower() != self.base_domain:
+            return Verdict(EXTERNAL, url, "", frag)
+        key = parts.path + (f"?{parts.query}" if parts.query else "")
+        if self._has_ignored_prefix(parts.path):
+            return Verdict(IGNORED, url, key, frag)
+        if parts.query and self._has_blacklisted_param(parts.query):
+            return Verdict(BLACKLISTED, url, key, frag)
+        return Verdict(INTERNAL, url, key, frag)
+
+    def _has_ignored_prefix(self, path: str) -> bool:
+        node = self._trie
+        if not node:
+            return False
+        for ch in path:
+            node = node.get(ch)
+            if node is None:
+                return False
+            if _END in node:
+                return True
+        return False
+
+    def _has_blacklisted_param(self, query: str) -> bool:
+        params = self._params
+        if not params:
+            return False
+        for pair in query.split("&"):
+            k = pair.split("=", 1)[0]
+            if "%" in k or "+" in k:
+                k = unquote_plus(k)
+            if k in params:
+                return True
+        return False
+
+    def is_crawlable(self, href: str) -> bool:
+        return self.classify(href).kind == INTERNAL
@@ -0,0 +1,151 @@
+"""
+Per-run crawl budgets (time, pages, bytes, assets) and the coverage report.
+"""
+
+from __future__ import annotations
+
+import time
+from collections import Counter
+
+from core.state import REDIR, STA, State
+
+STATUS_NAMES = {"l": "pending", "d": "discovered", "p": "downloaded", "e": "failed"}
+
+
+class CrawlBudget:
+    """
+    Counters and limits for one run. A limit of None means unlimited.
+
+    Discovery may only spend `discovery_share` of the time and page budgets,
+    so a time-boxed run always leaves room to download what it found.
+    Workers check `exhausted(phase)` before claiming new work; whatever is
+    already in flight is allowed to finish.
+    """
+
+    def __init__(
+        self,
+        max_seconds: float | None = None,
+        max_pages: int | None = None,
+        max_bytes: int | None = None,
+        max_assets: int | None = None,
+        discovery_share: float = 0.5,
+    ):
+        self.max_seconds = max_seconds
+        self.max_pages = max_pages
+        self.max_bytes = max_bytes
+        self.max_assets = max_assets
+        self.discovery_share = discovery_share
+        self.started = time.monotonic()
+        self.pages = 0
+        self.assets = 0
+        self.bytes = 0
+        self.reason: str | None = None
+
+    @classmethod
+    def from_settings(cls, cfg) -> CrawlBudget:
+        b = getattr(cfg, "BUDGET", None) or {}
+        minutes = b.get("max_minutes")
+        mb = b.get("max_mb")
+        return cls(
+            max_seconds=minutes * 60 if minutes else None,
+            max_pages=b.get("max_pages"),
+            max_bytes=int(mb * 1024 * 1024) if mb else None,
+            max_assets=b.get("max_assets"),
+            discovery_share=b.get("discovery_share", 0.5),
+        )
+
+    def split(self, n: int) -> CrawlBudget:
+        """
+        Budget for one of `n` worker processes: count limits are divided,
+        the time limit is shared as-is.
+        """
+
+        def part(v):
+            return None if v is None else max(1, v // n)
+
+        return CrawlBudget(
+            self.max_seconds,
+            part(self.max_pages),
+            part(self.max_bytes),
+            part(self.max_assets),
+            self.discovery_share,
+        )
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    # ----- accounting (called by Fetcher) -----
+    def charge_page(self, nbytes: int):
+        self.pages += 1
+        self.bytes += nbytes
+
+    def charge_asset(self, nbytes: int):
+        self.assets += 1
+        self.bytes += nbytes
+
+    # ----- checks -----
+    def exhausted(self, phase: str = "download") -> str | None:
+        """
+        Return the name of the spent limit for `phase`, or None.
+        """
+        share = self.discovery_share if phase == "discover" else 1.0
+        if self.max_seconds is not None and self.elapsed >= self.max_seconds * share:
+            return self._hit("time")
+        if self.max_pages is not None and self.pages >= self.max_pages * share:
+            return self._hit("pages")
+        if self.max_bytes is not None and self.bytes >= self.max_bytes:
+            return self._hit("bytes")
+        return None
+
+    def assets_exhausted(self) -> bool:
+        if self.max_assets is not None and self.assets >= self.max_assets:
+            self._hit("assets")
+            return True
+        return self.exhausted() == "bytes"
+
+    def _hit(self, name: str) -> str:
+        if self.reason is None:
+            self.reason = name
+        return name
+
+    def snapshot(self) -> dict:
+        return {
+            "elapsed_s": round(self.elapsed, 1),
+            "pages": self.pages,
+            "assets": self.assets,
+            "bytes": self.bytes,
+            "limits": {
+                "seconds": self.max_seconds,
+                "pages": self.max_pages,
+                "bytes": self.max_bytes,
+                "assets": self.max_assets,
+            },
+            "stopped_by": self.reason,
+        }
+
+
+def coverage_report(state: State, budget: CrawlBudget | None = None) -> dict:
+    """
+    Summarise what this mirror covers: URL counts per status, plus the
+    not-yet-downloaded paths so a later run (or a human) knows what is missing.
+    """
+    counts: Counter = Counter()
+    missing: list[str] = []
+    for path, rec in state.urls.items():
+        if rec[REDIR]:
+            counts["redirect"] += 1
+            continue
+        name = STATUS_NAMES.get(rec[STA], rec[STA])
+        counts[name] += 1
+        if rec[STA] in ("l", "d"):
+            missing.append(path)
+    report = {
+        "urls": dict(counts),
+        "complete": not missing,
+        "assets_cached": len(state.assets),
+        "missing": sorted(missing),
+    }
+    if budget is not None:
+        report["budget"] = budget.snapshot()
+    return report
@@ -4,39 +4,22 @@ Phase-1: discover links and save raw HTML.
 
 from __future__ import annotations
 
-import asyncio
+import os
 import traceback
-from urllib.parse import parse_qsl, urljoin, urlparse
+from urllib.parse import urljoin, urlparse
 
 from bs4 import BeautifulSoup
 
-from config.settings import BASE_DOMAIN, BASE_URL, BLACKLIST_PARAMS, IGNORED_PREFIXES
-from core.pathutils import url_to_local_path
+import config.settings as settings
+from config.settings import BASE_DOMAIN, BASE_URL
+from core.pathutils import local_rel_path, rel_to_abs
 from core.redirects import redirects
-from core.state import State
+from core.state import REL, State
+from core.urlfilter import INTERNAL
+from utils.archive import packing
 from utils.files import safe_file_write
 
 
-def _strip_fragment(url: str) -> str:
-    return url.split("#", 1)[0]
-
-
-def _is_valid_link(href: str) -> bool:
-    if href.startswith(("mailto:", "javascript:", "#")):
-        return False
-    abs_url = urljoin(BASE_URL, href)
-    p = urlparse(_strip_fragment(abs_url))
-    if p.netloc and p.netloc != BASE_DOMAIN:
-        return False
-    if any(p.path.startswith(pref) for pref in IGNORED_PREFIXES):
-        return False
-    if p.query:
-        keys = {k for k, _ in parse_qsl(p.query)}
-        if keys & BLACKLIST_PARAMS:
-            return False
-    return True
-
-
 def _path_plus_query(url: str) -> str:
     p = urlparse(url)
     return p.path + (f"?{p.query}" if p.query else "")
@@ -56,8 +39,7 @@ async def handle_redirect(
         return False
     await redirects.add(src, dst)
     state.mark_redirect_source(src)
-    rel = url_to_local_path(dst)
-    state.add_url(dst, rel)
+    state.add_url(dst, local_rel_path(dst))
     print(f"[Redirect] {src} → {dst}")
     return True
 
@@ -72,36 +54,40 @@ class LinkDiscoverer:
         self.state = state
         self.fetcher = fetcher
         self.id = worker_id
-
-    async def run(self):
-        idle = 0
+        self.owner = f"D{worker_id}@{os.getpid()}"
+
+    async def run(self, queue):
+        """
+        Consume `queue` until cancelled by the scheduler. Once the budget is
+        spent, remaining paths are acknowledged without being processed so
+        the phase drains.
+        """
+        budget = self.fetcher.budget
         while True:
-            path = await self.state.get_next("discover")
-            if not path:
-                idle += 1
-                if idle > 15:
-                    break
-                await asyncio.sleep(0.5)
-                continue
-            idle = 0
-            await self._process(path)
+            path = await queue.get(self.owner)
+            try:
+                if budget is not None and budget.exhausted("discover"):
+                    continue
+                await self._process(path)
+            finally:
+                queue.task_done(path, self.owner)
 
     async def _process(self, path: str):
         url = urljoin(BASE_URL, path)
         try:
-            status, html, final = await self.fetcher.fetch_text(
-                url, allow_redirects=False
-            )
-            if status in (301, 302) and await handle_redirect(
-                self.id, url, final, self.state
+            page = await self.fetcher.fetch_page(url, allow_redirects=False)
+            if page.status in (301, 302) and await handle_redirect(
+                self.id, url, page.url, self.state
             ):
                 return
-            if status != 200 or not html:
-                self.state.update_after_fetch(path, False, f"HTTP {status}")
+            if page.status != 200 or not page.body:
+                self.state.update_after_fetch(path, False, f"HTTP {page.status}")
                 return
-            rel_path = url_to_local_path(path)
-            await safe_file_write(rel_path, html)
-            count = await self._parse_links(html)
+            rec = self.state.urls.get(path)
+            if not packing():  # the archive only takes finished pages
+                # the raw page as served, in its own encoding
+                await safe_file_write(rel_to_abs(rec[REL]), page.body, mode="wb")
+            count = await self._parse_links(page.text())
             self.state.mark_discovered(path)
             print(f"[D{self.id}] {path} → +{count} links")
         except Exception:
@@ -110,14 +96,13 @@ class LinkDiscoverer:
 
     async def _parse_links(self, html: str) -> int:
         soup = BeautifulSoup(html, "html.parser")
+        classify = settings.URL_FILTER.classify
         added = 0
         for a in soup.find_all("a", href=True):
-            href = a["href"]
-            if not _is_valid_link(href):
+            v = classify(a["href"])
+            if v.kind != INTERNAL:
                 continue
-            abs_url = urljoin(BASE_URL, href)
-            key = _path_plus_query(abs_url)
-            rel = url_to_local_path(key)
-            self.state.add_url(key, rel)
+            key = v.key
+            self.state.add_url(key, local_rel_path(key))
             added += 1
         return added
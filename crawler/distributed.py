@@ -0,0 +1,555 @@
+"""
+Coordinator/worker crawl over HTTP (`python -m cli --serve HOST:PORT` and
+`python -m cli --worker URL`).
+
+The coordinator owns the frontier: it keeps the JSON State, hands out leased
+batches of URLs, and is the only process that writes to the backup folder.
+Workers (other machines, or other processes on the same box) run the normal
+LinkDiscoverer / DownloadWorker code against a RemoteState that buffers their
+state changes and sends them back with the next claim; every file they write
+is uploaded to the coordinator instead of going to their own disk.
+
+Protocol (JSON over HTTP, `X-Mirror-Token` header when a token is set;
+the CLI requires one for any address other than loopback):
+
+    GET  /config            settings.yaml text, forum URL, cookies
+    POST /claim             {owner, phase, limit, ops} -> {phase, paths}
+    POST /report            {owner, ops}
+    GET  /snapshot          urls, assets, redirects (before downloading)
+    PUT  /files/<rel>       raw file contents
+    POST /bye               {owner, ops}
+
+The phase moves discover -> download -> done once no URL is left in the
+phase's input status, or the run budget for that phase is spent. A worker
+that asks for a phase the coordinator has left gets no paths and moves on.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hmac
+import os
+import socket
+import time
+from collections import deque
+from pathlib import Path, PurePosixPath
+
+import aiohttp
+from aiohttp import web
+
+import config.settings as settings
+from core.pathutils import is_output_rel
+from core.redirects import redirects
+from core.state import STA, State
+from crawler.budget import CrawlBudget
+from crawler.multiproc import _run_queues
+from crawler.scheduler import PHASE_STATUS, lease_ttl
+from utils.files import safe_file_write, set_sink
+
+TOKEN_HEADER = "X-Mirror-Token"
+# how long a finished coordinator waits for silent workers that never said bye
+DONE_GRACE = 30.0
+MAX_BODY = 256 * 1024 * 1024
+WORKER_DIR = Path.home() / ".forum_mirror_worker"
+
+# ops a worker may apply to the coordinator's State
+_STATE_OPS = {
+    "add_url",
+    "mark_discovered",
+    "mark_downloaded",
+    "mark_redirect_source",
+    "update_after_fetch",
+    "add_asset",
+}
+
+
+class Coordinator:
+    """
+    Frontier owner: leases URLs to workers and applies their results.
+    """
+
+    def __init__(
+        self,
+        state: State,
+        root: Path,
+        budget: CrawlBudget | None = None,
+        config: dict | None = None,
+        token: str | None = None,
+    ):
+        self.state = state
+        self.root = Path(root).resolve()
+        self.budget = budget or CrawlBudget()
+        self.config = config or {}
+        self.token = token
+        self.ttl = lease_ttl(state.cfg)
+        self.phase = "discover"
+        self.workers: set[str] = set()
+        self.finished: set[str] = set()
+        self.done_at: float | None = None
+        self.last_contact = time.monotonic()
+
+    # ----- frontier -----
+    def _advance(self):
+        while self.phase != "done":
+            sta = PHASE_STATUS[self.phase]
+            if self.state.count_status(sta) and not self.budget.exhausted(self.phase):
+                return
+            self.phase = "download" if self.phase == "discover" else "done"
+            print(f"[Coordinator] phase → {self.phase}")
+        if self.done_at is None:
+            self.done_at = time.monotonic()
+
+    def claim(self, owner: str, phase: str, limit: int) -> dict:
+        """
+        Lease up to `limit` URLs of `phase` to `owner`. Returns the current
+        phase and [path, record] pairs (none if `phase` is over).
+        """
+        self.workers.add(owner)
+        self._advance()
+        paths: list[list] = []
+        if phase == self.phase:
+            sta = PHASE_STATUS[phase]
+            for path in self.state.iter_status(sta):
+                if self.state.lease(path, owner, self.ttl):
+                    paths.append([path, self.state.urls[path]])
+                    if len(paths) >= limit:
+                        break
+        return {"phase": self.phase, "paths": paths}
+
+    async def apply(self, owner: str, ops: list):
+        """
+        Apply a worker's buffered changes, in the order they were made.
+        """
+        for op, *args in ops:
+            if op in _STATE_OPS:
+                if op.startswith("mark_") or op == "update_after_fetch":
+                    if args[0] not in self.state.urls:
+                        continue
+                getattr(self.state, op)(*args)
+            elif op == "release":
+                self.state.release(args[0], owner)
+            elif op == "renew":
+                if args[0] in self.state.urls:
+                    self.state.lease(args[0], owner, self.ttl)
+            elif op == "redirect":
+                await redirects.add(*args)
+            elif op == "charge":
+                pages, assets, nbytes = args
+                self.budget.pages += pages
+                self.budget.assets += assets
+                self.budget.bytes += nbytes
+            else:
+                raise ValueError(f"unknown op {op!r}")
+
+    def bye(self, owner: str):
+        self.finished.add(owner)
+        # whatever it still held goes back to the pool
+        for path, (who, _) in list(self.state.leases.items()):
+            if who == owner:
+                self.state.release(path, owner)
+
+    def snapshot(self) -> dict:
+        return {
+            "urls": self.state.urls,
+            "assets": self.state.assets,
+            "redirects": redirects.map,
+        }
+
+    async def write_file(self, rel: str, data: bytes):
+        p = PurePosixPath(rel)
+        if p.is_absolute() or ".." in p.parts or not p.parts:
+            raise ValueError(f"bad path {rel!r}")
+        if not is_output_rel(p.as_posix()):
+            raise ValueError(f"not mirror output: {rel!r}")
+        await safe_file_write(self.root.joinpath(*p.parts), data, mode="wb")
+
+    @property
+    def finished_all(self) -> bool:
+        if self.phase != "done":
+            return False
+        if self.workers <= self.finished:
+            return True
+        # workers still uploading (e.g. background assets) keep it open
+        quiet = time.monotonic() - max(self.done_at, self.last_contact)
+        return quiet >= DONE_GRACE
+
+    # ----- HTTP -----
+    def make_app(self) -> web.Application:
+        @web.middleware
+        async def auth(request, handler):
+            if self.token and not hmac.compare_digest(
+                request.headers.get(TOKEN_HEADER, "").encode(), self.token.encode()
+            ):
+                raise web.HTTPForbidden()
+            self.last_contact = time.monotonic()
+            try:
+                return await handler(request)
+            except (ValueError, KeyError, TypeError) as exc:
+                raise web.HTTPBadRequest(text=str(exc)) from exc
+
+        async def get_config(request):
+            return web.json_response(self.config)
+
+        async def post_claim(request):
+            body = await request.json()
+            await self.apply(body["owner"], body.get("ops", []))
+            return web.json_response(
+                self.claim(body["owner"], body["phase"], int(body.get("limit", 16)))
+            )
+
+        async def post_report(request):
+            body = await request.json()
+            await self.apply(body["owner"], body["ops"])
+            return web.json_response({"phase": self.phase})
+
+        async def post_bye(request):
+            body = await request.json()
+            await self.apply(body["owner"], body.get("ops", []))
+            self.bye(body["owner"])
+            return web.json_response({"phase": self.phase})
+
+        async def get_snapshot(request):
+            return web.json_response(self.snapshot())
+
+        async def put_file(request):
+            await self.write_file(request.match_info["rel"], await request.read())
+            return web.json_response({"ok": True})
+
+        app = web.Application(middlewares=[auth], client_max_size=MAX_BODY)
+        app.router.add_get("/config", get_config)
+        app.router.add_post("/claim", post_claim)
+        app.router.add_post("/report", post_report)
+        app.router.add_post("/bye", post_bye)
+        app.router.add_get("/snapshot", get_snapshot)
+        app.router.add_put("/files/{rel:.+}", put_file)
+        return app
+
+
+async def run_coordinator(
+    state: State,
+    budget: CrawlBudget,
+    config: dict,
+    host: str,
+    port: int,
+    token: str | None = None,
+):
+    """
+    Serve the frontier until every URL is processed (or the budget is spent)
+    and the workers have signed off.
+    """
+    coord = Coordinator(state, settings.BACKUP_ROOT, budget, config, token)
+    runner = web.AppRunner(coord.make_app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print(f"[Coordinator] serving on http://{host}:{port}")
+    autosave = asyncio.create_task(state.autosave())
+    try:
+        while not coord.finished_all:
+            await asyncio.sleep(1.0)
+            coord._advance()
+    finally:
+        autosave.cancel()
+        await runner.cleanup()
+    return coord
+
+
+# ─────────────────────────────────────────────────────────────
+# Worker side
+# ─────────────────────────────────────────────────────────────
+class CoordinatorClient:
+    """Thin JSON/HTTP client with retries for the coordinator API."""
+
+    def __init__(self, session: aiohttp.ClientSession, url: str, retries: int = 5):
+        self.session = session
+        self.url = url.rstrip("/")
+        self.retries = retries
+
+    async def call(self, method: str, path: str, **kw):
+        delay = 1.0
+        for attempt in range(self.retries):
+            try:
+                async with self.session.request(method, self.url + path, **kw) as r:
+                    r.raise_for_status()
+                    return await r.json()
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt == self.retries - 1:
+                    raise
+                await asyncio.sleep(delay)
+                delay *= 2
+
+    async def upload(self, rel: str, data: bytes) -> bool:
+        try:
+            await self.call("PUT", "/files/" + rel, data=data)
+            return True
+        except aiohttp.ClientError as exc:
+            print(f"[Worker] upload {rel}: {exc}")
+            return False
+
+
+class RemoteState:
+    """
+    State stand-in for a worker: reads come from the records the coordinator
+    sent, writes are buffered as ops and sent with the next claim.
+    """
+
+    def __init__(self, cfg, client: CoordinatorClient, owner: str, budget=None):
+        self.cfg = cfg
+        self.client = client
+        self.owner = owner
+        self.budget = budget
+        self.urls: dict[str, list] = {}
+        self.assets: dict[str, str] = {}
+        self.recovered: list[str] = []
+        self.phase = "discover"
+        self._ops: list[list] = []
+        self._seen: set[str] = set()
+        self._charged = (0, 0, 0)
+
+    # ----- sync with the coordinator -----
+    def _charge_op(self):
+        b = self.budget
+        if b is None:
+            return
+        now = (b.pages, b.assets, b.bytes)
+        delta = [n - o for n, o in zip(now, self._charged, strict=True)]
+        if any(delta):
+            self._ops.append(["charge", *delta])
+            self._charged = now
+
+    def _take_ops(self) -> list:
+        self._charge_op()
+        ops, self._ops = self._ops, []
+        return ops
+
+    async def flush(self):
+        ops = self._take_ops()
+        if ops:
+            await self.client.call(
+                "POST", "/report", json={"owner": self.owner, "ops": ops}
+            )
+
+    async def claim(self, phase: str, limit: int) -> list[str] | None:
+        """
+        Send pending ops and lease up to `limit` URLs of `phase`; None once
+        the coordinator has moved past `phase`.
+        """
+        resp = await self.client.call(
+            "POST",
+            "/claim",
+            json={
+                "owner": self.owner,
+                "phase": phase,
+                "limit": limit,
+                "ops": self._take_ops(),
+            },
+        )
+        self.phase = resp["phase"]
+        if self.phase != phase:
+            return None
+        for path, rec in resp["paths"]:
+            self.urls[path] = rec
+        return [p for p, _ in resp["paths"]]
+
+    async def load_snapshot(self):
+        snap = await self.client.call("GET", "/snapshot")
+        self.urls.update(snap["urls"])
+        self.assets.update(snap["assets"])
+        self._seen.update(snap["urls"])
+        redirects.map.update(snap["redirects"])
+
+    async def bye(self):
+        await self.client.call(
+            "POST", "/bye", json={"owner": self.owner, "ops": self._take_ops()}
+        )
+
+    async def save(self):
+        await self.flush()
+
+    # ----- State API used by the workers -----
+    def add_url(self, path: str, rel: str):
+        if path in self._seen or path in self.urls:
+            return
+        self._seen.add(path)
+        self._ops.append(["add_url", path, rel])
+
+    def _local(self, path: str, sta: str):
+        rec = self.urls.get(path)
+        if rec:
+            rec[STA] = sta
+
+    def mark_discovered(self, path: str):
+        self._local(path, "d")
+        self._ops.append(["mark_discovered", path])
+
+    def mark_downloaded(self, path: str):
+        self._local(path, "p")
+        self._ops.append(["mark_downloaded", path])
+
+    def mark_redirect_source(self, path: str):
+        self._local(path, "e")
+        self._ops.append(["mark_redirect_source", path])
+
+    def update_after_fetch(self, path: str, success: bool, err: str = ""):
+        self._ops.append(["update_after_fetch", path, success, err])
+
+    def release(self, path: str, owner: str | None = None):
+        self._ops.append(["release", path])
+
+    def renew(self, paths: list[str]):
+        self._ops.extend(["renew", p] for p in paths)
+
+    def reap_expired(self) -> list[str]:
+        return []
+
+    def on_redirect(self, src: str, dst: str):
+        self._ops.append(["redirect", src, dst])
+
+    def get_asset(self, url: str) -> str | None:
+        return self.assets.get(url)
+
+    def add_asset(self, url: str, rel: str):
+        self.assets[url] = rel
+        self._ops.append(["add_asset", url, rel])
+
+
+class RemoteQueue:
+    """
+    WorkQueue counterpart fed by batched claims from the coordinator (same
+    interface as multiproc.ShardQueue). `join()` returns once the coordinator
+    has left the phase and nothing is in flight here.
+    """
+
+    def __init__(self, state: RemoteState, phase: str, batch: int = 16, poll=0.5):
+        self.state = state
+        self.phase = phase
+        self.batch = batch
+        self.poll = poll
+        self.ttl = lease_ttl(state.cfg)
+        self.in_flight = 0
+        self.over = False
+        self._buf: deque[str] = deque()
+        self._running: set[str] = set()
+        self._refill = asyncio.Lock()
+
+    @property
+    def pending(self) -> int:
+        return len(self._buf) + self.in_flight
+
+    def open_count(self) -> int:
+        return 0 if self.over else 1
+
+    async def get(self, owner: str) -> str:
+        while True:
+            if self._buf:
+                self.in_flight += 1
+                path = self._buf.popleft()
+                self._running.add(path)
+                return path
+            async with self._refill:
+                if self._buf:
+                    continue
+                if self.over:
+                    await asyncio.sleep(self.poll)
+                    continue
+                paths = await self.state.claim(self.phase, self.batch)
+                if paths is None:
+                    self.over = True
+                elif paths:
+                    self._buf.extend(paths)
+                else:
+                    await asyncio.sleep(self.poll)
+
+    def task_done(self, path: str, owner: str):
+        self._running.discard(path)
+        self.state.release(path)
+        self.in_flight -= 1
+
+    async def renew(self):
+        """Ask the coordinator to extend the leases this worker holds."""
+        held = [*self._buf, *self._running]
+        if held:
+            self.state.renew(held)
+            await self.state.flush()
+
+    async def join(self):
+        while self.pending or not self.over:
+            await asyncio.sleep(self.poll)
+        await self.state.flush()
+
+    def close(self):
+        while self._buf:
+            self.state.release(self._buf.popleft())
+
+
+async def run_worker(url: str, token: str | None = None):
+    """
+    Crawl for the coordinator at `url` until it reports the run is done.
+    Scratch files (settings, adblock lists) live in ~/.forum_mirror_worker.
+    """
+    headers = {TOKEN_HEADER: token} if token else {}
+    timeout = aiohttp.ClientTimeout(total=300)
+    async with aiohttp.ClientSession(headers=headers, timeout=timeout) as http:
+        client = CoordinatorClient(http, url)
+        conf = await client.call("GET", "/config")
+        forum_url = conf["forum_url"]
+        domain = forum_url.split("//", 1)[-1].split("/", 1)[0]
+        root = WORKER_DIR / domain.replace(":", "_")
+        root.mkdir(parents=True, exist_ok=True)
+        yaml_path = root / "settings.yaml"
+        yaml_path.write_text(conf.get("yaml", ""), "utf-8")
+        settings.init(root, yaml_path, forum_url)
+
+        # imported after init(): these modules read settings at import time
+        from core.adblock import update_hosts
+        from core.fetcher import Fetcher
+        from core.throttle import ThrottleController
+        from crawler.discover import LinkDiscoverer
+        from crawler.scheduler import start_assets
+        from downloader.workers import DownloadWorker
+
+        await update_hosts(root)
+        redirects.path = str(root / "redirects.json")
+        redirects.map = {}
+        owner = f"N{socket.gethostname()}@{os.getpid()}"
+        budget = CrawlBudget()  # limits are enforced by the coordinator
+        fetcher = Fetcher(
+            settings, ThrottleController(settings), conf.get("cookies") or {}, budget
+        )
+        state = RemoteState(settings, client, owner, budget)
+        redirects.listeners.append(state.on_redirect)
+        set_sink(root, client.upload, remote=True)
+        assets = start_assets(settings, state, fetcher)
+        n = settings.workers
+        print(f"[Worker {owner}] crawling {forum_url} for {url}")
+        try:
+            disc = RemoteQueue(state, "discover", batch=n)
+            await _run_queues(
+                [disc],
+                [
+                    (disc, LinkDiscoverer(settings, state, fetcher, i + 1))
+                    for i in range(n)
+                ],
+            )
+            if state.phase == "download":
+                await state.load_snapshot()
+                down = RemoteQueue(state, "download", batch=n)
+                await _run_queues(
+                    [down],
+                    [
+                        (
+                            down,
+                            DownloadWorker(
+                                settings, state, fetcher, i + 1, assets=assets
+                            ),
+                        )
+                        for i in range(n)
+                    ],
+                )
+                await assets.join()
+        finally:
+            await assets.close()
+            set_sink(None)
+            redirects.listeners.remove(state.on_redirect)
+            await fetcher.close()
+            await state.bye()
+        print(f"[Worker {owner}] done: {budget.pages} pages, {budget.assets} assets")
@@ -0,0 +1,373 @@
+"""
+Multi-process sharded crawl (`python -m cli --processes N`).
+
+The coordinator (the CLI process) copies the JSON State into a SharedState
+SQLite store and starts N worker processes. Worker `k` owns every URL with
+`shard_of(path, N) == k`: it runs its own Fetcher, event loop, discoverers and
+download workers against that partition. All processes pace their requests
+through one GlobalRateLimiter, so the politeness limit holds for the whole
+crawl, and report counters back over a queue.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import glob
+import multiprocessing as mp
+import os
+import time
+from collections import deque
+from pathlib import Path
+
+import config.settings as settings
+from core.sharedstate import SharedState
+from core.state import State
+from core.throttle import GlobalRateLimiter
+
+PHASE_STATUS = {"discover": "l", "download": "d"}
+STATS_EVERY = 2.0
+MAX_RESPAWNS = 3
+
+
+class ShardQueue:
+    """
+    WorkQueue counterpart over SharedState for one shard.
+
+    Claims are leased in batches under the process owner id; `join()` returns
+    when no URL in the phase's input status is left in *any* shard, since
+    other processes can still discover URLs that belong to this one. Shards
+    that stopped early (budget, dead worker) are not waited for.
+    """
+
+    def __init__(
+        self,
+        store: SharedState,
+        phase: str,
+        shard: int,
+        owner: str,
+        ttl: float,
+        budget=None,
+        batch: int = 16,
+        poll: float = 0.25,
+    ):
+        self.state = store
+        self.phase = phase
+        self.status = PHASE_STATUS[phase]
+        self.shard = shard
+        self.owner = owner
+        self.ttl = ttl
+        self.budget = budget
+        self.batch = batch
+        self.poll = poll
+        self.in_flight = 0
+        self._buf: deque[str] = deque()
+        self._running: set[str] = set()
+        self._refill = asyncio.Lock()
+
+    @property
+    def pending(self) -> int:
+        return len(self._buf) + self.in_flight
+
+    def _stopped(self) -> bool:
+        if self.budget is None or not self.budget.exhausted(self.phase):
+            return False
+        self.state.mark_stopped(self.shard, self.phase)
+        return True
+
+    def open_count(self) -> int:
+        if self._stopped():
+            return 0
+        return self.state.count_open(self.status, self.phase)
+
+    async def get(self, owner: str) -> str:
+        while True:
+            if self._buf:
+                self.in_flight += 1
+                path = self._buf.popleft()
+                self._running.add(path)
+                return path
+            async with self._refill:
+                if self._buf:
+                    continue
+                if self._stopped():
+                    await asyncio.sleep(self.poll)
+                    continue
+                paths = self.state.claim(
+                    self.shard, self.status, self.owner, self.ttl, self.batch
+                )
+                if paths:
+                    self._buf.extend(paths)
+                else:
+                    await asyncio.sleep(self.poll)
+
+    def task_done(self, path: str, owner: str):
+        self._running.discard(path)
+        self.state.release(path, self.owner)
+        self.in_flight -= 1
+
+    async def renew(self):
+        """Extend the leases of the claimed batch and of the work in flight."""
+        for path in [*self._buf, *self._running]:
+            self.state.lease(path, self.owner, self.ttl)
+
+    async def join(self):
+        while self.pending or self.open_count():
+            await asyncio.sleep(self.poll)
+
+    def close(self):
+        while self._buf:
+            self.state.release(self._buf.popleft(), self.owner)
+
+
+def _shard_redirects(shard: int) -> str:
+    return os.path.join(os.getcwd(), f"redirects.shard{shard}.json")
+
+
+def _merge_shard_redirects(redirects):
+    for path in sorted(glob.glob(os.path.join(os.getcwd(), "redirects.shard*.json"))):
+        redirects.merge_file(path)
+
+
+async def _report(stats_q, shard: int, budget, phase: list[str]):
+    while True:
+        await asyncio.sleep(STATS_EVERY)
+        stats_q.put(_stats(shard, budget, phase[0]))
+
+
+def _stats(shard: int, budget, phase: str) -> dict:
+    return {
+        "shard": shard,
+        "phase": phase,
+        "pages": budget.pages,
+        "assets": budget.assets,
+        "bytes": budget.bytes,
+        "stopped_by": budget.reason,
+    }
+
+
+async def _renew_leases(queues: list):
+    """Keep the leases of claimed work alive while it is in progress."""
+    interval = min(q.ttl for q in queues) / 4
+    while True:
+        await asyncio.sleep(interval)
+        for q in queues:
+            await q.renew()
+
+
+async def _run_queues(queues: list, workers: list):
+    tasks = [asyncio.create_task(w.run(q)) for q, w in workers]
+    tasks.append(asyncio.create_task(_renew_leases(queues)))
+    try:
+        while any(q.pending or q.open_count() for q in queues):
+            for q in queues:
+                await q.join()
+    finally:
+        for q in queues:
+            q.close()
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _child_async(shard, nshards, init_args, cookies, limiter, stats_q):
+    backup_root, yaml_path, forum_url = init_args
+    settings.init(Path(backup_root), yaml_path, forum_url)
+
+    # imported after init(): these modules read settings at import time
+    from core.adblock import update_hosts
+    from core.fetcher import Fetcher
+    from core.redirects import redirects
+    from core.throttle import ThrottleController
+    from crawler.budget import CrawlBudget
+    from crawler.discover import LinkDiscoverer
+    from crawler.scheduler import lease_ttl, start_assets
+    from downloader.workers import DownloadWorker
+    from utils.archive import start_packing, stop_packing
+
+    await update_hosts(Path(backup_root))  # caches are fresh: just mmaps
+    store = SharedState(
+        settings, str(Path(backup_root) / "crawl_state.sqlite"), nshards
+    )
+    owner = f"P{shard}@{os.getpid()}"
+    budget = CrawlBudget.from_settings(settings).split(nshards)
+    fetcher = Fetcher(
+        settings, ThrottleController(settings, limiter), cookies, budget=budget
+    )
+    redirects.path = _shard_redirects(shard)
+    ttl = lease_ttl(settings)
+    phase = ["discover"]
+    reporter = asyncio.create_task(_report(stats_q, shard, budget, phase))
+    assets = start_assets(settings, store, fetcher)
+    packed = start_packing(backup_root, repair=False)  # the parent repaired
+
+    def queue(p):
+        return ShardQueue(store, p, shard, owner, ttl, budget)
+
+    n = settings.workers
+    try:
+        if settings.PIPELINE.get("enabled"):
+            phase[0] = "pipeline"
+            disc, down = queue("discover"), queue("download")
+            await _run_queues(
+                [disc, down],
+                [
+                    (disc, LinkDiscoverer(settings, store, fetcher, i + 1))
+                    for i in range(n)
+                ]
+                + [
+                    (
+                        down,
+                        DownloadWorker(settings, store, fetcher, i + 1, assets=assets),
+                    )
+                    for i in range(n)
+                ],
+            )
+            await assets.join()
+        else:
+            disc = queue("discover")
+            await _run_queues(
+                [disc],
+                [
+                    (disc, LinkDiscoverer(settings, store, fetcher, i + 1))
+                    for i in range(n)
+                ],
+            )
+            # every shard has finished discovery: pick up their redirects
+            _merge_shard_redirects(redirects)
+            phase[0] = "download"
+            down = queue("download")
+            await _run_queues(
+                [down],
+                [
+                    (
+                        down,
+                        DownloadWorker(settings, store, fetcher, i + 1, assets=assets),
+                    )
+                    for i in range(n)
+                ],
+            )
+            await assets.join()
+    finally:
+        reporter.cancel()
+        await assets.close()
+        stop_packing(packed)
+        store.release_owner(owner)
+        stats_q.put(dict(_stats(shard, budget, "done"), final=True))
+        await fetcher.close()
+        store.close()
+
+
+def _child(shard, nshards, init_args, cookies, limiter, stats_q):
+    try:
+        asyncio.run(_child_async(shard, nshards, init_args, cookies, limiter, stats_q))
+    except KeyboardInterrupt:
+        pass
+
+
+def _print_stats(latest: dict, started: float):
+    tot = {k: sum(s[k] for s in latest.values()) for k in ("pages", "assets", "bytes")}
+    dt = max(time.monotonic() - started, 1e-6)
+    phases = ",".join(sorted({s["phase"] for s in latest.values()}))
+    print(
+        f"[Coordinator] {len(latest)} shards ({phases}): {tot['pages']} pages, "
+        f"{tot['assets']} assets, {tot['bytes'] / 1e6:.1f} MB, "
+        f"{tot['pages'] / dt:.1f} pages/s"
+    )
+
+
+def _clear_shard_redirects():
+    for f in glob.glob(os.path.join(os.getcwd(), "redirects.shard*.json")):
+        os.remove(f)
+
+
+def _drain_stats(stats_q, latest: dict):
+    while not stats_q.empty():
+        s = stats_q.get_nowait()
+        latest[s["shard"]] = s
+
+
+def _reap_children(procs: dict, respawns: dict, start, shared: SharedState):
+    """Restart (or give up on) the shard processes that exited."""
+    for k, p in list(procs.items()):
+        if p.is_alive():
+            continue
+        p.join()
+        if p.exitcode != 0 and respawns[k] < MAX_RESPAWNS:
+            respawns[k] += 1
+            print(f"[Coordinator] shard {k} exited ({p.exitcode}), restarting")
+            procs[k] = start(k)
+            continue
+        if p.exitcode != 0:
+            # give up on this shard so the others can finish
+            print(f"[Coordinator] shard {k} failed, its URLs stay pending")
+            for phase in PHASE_STATUS:
+                shared.mark_stopped(k, phase)
+        del procs[k]
+
+
+def _totals(latest: dict) -> dict:
+    totals = {
+        k: sum(s[k] for s in latest.values()) for k in ("pages", "assets", "bytes")
+    }
+    totals["stopped_by"] = next(
+        (s["stopped_by"] for s in latest.values() if s["stopped_by"]), None
+    )
+    return totals
+
+
+async def run_sharded(state: State, cookies: dict, processes: int, init_args: tuple):
+    """
+    Run the whole crawl in `processes` worker processes and fold the result
+    back into `state`. Returns the summed worker counters.
+
+    A worker that dies is restarted on the same shard (up to MAX_RESPAWNS
+    times); its expired leases are reclaimed by the new process.
+    """
+    backup_root = Path(init_args[0])
+    db_path = str(backup_root / "crawl_state.sqlite")
+    _clear_shard_redirects()
+    shared = SharedState.from_state(state, db_path, processes)
+
+    ctx = mp.get_context("spawn")
+    rate = settings.MAX_RPS or settings.workers / max(settings.base_delay, 0.01)
+    limiter = GlobalRateLimiter(ctx, rate)
+    stats_q = ctx.Queue()
+
+    def start(shard: int):
+        p = ctx.Process(
+            target=_child,
+            args=(shard, processes, init_args, cookies, limiter, stats_q),
+            name=f"crawl-shard-{shard}",
+        )
+        p.start()
+        return p
+
+    procs = {k: start(k) for k in range(processes)}
+    respawns = dict.fromkeys(procs, 0)
+    latest: dict[int, dict] = {}
+    started = last_print = time.monotonic()
+    print(f"[Coordinator] {processes} processes, global limit {rate:.1f} req/s")
+    try:
+        while procs:
+            await asyncio.sleep(0.5)
+            _drain_stats(stats_q, latest)
+            _reap_children(procs, respawns, start, shared)
+            if time.monotonic() - last_print >= 5:
+                last_print = time.monotonic()
+                _print_stats(latest, started)
+    finally:
+        for p in procs.values():
+            p.join(timeout=30)
+            if p.is_alive():
+                p.terminate()
+        _drain_stats(stats_q, latest)
+        shared.to_state(state)
+        shared.close()
+        from core.redirects import redirects
+
+        _merge_shard_redirects(redirects)
+        redirects._persist()
+        _clear_shard_redirects()
+    if latest:
+        _print_stats(latest, started)
+    return _totals(latest)
@@ -1,30 +1,276 @@
 """
 Orchestrate discovery and download phases.
+
+Each phase is driven by a WorkQueue fed from State status changes: a URL is
+queued the moment it enters the phase's input status, idle workers wake up
+immediately, and the phase ends exactly when nothing is queued or in flight.
+
+In pipelined mode both phases run at once and share `cfg.workers` slots.
+
+Every claimed URL is leased in State for `cfg.LEASE_SECONDS`. The queues
+renew the leases of the URLs they hold every quarter of that, so long work
+keeps its claim; expired leases (a worker that is gone) are reaped and
+their URLs queued again.
 """
 
 import asyncio
+from collections import deque
+
+from core.state import STA, State
+
+PHASE_STATUS = {"discover": "l", "download": "d"}
+
+
+def lease_ttl(cfg) -> float:
+    return float(getattr(cfg, "LEASE_SECONDS", 600) or 600)
+
+
+async def _reap_leases(state: State, queues: list):
+    """
+    Periodically renew the leases `queues` hold, then re-queue URLs whose
+    lease expired (lost worker).
+    """
+    interval = lease_ttl(state.cfg) / 4
+    while True:
+        await asyncio.sleep(interval)
+        for q in queues:
+            await q.renew()
+        for path in state.reap_expired():
+            print(f"[Lease] expired, re-queued: {path}")
+
+
+class SharedSlots:
+    """
+    Global concurrency budget shared by several stages.
+
+    At most `total` items run at once. When a slot frees up and more than one
+    stage is waiting, it goes to the stage with the lowest in_use/weight, so
+    busy stages split the budget by weight and an idle stage's share is used
+    by the other.
+    """
+
+    def __init__(self, total: int, weights: dict[str, float]):
+        self.total = max(1, total)
+        self.weights = {k: max(float(w), 0.01) for k, w in weights.items()}
+        self.in_use = dict.fromkeys(weights, 0)
+        self._waiters: dict[str, deque[asyncio.Future]] = {k: deque() for k in weights}
+
+    @property
+    def busy(self) -> int:
+        return sum(self.in_use.values())
+
+    async def acquire(self, stage: str):
+        if self.busy < self.total and not any(self._waiters.values()):
+            self.in_use[stage] += 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters[stage].append(fut)
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # slot was granted while we were being cancelled
+                self.release(stage)
+            else:
+                self._waiters[stage].remove(fut)
+            raise
+
+    def release(self, stage: str):
+        self.in_use[stage] -= 1
+        self._wake()
+
+    def _wake(self):
+        while self.busy < self.total:
+            ready = [k for k, q in self._waiters.items() if q]
+            if not ready:
+                return
+            stage = min(ready, key=lambda k: self.in_use[k] / self.weights[k])
+            self.in_use[stage] += 1
+            self._waiters[stage].popleft().set_result(None)
+
+
+class WorkQueue:
+    """
+    asyncio.Queue of URL paths for one phase, with completion tracking.
+
+    - seeded with every URL currently in `status`, URLs that were in flight
+      when the previous run stopped first
+    - State.watch() pushes URLs that enter `status` later on
+    - get(owner) leases the path in State, task_done(path, owner) releases it;
+      renew() extends the leases of the paths in between
+    - `join()` returns once every queued path has been processed
+    - with `slots`, get() also takes a SharedSlots slot and task_done()
+      gives it back
+    """
+
+    def __init__(self, state: State, phase: str, slots: SharedSlots | None = None):
+        self.state = state
+        self.phase = phase
+        self.status = PHASE_STATUS[phase]
+        self.slots = slots
+        self.ttl = lease_ttl(state.cfg)
+        self.pending = 0  # queued + in flight
+        self._q: asyncio.Queue[str] = asyncio.Queue()
+        self._queued: set[str] = set()
+        self._held: dict[str, str] = {}  # leased path -> owner
+        for path in state.recovered:
+            if state.urls[path][STA] == self.status:
+                self.put(path)
+        for path in state.paths_with_status(self.status):
+            self.put(path)
+        state.watch(self.status, self.put)
+
+    def put(self, path: str):
+        if path in self._queued:
+            return
+        self._queued.add(path)
+        self.pending += 1
+        self._q.put_nowait(path)
+
+    async def get(self, owner: str) -> str:
+        while True:
+            path = await self._q.get()
+            self._queued.discard(path)
+            if self.state.urls[path][STA] != self.status or not self.state.lease(
+                path, owner, self.ttl
+            ):
+                # already handled, or leased by someone else
+                self._finish()
+                continue
+            break
+        self._held[path] = owner
+        if self.slots is not None:
+            try:
+                await self.slots.acquire(self.phase)
+            except asyncio.CancelledError:
+                self.task_done(path, owner, slot=False)
+                raise
+        return path
+
+    def task_done(self, path: str, owner: str, slot: bool = True):
+        self._held.pop(path, None)
+        self.state.release(path, owner)
+        self._finish()
+        if slot and self.slots is not None:
+            self.slots.release(self.phase)
+
+    def _finish(self):
+        self.pending -= 1
+        self._q.task_done()
+
+    async def renew(self):
+        """Extend the leases of the paths being worked on."""
+        for path, owner in self._held.items():
+            self.state.lease(path, owner, self.ttl)
+
+    def qsize(self) -> int:
+        return self._q.qsize()
+
+    async def join(self):
+        await self._q.join()
+
+    def close(self):
+        self.state.unwatch(self.status, self.put)
+
+
+def start_assets(cfg, state, fetcher):
+    """
+    The run's AssetManager, with its background download pool started.
+    join() it once the pages are done, then close() it, which also
+    reconciles on interruption.
+    """
+    # Import inside the function to avoid circular import
+    from downloader.asset_queue import AssetQueue
+    from downloader.assets import AssetManager
+
+    mgr = AssetManager(fetcher, state)
+    workers = getattr(cfg, "ASSET_WORKERS", 8)
+    mgr.queue = AssetQueue(mgr, workers, cfg.retry_limit).start()
+    return mgr
+
+
+async def _run_phase(queue: WorkQueue, workers: list):
+    tasks = [asyncio.create_task(w.run(queue)) for w in workers]
+    tasks.append(asyncio.create_task(_reap_leases(queue.state, [queue])))
+    try:
+        await queue.join()
+    finally:
+        queue.close()
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
 
 
 async def run_discovery_phase(cfg, state, fetcher):
     # Import inside the function to avoid circular import
     from crawler.discover import LinkDiscoverer
 
-    tasks = [asyncio.create_task(LinkDiscoverer(cfg, state, fetcher, 1).run())]
-    while not tasks[0].done():
-        await asyncio.sleep(1)
-        if state.pending_count() >= 20 and len(tasks) < cfg.workers:
-            n = len(tasks) + 1
-            tasks.append(
-                asyncio.create_task(LinkDiscoverer(cfg, state, fetcher, n).run())
-            )
-    await asyncio.gather(*tasks)
+    queue = WorkQueue(state, "discover")
+    workers = [LinkDiscoverer(cfg, state, fetcher, i + 1) for i in range(cfg.workers)]
+    await _run_phase(queue, workers)
+    await state.save()
+
+
+async def run_pipelined(cfg, state, fetcher):
+    """
+    Discover and download concurrently: a page is queued for download the
+    moment it is marked discovered. Both stages share `cfg.workers` slots,
+    weighted by `pipeline.discover_weight` / `pipeline.download_weight`.
+    """
+    # Import inside the function to avoid circular import
+    from crawler.discover import LinkDiscoverer
+    from downloader.workers import DownloadWorker
+
+    opts = getattr(cfg, "PIPELINE", None) or {}
+    slots = SharedSlots(
+        cfg.workers,
+        {
+            "discover": opts.get("discover_weight", 1),
+            "download": opts.get("download_weight", 1),
+        },
+    )
+    disc = WorkQueue(state, "discover", slots)
+    down = WorkQueue(state, "download", slots)
+    assets = start_assets(cfg, state, fetcher)
+    tasks = [
+        asyncio.create_task(LinkDiscoverer(cfg, state, fetcher, i + 1).run(disc))
+        for i in range(cfg.workers)
+    ] + [
+        asyncio.create_task(
+            DownloadWorker(cfg, state, fetcher, wid=i + 1, assets=assets).run(down)
+        )
+        for i in range(cfg.workers)
+    ]
+    tasks.append(asyncio.create_task(_reap_leases(state, [disc, down])))
+    try:
+        # a download failure can send a page back to discovery and vice versa
+        while disc.pending or down.pending:
+            await disc.join()
+            await down.join()
+        await assets.join()
+    finally:
+        disc.close()
+        down.close()
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await assets.close()
+    await state.save()
 
 
 async def run_download_phase(cfg, state, fetcher):
     # Import inside the function to avoid circular import
     from downloader.workers import DownloadWorker  # Fixed import path
 
+    queue = WorkQueue(state, "download")
+    assets = start_assets(cfg, state, fetcher)
     workers = [
-        DownloadWorker(cfg, state, fetcher, wid=i + 1) for i in range(cfg.workers)
+        DownloadWorker(cfg, state, fetcher, wid=i + 1, assets=assets)
+        for i in range(cfg.workers)
     ]
-    await asyncio.gather(*(asyncio.create_task(w.run()) for w in workers))
+    try:
+        await _run_phase(queue, workers)
+        await assets.join()
+    finally:
+        await assets.close()
+    await state.save()
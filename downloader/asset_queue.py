@@ -0,0 +1,152 @@
+"""
+Background asset downloads: one crawl-wide priority queue and worker pool.
+
+Pages no longer wait for their assets. AssetManager hands every new asset
+URL to `AssetQueue.put()`, gets the deterministic local path back at once,
+and the page is rewritten and written out immediately. The pool downloads
+render-critical assets (CSS, scripts) before fonts and images, retries
+transient failures, and `close()` finishes with a reconciliation pass that
+points references to assets that never arrived back at their original URLs.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import json
+import re
+
+from utils.files import safe_file_read, safe_file_write
+
+# lower runs first: what the page needs to render, then decoration
+PRIORITY = {"css": 0, "js": 1, "fonts": 2, "images": 3}
+DEFAULT_PRIORITY = 4
+# statuses worth another try (500 also covers connection errors)
+RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class AssetQueue:
+    """
+    Priority queue of asset downloads served by `workers` background tasks.
+
+    - put(url, kind, rel, page) queues a download once per URL and returns
+      `rel`, or None if the URL already failed for good
+    - join() waits until the queue is empty
+    - close() stops the workers, counts whatever is left as failed and runs
+      reconcile()
+    """
+
+    def __init__(self, mgr, workers: int = 8, retries: int = 3, backoff=1.0):
+        self.mgr = mgr
+        self.n = max(1, workers)
+        self.retries = max(1, retries)
+        self.backoff = backoff
+        self._q: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self._seq = itertools.count()
+        self._tasks: list[asyncio.Task] = []
+        # url -> rel for queued / in-flight downloads
+        self.pending: dict[str, str] = {}
+        # url -> rel of downloads that failed permanently
+        self.failed: dict[str, str] = {}
+        # url -> output files referencing it (pages, shared-chrome fragments)
+        self.referrers: dict[str, set[str]] = {}
+        self.done = 0
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.n)]
+        return self
+
+    def put(self, url: str, kind: str, rel: str, page: str | None = None):
+        if url in self.failed:
+            return None
+        if page is not None:
+            self.referrers.setdefault(url, set()).add(page)
+        if url not in self.pending:
+            self.pending[url] = rel
+            prio = PRIORITY.get(kind, DEFAULT_PRIORITY)
+            self._q.put_nowait((prio, next(self._seq), url, rel))
+        return rel
+
+    def refer(self, url: str, path: str):
+        """Record another file that references `url`, while it is pending."""
+        if url in self.pending:
+            self.referrers.setdefault(url, set()).add(path)
+
+    async def _worker(self):
+        while True:
+            _, _, url, rel = await self._q.get()
+            try:
+                if await self._download(url, rel):
+                    self.done += 1
+                    self.referrers.pop(url, None)
+                else:
+                    self.failed[url] = rel
+            except Exception as exc:
+                print(f"[Assets] {url}: {type(exc).__name__}: {exc}")
+                self.failed[url] = rel
+            finally:
+                self.pending.pop(url, None)
+                self._q.task_done()
+
+    async def _download(self, url: str, rel: str) -> bool:
+        budget = self.mgr.fetcher.budget
+        for attempt in range(self.retries):
+            if budget is not None and budget.assets_exhausted():
+                return False
+            status = await self.mgr.download(url, rel)
+            if status == 200:
+                return True
+            if status not in RETRY_STATUSES:
+                return False
+            await asyncio.sleep(self.backoff * 2**attempt)
+        return False
+
+    async def join(self):
+        await self._q.join()
+
+    async def close(self) -> int:
+        """
+        Stop the pool and reconcile. Returns the number of pages fixed up.
+        """
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # interrupted: what never ran is as missing as what failed
+        self.failed.update(self.pending)
+        self.pending.clear()
+        if self.done or self.failed:
+            print(f"[Assets] {self.done} downloaded, {len(self.failed)} failed")
+        return await self.reconcile()
+
+    async def reconcile(self) -> int:
+        """
+        Point references to failed assets back at their original URLs, in
+        every page that used them, so the page shows them while online
+        instead of a broken local link. Shared-chrome fragments (.js) hold
+        the markup as a JSON string: URLs go in JSON-escaped there.
+        """
+        by_page: dict[str, dict[str, str]] = {}
+        for url, rel in self.failed.items():
+            name = rel.rsplit("/", 1)[-1]
+            for page in self.referrers.pop(url, ()):
+                by_page.setdefault(page, {})[name] = url
+        fixed = 0
+        for page, names in by_page.items():
+            html = await safe_file_read(page)
+            if html is None:
+                continue  # not stored locally (remote worker) or not written
+            if page.endswith(".js"):
+                names = {k: json.dumps(v)[1:-1] for k, v in names.items()}
+            # any path spelling ending in the asset's unique file name (in a
+            # fragment the closing quote is escaped: \")
+            rx = re.compile(
+                r"[^\s\"'()=,]*/("
+                + "|".join(map(re.escape, names))
+                + r")(?=[\s\"'),\\])"
+            )
+            new = rx.sub(lambda m, names=names: names[m.group(1)], html)
+            if new != html and await safe_file_write(page, new):
+                fixed += 1
+        return fixed
@@ -4,49 +4,316 @@ AssetManager: download, dedupe & classify assets.
 
 from __future__ import annotations
 
+import asyncio
 import hashlib
 import mimetypes
 import os
+from collections import Counter
 from pathlib import Path
 from urllib.parse import urlparse
 
-from config.settings import AD_HOSTS, BACKUP_ROOT, MAX_ASSET_KB
+import config.settings as settings
+from core.adblock import is_blocked_host
 from core.state import State
-from utils.files import safe_file_write
+from core.urlfilter import SKIP, TRACKER
+from downloader.cas import link_or_copy, open_store
+from downloader.ranged import RangedDownload
+from processor.rewrite.css import FONT_EXTS, css_refs, rewrite_css
+from utils.archive import packing
+from utils.files import is_remote, safe_file_write
 
 IMAGE_EXTS = {".png", ".jpg", ".jpeg", ".gif", ".svg", ".webp", ".bmp", ".ico"}
+# page furniture: small, so never worth a HEAD round trip before the GET
+INLINE_EXTS = IMAGE_EXTS | FONT_EXTS | {".css", ".js"}
 
 
 class AssetManager:
-    def __init__(self, fetcher, state: State):
+    """
+    Crawl-wide resolver of asset URLs to local files under BACKUP_ROOT.
+
+    One instance serves every page of a run: it keeps an in-memory index
+    (url -> rel) in front of the persistent cache in State, and counts
+    hits, misses, downloaded bytes and dedupes (see stats()).
+
+    With a `queue` (AssetQueue), fetch() returns the asset's deterministic
+    local path at once and leaves the download to the queue's worker pool.
+    Without one, fetch() downloads inline. Pages call it through
+    for_page(out_path), which records who references what for the queue's
+    reconciliation pass.
+
+    Downloads go through the content-addressed store (downloader.cas): the
+    file at `rel` is a hardlink to the blob named by its SHA-256, and a URL
+    already in the local or shared store is linked without being fetched.
+
+    Anything else (attachments, videos, archives) is checked with a HEAD
+    first: a body over MAX_ASSET_KB is skipped before it is transferred, and
+    one of LARGE_ASSET_MB or more is fetched with resumable Range requests
+    (downloader.ranged) into assets/objects/partial, then moved into the
+    store.
+
+    Stylesheets are localised recursively: their url()/@import references
+    are fetched through the manager and rewritten relative to the CSS file.
+    The result is cached per (content hash, base URL), so a theme CSS is
+    parsed once per run however many URLs serve it.
+    """
+
+    def __init__(self, fetcher, state: State, queue=None):
         self.fetcher = fetcher
         self.state = state
-        self.dst_img = Path(BACKUP_ROOT) / "assets" / "imagens" / "internal"
-        self.dst_file = Path(BACKUP_ROOT) / "assets" / "files" / "internal"
-        self.dst_ext = Path(BACKUP_ROOT) / "external_files"
+        self.queue = queue
+        self.root = Path(settings.BACKUP_ROOT)
+        self.dst_img = self.root / "assets" / "imagens" / "internal"
+        self.dst_file = self.root / "assets" / "files" / "internal"
+        self.dst_ext = self.root / "external_files"
         for p in (self.dst_img, self.dst_file, self.dst_ext):
             p.mkdir(parents=True, exist_ok=True)
+        self.index: dict[str, str] = {}
+        self.counters: Counter = Counter()
+        self._store = None
+        self._shared = None
+        # (sha256, base url) -> localised CSS text
+        self._css_cache: dict[tuple[str, str], str] = {}
+        # stylesheets being localised (inline mode), to break @import cycles
+        self._css_active: set[str] = set()
 
-    async def fetch(self, url: str, kind_hint: str = "") -> str | None:
-        host = urlparse(url).netloc.lower()
-        if host in AD_HOSTS:
+    # ----- lookups -----
+    def for_page(self, page: str | None) -> PageAssets:
+        return PageAssets(self, page)
+
+    def cached(self, url: str) -> str | None:
+        rel = self.index.get(url)
+        if rel is None:
+            rel = self.state.get_asset(url)
+            if rel:
+                self.index[url] = rel
+        return rel
+
+    async def fetch(
+        self, url: str, kind_hint: str = "", page: str | None = None
+    ) -> str | None:
+        if is_blocked_host(urlparse(url).netloc):
+            self.counters["blocked"] += 1
             return None
-        cached = self.state.get_asset(url)
+        cached = self.cached(url)
         if cached:
+            self.counters["hits"] += 1
             return cached
-        status, data = await self.fetcher.fetch_bytes(url)
-        if status != 200 or data is None:
-            return None
-        if MAX_ASSET_KB and len(data) > MAX_ASSET_KB * 1024:
+        budget = self.fetcher.budget
+        if budget is not None and budget.assets_exhausted():
             return None
+        rel = self.local_rel(url, kind_hint)
+        if self.queue is not None:
+            if url not in self.queue.pending:
+                self.counters["misses"] += 1
+            return self.queue.put(url, kind_hint, rel, page)
+        if url in self._css_active:
+            return rel  # @import cycle
+        self.counters["misses"] += 1
+        status = await self.download(url, rel)
+        return rel if status == 200 else None
+
+    def local_rel(self, url: str, kind_hint: str = "") -> str:
+        """
+        Path (relative to BACKUP_ROOT) the asset is stored at, known before
+        it is downloaded.
+        """
         ext = self._choose_ext(url, kind_hint)
         sub = self.dst_img if ext in IMAGE_EXTS else self.dst_file
-        name = hashlib.md5(url.encode()).hexdigest() + ext
-        full = sub / name
-        await safe_file_write(full, data, mode="wb")
-        rel = os.path.relpath(full, BACKUP_ROOT).replace(os.sep, "/")
+        full = sub / (hashlib.md5(url.encode()).hexdigest() + ext)
+        return os.path.relpath(full, self.root).replace(os.sep, "/")
+
+    def _remember(self, url: str, rel: str):
+        self.index[url] = rel
         self.state.add_asset(url, rel)
-        return rel
+
+    # ----- downloads -----
+    def _stores(self):
+        if self._store is None:
+            self._store = open_store(self.root / "assets" / "objects")
+            if settings.SHARED_ASSET_STORE:
+                self._shared = open_store(
+                    Path(settings.SHARED_ASSET_STORE).expanduser()
+                )
+        return self._store, self._shared
+
+    async def download(self, url: str, rel: str) -> int:
+        """
+        Fetch `url` into `rel` and cache the mapping. Returns the HTTP status;
+        an oversized asset is reported as 413.
+        """
+        dest = self.root / rel
+        if is_remote(dest):
+            # remote worker: the file is uploaded, the coordinator stores it
+            return await self._download_plain(url, dest, rel)
+        data = None
+        blob = self._lookup(url)
+        if blob is None:
+            status, blob, data = await self._fetch_to_store(url, rel)
+            if status != 200:
+                return status
+        if dest.suffix == ".css":
+            if data is None:
+                data = await asyncio.to_thread(blob.read_bytes)
+            await self._localise_css(url, dest, data, blob.stem)
+        elif not await self._place(blob, dest):
+            return 500
+        self._remember(url, rel)
+        return 200
+
+    def _lookup(self, url: str) -> Path | None:
+        """The stored blob for `url`, from this backup's store or the shared one."""
+        store, shared = self._stores()
+        blob = store.lookup(url)
+        if blob is None and shared is not None:
+            hit = shared.lookup(url)
+            if hit is not None:
+                blob, _ = store.adopt(url, hit)
+                self.counters["shared_hits"] += 1
+        return blob
+
+    async def _fetch_to_store(self, url: str, rel: str):
+        """
+        Download `url` into the store. Returns (status, blob, body); the body
+        is None when it went to disk by Range requests.
+        """
+        store, shared = self._stores()
+        status, data, part = await self._fetch_large(url, rel)
+        if status == 200 and part is None:
+            status, data = await self._fetch(url)
+        if status != 200:
+            return status, None, None
+        try:
+            if part is not None:
+                blob, new = await store.put_file(url, part, Path(rel).suffix)
+            else:
+                blob, new = await store.put(url, data, Path(rel).suffix)
+            if shared is not None:
+                shared.adopt(url, blob)
+        except OSError as exc:
+            print(f"[Assets] store {url}: {exc}")
+            return 500, None, None
+        if not new:
+            self.counters["dedupes"] += 1
+        return 200, blob, data
+
+    async def _place(self, blob: Path, dest: Path) -> bool:
+        """Put a stored blob at `dest`: linked on disk, copied into an archive."""
+        if packing():
+            data = await asyncio.to_thread(blob.read_bytes)
+            return await safe_file_write(dest, data, mode="wb")
+        await asyncio.to_thread(link_or_copy, blob, dest)
+        return True
+
+    def _max_bytes(self) -> int | None:
+        max_kb = settings.MAX_ASSET_KB
+        return int(max_kb * 1024) if max_kb else None
+
+    async def _fetch(self, url: str) -> tuple[int, bytes | None]:
+        status, data = await self.fetcher.fetch_bytes(url, self._max_bytes())
+        if status == 413:
+            self.counters["too_big"] += 1
+            return 413, None
+        if status != 200 or data is None:
+            self.counters["errors"] += 1
+            return (status if status != 200 else 500), None
+        self.counters["downloads"] += 1
+        self.counters["bytes"] += len(data)
+        return 200, data
+
+    async def _fetch_large(self, url: str, rel: str):
+        """
+        HEAD pre-flight for attachment-like URLs. Returns (status, None, part):
+        200 with part=None means "use a plain GET"; 200 with a path means the
+        body was fetched by Range requests into that file.
+        """
+        part = self.root / "assets" / "objects" / "partial"
+        part = part / (hashlib.md5(url.encode()).hexdigest() + ".part")
+        if Path(rel).suffix in INLINE_EXTS and not part.exists():
+            return 200, None, None
+        status, info = await self.fetcher.head(url)
+        length = info.get("length")
+        if status != 200 or length is None:
+            return 200, None, None  # no usable HEAD: let the GET decide
+        max_bytes = self._max_bytes()
+        if max_bytes is not None and length > max_bytes:
+            self.counters["too_big"] += 1
+            return 413, None, None
+        large = (settings.LARGE_ASSET_MB or 0) * 1024 * 1024
+        if not info.get("ranges") or length < max(large, 1):
+            return 200, None, None
+        job = RangedDownload(
+            self.fetcher, url, part, info, settings.RANGE_SEGMENTS or 1
+        )
+        if job.part.exists():
+            self.counters["resumed"] += 1
+        if not await job.run():
+            self.counters["errors"] += 1
+            return 500, None, None
+        self.counters["ranged"] += 1
+        self.counters["downloads"] += 1
+        self.counters["bytes"] += length
+        return 200, None, part
+
+    async def _download_plain(self, url: str, dest: Path, rel: str) -> int:
+        status, data = await self._fetch(url)
+        if status != 200:
+            return status
+        if dest.suffix == ".css":
+            await self._localise_css(url, dest, data)
+        elif not await safe_file_write(dest, data, mode="wb"):
+            return 500
+        self._remember(url, rel)
+        return 200
+
+    # ----- stylesheets -----
+    async def _localise_css(
+        self, url: str, dest: Path, data: bytes, sha: str | None = None
+    ):
+        """
+        Write the stylesheet at `url` to `dest` with its nested references
+        pointing at local copies (never onto the content-addressed blob).
+        """
+        key = (sha or hashlib.sha256(data).hexdigest(), url.split("?", 1)[0])
+        css = self._css_cache.get(key)
+        if css is None:
+            text = data.decode("utf-8", errors="replace")
+            if url in self._css_active:
+                css = text  # @import cycle: the outer call localises it
+            else:
+                self._css_active.add(url)
+                try:
+                    css = await self._rewrite_css(text, url, dest)
+                finally:
+                    self._css_active.discard(url)
+                self._css_cache[key] = css
+                self.counters["css_parsed"] += 1
+        else:
+            self.counters["css_cached"] += 1
+        await safe_file_write(dest, css)
+
+    async def _rewrite_css(self, css: str, url: str, dest: Path) -> str:
+        refs = []
+        for ref, is_import in css_refs(css):
+            v = settings.URL_FILTER.classify(ref, url)
+            if v.kind in (SKIP, TRACKER):
+                continue
+            ext = Path(urlparse(v.url).path).suffix.lower()
+            kind = (
+                "css"
+                if is_import or ext == ".css"
+                else "fonts" if ext in FONT_EXTS else "images"
+            )
+            refs.append((ref, v.url, kind))
+        page = str(dest)
+        found = await asyncio.gather(
+            *(self.fetch(abs_u, kind, page) for _, abs_u, kind in refs)
+        )
+        mapping = {}
+        for (ref, _, _), local in zip(refs, found, strict=True):
+            if local:
+                target = self.root / local
+                mapping[ref] = os.path.relpath(target, dest.parent).replace(os.sep, "/")
+        return rewrite_css(css, mapping)
 
     def _choose_ext(self, url: str, kind_hint: str) -> str:
         ext = Path(urlparse(url).path).suffix.lower()
@@ -54,5 +321,58 @@ class AssetManager:
             return ext
         if kind_hint == "fonts":
             return ".woff"
+        if kind_hint in ("css", "js"):
+            # e.g. fonts.googleapis.com/css?family=...: must stay a stylesheet
+            return "." + kind_hint
         # fallback to mime sniff
         return mimetypes.guess_extension(kind_hint) or ".bin"
+
+    # ----- lifecycle (with a queue) -----
+    async def join(self):
+        if self.queue is not None:
+            await self.queue.join()
+
+    async def close(self):
+        if self.queue is not None:
+            await self.queue.close()
+        if any(self.counters.values()):
+            print(f"[Assets] {self.stats()}")
+
+    def stats(self) -> dict:
+        keys = ("hits", "misses", "downloads", "bytes", "dedupes", "shared_hits")
+        out = {k: self.counters[k] for k in keys}
+        out.update((k, v) for k, v in self.counters.items() if k not in out)
+        return out
+
+
+class PageAssets:
+    """AssetManager bound to the output file of one page."""
+
+    __slots__ = ("mgr", "page", "urls", "_dir")
+
+    def __init__(self, mgr: AssetManager, page: str | None):
+        self.mgr = mgr
+        self.page = page
+        self.urls: list[str] = []  # every asset URL looked up for the page
+        self._dir = os.path.dirname(page) if page else None
+
+    async def fetch(self, url: str, kind_hint: str = "") -> str | None:
+        self.urls.append(url)
+        return await self.mgr.fetch(url, kind_hint, self.page)
+
+    def also_in(self, path: str):
+        """
+        `path` (a shared-chrome fragment) now holds some of the page's
+        asset paths: reconcile it too if one of them fails.
+        """
+        queue = self.mgr.queue
+        if queue is not None:
+            for url in self.urls:
+                queue.refer(url, path)
+
+    def href(self, rel: str) -> str:
+        """A BACKUP_ROOT-relative asset path as the page must link it."""
+        if self._dir is None:
+            return rel
+        target = os.path.join(self.mgr.root, rel)
+        return os.path.relpath(target, self._dir).replace(os.sep, "/")
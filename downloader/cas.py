@@ -0,0 +1,150 @@
+"""
+Content-addressed asset store.
+
+Blobs are named by the SHA-256 of their bytes
+(`<store>/<sha[:2]>/<sha><ext>`), and an SQLite index maps every asset URL to
+its hash. The same image served under several URLs is stored once; the
+per-URL files the pages reference are hardlinks to the blob (copies where
+the filesystem cannot link).
+
+Each backup keeps its store in `assets/objects`. With `shared_asset_store`
+set, a second store in that folder is shared by every backup on the
+machine, so theme images and smilies common to many forums are fetched once.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import shutil
+import sqlite3
+from pathlib import Path
+
+from utils.files import safe_file_write
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS urls (
+    url TEXT PRIMARY KEY,
+    sha TEXT NOT NULL,
+    ext TEXT NOT NULL
+);
+"""
+
+
+def link_or_copy(src: str | Path, dst: str | Path):
+    """
+    Make `dst` the same file as `src`: a hardlink, or a copy across
+    filesystems. Replaces `dst` atomically.
+    """
+    src, dst = Path(src), Path(dst)
+    if dst.exists() and os.path.samefile(src, dst):
+        return
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dst.with_name(dst.name + ".lnk.tmp")
+    if tmp.exists():
+        tmp.unlink()
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+
+class ContentStore:
+    """
+    Blobs keyed by SHA-256 plus the URL -> hash index. Process-safe: blobs
+    are written atomically and the index is an SQLite database in WAL mode.
+    """
+
+    def __init__(self, root: str | Path):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(
+            str(self.root / "index.sqlite"), timeout=30, isolation_level=None
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+
+    def blob_path(self, sha: str, ext: str) -> Path:
+        return self.root / sha[:2] / (sha + ext)
+
+    def lookup(self, url: str) -> Path | None:
+        """Blob already stored for `url`, if any."""
+        row = self._db.execute(
+            "SELECT sha, ext FROM urls WHERE url=?", (url,)
+        ).fetchone()
+        if row is None:
+            return None
+        p = self.blob_path(*row)
+        return p if p.exists() else None
+
+    def _index(self, url: str, sha: str, ext: str):
+        self._db.execute(
+            "INSERT OR REPLACE INTO urls VALUES (?, ?, ?)", (url, sha, ext)
+        )
+
+    async def put(self, url: str, data: bytes, ext: str) -> tuple[Path, bool]:
+        """
+        Store `data` for `url`. Returns the blob path and whether it is new
+        (False: the same bytes were already stored, under this or another URL).
+        Raises OSError, and indexes nothing, if the blob cannot be written.
+        """
+        sha = hashlib.sha256(data).hexdigest()
+        p = self.blob_path(sha, ext)
+        new = not p.exists()
+        if new and not await safe_file_write(p, data, mode="wb"):
+            raise OSError(f"could not write {p}")
+        self._index(url, sha, ext)
+        return p, new
+
+    async def put_file(self, url: str, src: Path, ext: str) -> tuple[Path, bool]:
+        """
+        Like put() for a body already on disk (a finished Range download):
+        `src` is hashed in chunks and moved into the store.
+        """
+
+        def move() -> tuple[Path, bool, str]:
+            h = hashlib.sha256()
+            with open(src, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    h.update(chunk)
+            sha = h.hexdigest()
+            p = self.blob_path(sha, ext)
+            new = not p.exists()
+            if new:
+                p.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(src, p)
+            else:
+                os.remove(src)
+            return p, new, sha
+
+        p, new, sha = await asyncio.to_thread(move)
+        self._index(url, sha, ext)
+        return p, new
+
+    def adopt(self, url: str, blob: Path) -> tuple[Path, bool]:
+        """
+        Take over a blob from another store (same naming scheme) for `url`.
+        """
+        sha, ext = blob.stem, blob.suffix
+        p = self.blob_path(sha, ext)
+        new = not p.exists()
+        if new:
+            link_or_copy(blob, p)
+        self._index(url, sha, ext)
+        return p, new
+
+    def close(self):
+        self._db.close()
+
+
+_stores: dict[str, ContentStore] = {}
+
+
+def open_store(root: str | Path) -> ContentStore:
+    """One ContentStore per folder and process."""
+    key = os.path.abspath(root)
+    if key not in _stores:
+        _stores[key] = ContentStore(key)
+    return _stores[key]
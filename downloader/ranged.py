@@ -0,0 +1,133 @@
+"""
+Resumable Range downloads for large assets (attachments, videos, archives).
+
+The body is streamed into `<name>.part` next to a `<name>.part.json` sidecar
+that records the URL, size, validator (ETag / Last-Modified) and, per
+segment, the next byte to fetch. An interrupted download, in this run or a
+later one, continues from there; if the remote file changed, it starts over.
+With `segments` > 1 the file is fetched in that many parallel ranges.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+from pathlib import Path
+
+MAX_STALLS = 3  # attempts in a row without progress before giving up
+SAVE_EVERY = 1024 * 1024  # bytes between sidecar updates
+
+
+class RangedDownload:
+    def __init__(self, fetcher, url: str, part: Path, info: dict, segments: int = 1):
+        self.fetcher = fetcher
+        self.url = url
+        self.part = Path(part)
+        self.meta_path = self.part.with_name(self.part.name + ".json")
+        self.length: int = info["length"]
+        self.etag = info.get("etag")
+        self.segments = max(1, segments)
+        # [start, end (inclusive), next byte]
+        self.plan: list[list[int]] = []
+        self.written = 0
+        self._unsaved = 0
+        self._restart = False  # the remote file changed: drop the partial
+
+    # ----- sidecar -----
+    def _load_plan(self) -> bool:
+        try:
+            meta = json.loads(self.meta_path.read_text("utf-8"))
+        except (OSError, ValueError):
+            return False
+        if (
+            meta.get("url") != self.url
+            or meta.get("length") != self.length
+            or meta.get("etag") != self.etag
+            or not self.part.exists()
+        ):
+            return False
+        self.plan = meta["segments"]
+        return True
+
+    def _new_plan(self):
+        n = self.segments if self.length >= self.segments else 1
+        step = -(-self.length // n)
+        self.plan = [
+            [s, min(s + step, self.length) - 1, s] for s in range(0, self.length, step)
+        ]
+        self.part.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.part, "wb") as f:
+            f.truncate(self.length)
+        self._save()
+
+    def _save(self):
+        meta = {
+            "url": self.url,
+            "length": self.length,
+            "etag": self.etag,
+            "segments": self.plan,
+        }
+        tmp = self.meta_path.with_name(self.meta_path.name + ".tmp")
+        tmp.write_text(json.dumps(meta), "utf-8")
+        os.replace(tmp, self.meta_path)
+        self._unsaved = 0
+
+    @property
+    def resumed_from(self) -> int:
+        return sum(seg[2] - seg[0] for seg in self.plan)
+
+    # ----- transfer -----
+    async def run(self) -> bool:
+        """
+        Fetch whatever is missing. True once `part` holds the whole body;
+        the caller moves it into place.
+        """
+        if not self._load_plan():
+            self._new_plan()
+        todo = [seg for seg in self.plan if seg[2] <= seg[1]]
+        try:
+            results = await asyncio.gather(*(self._segment(seg) for seg in todo))
+        finally:
+            if self._restart:
+                self.meta_path.unlink(missing_ok=True)
+            else:
+                self._save()
+            if self.written and self.fetcher.budget is not None:
+                self.fetcher.budget.charge_asset(self.written)
+        if not all(results):
+            return False
+        self.meta_path.unlink(missing_ok=True)
+        return os.path.getsize(self.part) == self.length
+
+    async def _segment(self, seg: list[int]) -> bool:
+        stalls = 0
+
+        def progress(n: int):
+            seg[2] += n
+            self.written += n
+            self._unsaved += n
+            if self._unsaved >= SAVE_EVERY:
+                self._save()
+
+        # unbuffered: the sidecar never claims bytes still in a buffer
+        with open(self.part, "r+b", buffering=0) as fh:
+            while seg[2] <= seg[1]:
+                before = seg[2]
+                status, n = await self.fetcher.fetch_range(
+                    self.url, fh, seg[2], seg[1], self.etag, progress
+                )
+                if status == 200:
+                    # range ignored or file changed: the whole body came back
+                    self.written += n
+                    if len(self.plan) == 1 and n == self.length:
+                        seg[2] = seg[1] + 1
+                        return True
+                    self._restart = True
+                    return False
+                if status != 206:
+                    return False
+                stalls = 0 if seg[2] > before else stalls + 1
+                if stalls >= MAX_STALLS:
+                    return False
+        return True
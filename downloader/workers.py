@@ -2,46 +2,78 @@
 Phase-2: fetch HTML, rewrite via processor, save final.
 """
 
+import os
 import traceback
 from urllib.parse import urljoin
 
-from core.pathutils import url_to_local_path
-from core.state import State
+from core.pathutils import rel_to_abs
+from core.state import REL, State
+from processor.cache import open_cache, raw_hash
+from processor.linkindex import open_index
 from processor.orchestrator import process_html
-from utils.files import safe_file_write
+from utils.files import is_remote, safe_file_write
 
 
 class DownloadWorker:
-    def __init__(self, cfg, state: State, fetcher, wid=1, progress=None):
+    def __init__(self, cfg, state: State, fetcher, wid=1, progress=None, assets=None):
         self.cfg = cfg
         self.state = state
         self.fetcher = fetcher
         self.id = wid
+        self.owner = f"W{wid}@{os.getpid()}"
         self.progress = progress
+        self.assets = assets  # the run's AssetManager
 
-    async def run(self):
+    async def run(self, queue):
+        """
+        Consume `queue` until cancelled by the scheduler (see LinkDiscoverer).
+        """
+        budget = self.fetcher.budget
         while True:
-            path = await self.state.get_next("download")
-            if not path:
-                break
-            await self._process(path)
+            path = await queue.get(self.owner)
+            try:
+                if budget is not None and budget.exhausted("download"):
+                    continue
+                await self._process(path)
+            finally:
+                queue.task_done(path, self.owner)
 
     async def _process(self, path: str):
-        url = urljoin(self.cfg.base_url, path)
+        url = urljoin(self.cfg.BASE_URL, path)
         try:
-            status, html, final = await self.fetcher.fetch_text(url)
+            page = await self.fetcher.fetch_page(url)
+            status, final = page.status, page.url
 
             # Import inside the method to avoid circular import
             from crawler.discover import handle_redirect
 
             if final != url and await handle_redirect(self.id, url, final, self.state):
                 return
-            if status != 200 or not html:
+            if status != 200 or not page.body:
                 self.state.update_after_fetch(path, False, f"HTTP {status}")
                 return
-            result = await process_html(final, html, self.fetcher, self.state)
-            out = url_to_local_path(final)
-            await safe_file_write(out, result)
+            # write to the file the record was assigned at discovery, which
+            # is where every other page's links point
+            rel = self.state.urls.get(path)[REL]
+            out = rel_to_abs(rel)
+            local = not is_remote(out)
+            cache = raw = None
+            if getattr(self.cfg, "REWRITE_CACHE", True) and local:
+                cache = open_cache(self.cfg.BACKUP_ROOT)
+                raw = raw_hash(page.body, final)
+            if cache is None or not cache.fresh(path, raw, self.state, out):
+                # first and only decode of the body
+                deps: dict = {}
+                result = await process_html(
+                    final, page.text(), self.fetcher, self.state, out, self.assets, deps
+                )
+                if await safe_file_write(out, result) and local:
+                    # reverse links, for relink
+                    open_index(self.cfg.BACKUP_ROOT).record(
+                        path, rel, deps["hrefs"], self.state
+                    )
+                    if cache is not None:
+                        cache.store(path, raw, self.state, deps)
             self.state.mark_downloaded(path)
             if self.progress:
                 self.progress.update(1)
@@ -0,0 +1,185 @@
+"""
+Rewrite result cache: skip process_html for pages that cannot have changed.
+
+For every page written, rewrite_cache.sqlite (in BACKUP_ROOT) keeps
+
+* the SHA-1 of the raw HTML as fetched (and of its final URL)
+* the rules version: a hash of the rewriting code (processor/, URL mapping
+  and filtering, asset naming, ad blocking), of the settings that shape
+  the output and of the compiled ad host list (hosts.bin)
+* the internal link keys the page referenced and a digest of what they
+  resolved to, plus its asset URLs
+
+On the next run, a page whose raw HTML, rules version and link digest
+all match, whose assets are all in the asset cache, and whose output file
+still exists, keeps that file as it is. A page that links to one that
+got a file, moved, or turned into a redirect is rewritten. So is a page
+with an asset that is still missing, which retries the asset. Assets
+localise to fixed paths, so the ones that are present need no digest.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+from pathlib import Path
+from urllib.parse import urlparse
+
+import config.settings as settings
+from core.adblock import is_blocked_host
+from core.hostlist import read_signature
+from core.redirects import redirects
+from core.state import REL, State
+from utils.files import file_exists
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    path TEXT PRIMARY KEY,
+    raw TEXT NOT NULL,
+    rules TEXT NOT NULL,
+    deps TEXT NOT NULL,
+    digest TEXT NOT NULL
+);
+"""
+
+# code whose changes alter rewritten output
+_CODE = (
+    "processor",
+    "core/pathutils.py",
+    "core/urlfilter.py",
+    "core/adblock.py",
+    "core/hostlist.py",
+    "downloader/assets.py",
+)
+_SETTINGS = (
+    "BASE_URL",
+    "FOLDER_MAPPING",
+    "IGNORED_PREFIXES",
+    "BLACKLIST_PARAMS",
+    "TRACKER_PATTERNS",
+    "AD_HOSTS",
+    "AD_ALLOW_HOSTS",
+    "SLUG_MAX_LEN",
+    "HTML_OPTIMIZE",
+    "SHARED_CHROME",
+)
+
+
+def raw_hash(body: bytes, url: str = "") -> str:
+    """
+    The page as fetched (relative links resolve against its final URL).
+    Hashes the undecoded body, so an unchanged page is never decoded.
+    """
+    h = hashlib.sha1(url.encode("utf-8", "surrogatepass") + b"\0")
+    h.update(body)
+    return h.hexdigest()
+
+
+def rules_version() -> str:
+    """Hash of the rewriting code, the output-shaping settings and hosts.bin."""
+    h = hashlib.sha1()
+    base = Path(__file__).resolve().parents[1]
+    for entry in _CODE:
+        p = base / entry
+        files = sorted(p.rglob("*.py")) if p.is_dir() else [p]
+        for f in files:
+            h.update(f.relative_to(base).as_posix().encode())
+            h.update(f.read_bytes())
+    for name in _SETTINGS:
+        value = getattr(settings, name, None)
+        if isinstance(value, (set, frozenset)):
+            value = sorted(value)
+        h.update(json.dumps([name, value], sort_keys=True, default=str).encode())
+    # the downloaded blocklists are not in AD_HOSTS: use what they compiled to
+    h.update(read_signature(Path(settings.BACKUP_ROOT) / "hosts.bin") or b"")
+    return h.hexdigest()
+
+
+def links_digest(state: State, links: list[str]) -> str:
+    """What the page's internal links resolve to right now."""
+    h = hashlib.sha1()
+    for key in links:
+        rec = state.urls.get(redirects.resolve(key))
+        h.update(f"{key}\0{rec[REL] if rec else ''}\n".encode())
+    return h.hexdigest()
+
+
+def _assets_present(state: State, urls: list[str]) -> bool:
+    return all(
+        state.get_asset(url) or is_blocked_host(urlparse(url).netloc) for url in urls
+    )
+
+
+class RewriteCache:
+    def __init__(self, root: str | Path):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(
+            str(self.root / "rewrite_cache.sqlite"), timeout=30, isolation_level=None
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self.rules = rules_version()
+        self.hits = 0
+        self.misses = 0
+
+    def fresh(self, path: str, raw: str, state: State, out: str | Path) -> bool:
+        """True if the output file for `path` is still what a rewrite would produce."""
+        row = self._db.execute(
+            "SELECT raw, rules, deps, digest FROM pages WHERE path=?", (path,)
+        ).fetchone()
+        ok = False
+        if row is not None and row[0] == raw and row[1] == self.rules:
+            deps = json.loads(row[2])
+            ok = (
+                links_digest(state, deps["links"]) == row[3]
+                and _assets_present(state, deps["assets"])
+                and file_exists(out)
+            )
+        if ok:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return ok
+
+    def store(self, path: str, raw: str, state: State, deps: dict):
+        kept = {"links": deps["links"], "assets": deps["assets"]}
+        self._db.execute(
+            "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?)",
+            (
+                path,
+                raw,
+                self.rules,
+                json.dumps(kept),
+                links_digest(state, deps["links"]),
+            ),
+        )
+
+    def relinked(self, path: str, state: State):
+        """The page's links were brought up to date in place (relink)."""
+        row = self._db.execute(
+            "SELECT deps FROM pages WHERE path=?", (path,)
+        ).fetchone()
+        if row is not None:
+            digest = links_digest(state, json.loads(row[0])["links"])
+            self._db.execute("UPDATE pages SET digest=? WHERE path=?", (digest, path))
+
+    def forget(self, path: str):
+        self._db.execute("DELETE FROM pages WHERE path=?", (path,))
+
+    def close(self):
+        self._db.close()
+
+
+_caches: dict[str, RewriteCache] = {}
+
+
+def open_cache(root: str | Path) -> RewriteCache:
+    """One RewriteCache per backup folder and process."""
+    key = os.path.abspath(root)
+    if key not in _caches:
+        _caches[key] = RewriteCache(key)
+    return _caches[key]
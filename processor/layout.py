@@ -0,0 +1,157 @@
+"""
+Convert a saved mirror, in place, to the current `sharding` layout.
+
+Every page record is moved to shard_rel() of its REL (flat -> sharded,
+sharded -> flat, or between modes). Saved pages hold page-relative links,
+so each page's href/src attributes and url(...) references are re-based:
+a reference that resolves to a file of the mirror is pointed at that
+file's new place from the page's new folder. Other references (external
+URLs, fragments, links to pages never downloaded) are left as they are.
+The link index and rewrite cache follow along, so relink and re-runs keep
+working. Shared-chrome fragments keep the links of the folder depth they
+were cut at; they are rebuilt as pages are re-downloaded.
+
+A migration that is interrupted can simply be run again: a page already
+at its new place is not rewritten twice.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import posixpath
+import re
+from pathlib import Path
+
+from core.pathutils import rel_to_abs, shard_rel
+from core.state import REL, State
+from processor.rewrite.links import rel_href
+from utils.files import safe_file_read, safe_file_write
+
+# (before, reference, after)
+ATTR_RE = re.compile(r"""(\b(?:href|src)=["'])([^"'<>]*)(["'])""", re.I)
+CSS_URL_RE = re.compile(r"""(url\(\s*["']?)([^"'()&\s]+)(["']?\s*\))""", re.I)
+SKIP_RE = re.compile(r"^(?:[a-z][a-z0-9+.-]*:|//|/|#)", re.I)  # scheme, absolute
+CHUNK = 64  # pages read/rewritten/written concurrently
+
+
+class Rebaser:
+    """Re-bases page-relative references after pages moved (`moves`)."""
+
+    def __init__(self, moves: dict[str, str], known: set[str]):
+        self.moves = moves
+        self.known = known  # RELs of pages, before and after
+        self._exists: dict[str, bool] = {}
+
+    def _is_file(self, rel: str) -> bool:
+        if rel in self.known:
+            return True
+        hit = self._exists.get(rel)
+        if hit is None:
+            hit = self._exists[rel] = os.path.isfile(rel_to_abs(rel))
+        return hit
+
+    def href(self, value: str, old_dir: str, new_dir: str) -> str:
+        """`value`, written in folder `old_dir`, as seen from `new_dir`."""
+        if not value or SKIP_RE.match(value):
+            return value
+        cut = min((i for i in map(value.find, "?#") if i >= 0), default=len(value))
+        path, tail = value[:cut], value[cut:]
+        if not path:
+            return value
+        target = posixpath.normpath(posixpath.join(old_dir, path))
+        if path.endswith("/") or path in (".", ".."):
+            target = posixpath.normpath(posixpath.join(target, "index.html"))
+        if target == ".." or target.startswith("../"):
+            return value  # outside the mirror
+        new = self.moves.get(target)
+        if new is None:
+            if old_dir == new_dir or not self._is_file(target):
+                return value
+            new = target
+        return rel_href(new, new_dir, rel_to_abs(new_dir)) + tail
+
+    def page(self, text: str, old_dir: str, new_dir: str) -> tuple[str, int]:
+        """Re-base every reference in a saved page; returns (text, changed)."""
+        changed = 0
+
+        def sub(m):
+            nonlocal changed
+            new = self.href(m.group(2), old_dir, new_dir)
+            if new == m.group(2):
+                return m.group(0)
+            changed += 1
+            return m.group(1) + new + m.group(3)
+
+        text = ATTR_RE.sub(sub, text)
+        text = CSS_URL_RE.sub(sub, text)
+        return text, changed
+
+
+def _prune(folder: Path, stop: Path):
+    """Remove `folder` and its parents below `stop` while they are empty."""
+    while folder != stop and stop in folder.parents:
+        try:
+            folder.rmdir()
+        except OSError:
+            return
+        folder = folder.parent
+
+
+async def _migrate_page(rb: Rebaser, old: str, new: str, stats: dict) -> bool:
+    """Move and re-base one page; True if its file changed."""
+    src, dest = Path(rel_to_abs(old)), Path(rel_to_abs(new))
+    if old != new and not src.exists():
+        return False  # moved by an interrupted run, or never saved
+    text = await safe_file_read(src)
+    if text is None:
+        return False
+    text, n = rb.page(text, posixpath.dirname(old), posixpath.dirname(new))
+    if old == new and not n:
+        return False
+    if not await safe_file_write(dest, text):
+        return False
+    stats["links"] += n
+    stats["rewritten"] += 1
+    if old != new:
+        src.unlink()
+        stats["moved"] += 1
+    return True
+
+
+async def migrate_layout(state: State, root: Path, index=None, cache=None) -> dict:
+    """
+    Move every page of `state` to the current layout and fix the links.
+    `index` (LinkIndex) and `cache` (RewriteCache) are updated if given.
+    """
+    pages = [(path, rec[REL], shard_rel(rec[REL])) for path, rec in state.urls.items()]
+    moves = {old: new for _, old, new in pages if old != new}
+    known = {rel for _, old, new in pages for rel in (old, new)}
+    rb = Rebaser(moves, known)
+    stats = {"records": len(moves), "moved": 0, "rewritten": 0, "links": 0}
+    touched: list[str] = []
+
+    for i in range(0, len(pages), CHUNK):
+        chunk = pages[i : i + CHUNK]
+        done = await asyncio.gather(
+            *(_migrate_page(rb, old, new, stats) for _, old, new in chunk)
+        )
+        for (path, old, new), changed in zip(chunk, done, strict=True):
+            if changed:
+                touched.append(path)
+            if old != new:
+                state.urls[path][REL] = new  # saved or not: new files go there
+                _prune(Path(rel_to_abs(old)).parent, Path(root))
+
+    if index is not None:
+        index.rebase(
+            moves,
+            lambda href, old, new: rb.href(
+                href, posixpath.dirname(old), posixpath.dirname(new)
+            ),
+        )
+    if cache is not None:
+        for path in touched:
+            cache.relinked(path, state)
+    await state.save()
+    return stats
@@ -0,0 +1,251 @@
+"""
+Reverse link index and in-place relinking.
+
+rewrite_links turns internal anchors into page-relative hrefs, so when a
+redirect is recorded later, or a page gets (or changes) its local file,
+every page linking to it holds a stale href. link_index.sqlite (in
+BACKUP_ROOT) records, for every page written:
+
+    keys   internal link key -> what it resolved to when last written
+    pages  page key -> output file (REL)
+    edges  (key id, page id, href as written), a WITHOUT ROWID table
+
+relink() finds the keys whose resolution has changed since and rewrites
+only the matching href="..." attributes of the pages that link to them,
+straight in the saved files: nothing is fetched or parsed again. Links
+moved into shared-chrome fragments (assets/chrome) are not touched; those
+fragments are rebuilt as pages are re-downloaded.
+"""
+
+from __future__ import annotations
+
+import html
+import os
+import re
+import sqlite3
+from collections import defaultdict
+from pathlib import Path
+
+from core.pathutils import rel_to_abs
+from core.redirects import redirects
+from core.state import REL, State
+from processor.rewrite.links import local_href
+from utils.files import safe_file_read, safe_file_write
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS keys (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    rel TEXT NOT NULL,
+    dirty INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS pages (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    rel TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS edges (
+    target INTEGER NOT NULL,
+    page INTEGER NOT NULL,
+    href TEXT NOT NULL,
+    PRIMARY KEY (target, page, href)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS edges_page ON edges (page);
+"""
+
+
+def resolved(state: State, key: str) -> str:
+    """The local file `key` links to now ("" while unknown)."""
+    rec = state.urls.get(redirects.resolve(key))
+    return rec[REL] if rec else ""
+
+
+class LinkIndex:
+    def __init__(self, root: str | Path):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(
+            str(self.root / "link_index.sqlite"), timeout=30, isolation_level=None
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+
+    def _key_id(self, key: str, rel: str) -> int:
+        # another page written earlier may hold an older resolution: dirty
+        return self._db.execute(
+            "INSERT INTO keys (key, rel) VALUES (?, ?) ON CONFLICT (key) DO UPDATE"
+            " SET dirty = dirty OR rel != excluded.rel, rel = excluded.rel"
+            " RETURNING id",
+            (key, rel),
+        ).fetchone()[0]
+
+    def record(self, path: str, rel: str, hrefs, state: State):
+        """Page `path`, saved at REL `rel`, links (key, href) pairs."""
+        db = self._db
+        db.execute("BEGIN")
+        try:
+            page = db.execute(
+                "INSERT INTO pages (path, rel) VALUES (?, ?) ON CONFLICT (path)"
+                " DO UPDATE SET rel = excluded.rel RETURNING id",
+                (path, rel),
+            ).fetchone()[0]
+            db.execute("DELETE FROM edges WHERE page=?", (page,))
+            db.executemany(
+                "INSERT OR IGNORE INTO edges VALUES (?, ?, ?)",
+                [
+                    (self._key_id(key, resolved(state, key)), page, href)
+                    for key, href in hrefs
+                ],
+            )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    def rebase(self, moves: dict[str, str], translate):
+        """
+        Follow a layout migration (processor.layout): pages and resolutions
+        move from REL to moves[REL], and every page's hrefs become
+        translate(href, old page REL, new page REL), as in the saved files.
+        """
+        db = self._db
+        db.execute("BEGIN")
+        try:
+            for page, rel in db.execute("SELECT id, rel FROM pages").fetchall():
+                new = moves.get(rel, rel)
+                edges = db.execute(
+                    "SELECT target, href FROM edges WHERE page=?", (page,)
+                ).fetchall()
+                db.execute("DELETE FROM edges WHERE page=?", (page,))
+                db.executemany(
+                    "INSERT OR IGNORE INTO edges VALUES (?, ?, ?)",
+                    [(kid, page, translate(href, rel, new)) for kid, href in edges],
+                )
+                db.execute("UPDATE pages SET rel=? WHERE id=?", (new, page))
+            for kid, rel in db.execute("SELECT id, rel FROM keys").fetchall():
+                if rel in moves:
+                    db.execute("UPDATE keys SET rel=? WHERE id=?", (moves[rel], kid))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    def stale(self, state: State) -> list[tuple[int, str, str]]:
+        """(id, key, current resolution) of every key to relink."""
+        out = []
+        for kid, key, rel, dirty in self._db.execute(
+            "SELECT id, key, rel, dirty FROM keys"
+        ):
+            now = resolved(state, key)
+            if dirty or now != rel:
+                out.append((kid, key, now))
+        return out
+
+    def close(self):
+        self._db.close()
+
+
+_indexes: dict[str, LinkIndex] = {}
+
+
+def open_index(root: str | Path) -> LinkIndex:
+    """One LinkIndex per backup folder and process."""
+    key = os.path.abspath(root)
+    if key not in _indexes:
+        _indexes[key] = LinkIndex(key)
+    return _indexes[key]
+
+
+def _new_href(key: str, old: str, cur_dir: str, state: State) -> str | None:
+    href = local_href(key, cur_dir, state)
+    if href is None:
+        return None
+    frag = old.find("#")
+    return href + old[frag:] if frag >= 0 else href
+
+
+def _swap_href(text: str, old: str, new: str) -> tuple[str, int]:
+    """Replace href="old" (either quote, HTML-escaped) by new."""
+    pattern = r"""(\bhref=)(["'])%s\2""" % re.escape(html.escape(old, False))
+    value = html.escape(new, False)
+    return re.subn(
+        pattern, lambda m: f"{m.group(1)}{m.group(2)}{value}{m.group(2)}", text
+    )
+
+
+def _patch(text: str, links: list, cur_dir: str, state: State):
+    """
+    Point the page's hrefs to changed keys at their current files. Returns
+    (text, [(key id, old href, new href)], hrefs replaced).
+    """
+    moved, hrefs = [], 0
+    for kid, key, old in links:
+        new = _new_href(key, old, cur_dir, state)
+        if new is None or new == old:
+            continue
+        text, n = _swap_href(text, old, new)
+        if n:
+            hrefs += n
+            moved.append((kid, old, new))
+    return text, moved, hrefs
+
+
+def _repoint_edges(db, page: int, moved: list):
+    db.execute("BEGIN")
+    try:
+        for kid, old, new in moved:
+            db.execute(
+                "DELETE FROM edges WHERE target=? AND page=? AND href=?",
+                (kid, page, old),
+            )
+            db.execute("INSERT OR IGNORE INTO edges VALUES (?, ?, ?)", (kid, page, new))
+        db.execute("COMMIT")
+    except BaseException:
+        db.execute("ROLLBACK")
+        raise
+
+
+async def relink(state: State, index: LinkIndex, cache=None) -> dict:
+    """
+    Bring the hrefs of every page that links to a changed key up to date,
+    in place. `cache` (a RewriteCache) is told, so relinked pages stay fresh.
+    """
+    db = index._db
+    stale = index.stale(state)
+    by_page: dict[int, list[tuple[int, str, str]]] = defaultdict(list)
+    for kid, key, _ in stale:
+        for page, href in db.execute(
+            "SELECT page, href FROM edges WHERE target=?", (kid,)
+        ):
+            by_page[page].append((kid, key, href))
+
+    stats = {"keys": len(stale), "pages": 0, "hrefs": 0}
+    failed: set[int] = set()  # keys left stale for the next relink
+    for page, links in by_page.items():
+        path, rel = db.execute(
+            "SELECT path, rel FROM pages WHERE id=?", (page,)
+        ).fetchone()
+        out = rel_to_abs(rel)
+        text = await safe_file_read(out)
+        if text is None:
+            # not readable now (e.g. remote sink down): retry next relink
+            failed.update(kid for kid, _, _ in links)
+            continue
+        text, moved, hrefs = _patch(text, links, os.path.dirname(out), state)
+        stats["hrefs"] += hrefs
+        if not moved:
+            continue
+        if not await safe_file_write(out, text):
+            failed.update(kid for kid, _, _ in moved)
+            continue
+        stats["pages"] += 1
+        _repoint_edges(db, page, moved)
+        if cache is not None:
+            cache.relinked(path, state)
+
+    db.executemany(
+        "UPDATE keys SET rel=?, dirty=0 WHERE id=?",
+        [(now, kid) for kid, _, now in stale if kid not in failed],
+    )
+    return stats
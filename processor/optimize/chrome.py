@@ -0,0 +1,223 @@
+"""
+Shared-template extraction: store the forum chrome once, not once per page.
+
+Header, navigation, sidebar and footer come out of the theme identical on
+every page. With `shared_chrome.enabled`, process_html hands each page to
+the run's ChromeExtractor, which:
+
+* hashes the elements near the top of <body> (down to MAX_DEPTH levels)
+  and counts on how many pages each one appears
+* once a block has been seen on `min_pages` pages, writes it to
+  assets/chrome/<hash>.js and replaces it in every later page with a
+  <script src> that document.write()s it back in place. Links in the block
+  are already relative to the page, so pages in other folders hash
+  differently and get their own copy.
+* moves repeated inline <style> (without url()/@import, whose paths
+  would change meaning) and inline <script> into assets/chrome .css/.js
+  files
+
+Pages written before a block reached `min_pages` keep it inline. A block
+can hold asset paths that are still downloading; extract() reports the
+fragments a page uses, so the asset queue reconciles them with the page.
+Fragments are named by content, so re-runs and parallel processes reuse the
+same files. Per-page sizes go to assets/chrome/index.sqlite for
+chrome_report().
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+from collections import Counter
+from pathlib import Path
+
+from bs4 import BeautifulSoup, Tag
+
+import config.settings as settings
+from processor.optimize.htmlmin import JS_TYPES
+from processor.optimize.htmlmin import run as optimize_html
+from utils.files import file_exists, safe_file_write
+
+MAX_DEPTH = 6  # levels below <body> considered for whole-block extraction
+SKIP_TAGS = {"script", "style", "noscript", "template"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    page TEXT PRIMARY KEY,
+    bytes INTEGER NOT NULL,
+    saved INTEGER NOT NULL
+);
+"""
+
+
+def _sha(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:20]
+
+
+class ChromeExtractor:
+    def __init__(self, root: str | Path, min_pages: int = 3, min_bytes: int = 1024):
+        self.root = Path(root)
+        self.dir = self.root / "assets" / "chrome"
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.min_pages = max(1, min_pages)
+        self.min_bytes = min_bytes
+        self.seen: Counter = Counter()  # block hash -> pages (this process)
+        self.shared: dict[str, int] = {}  # fragment name -> its size in bytes
+        self._db = sqlite3.connect(
+            str(self.dir / "index.sqlite"), timeout=30, isolation_level=None
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+
+    # ----- detection -----
+    def _is_shared(self, name: str) -> bool:
+        if name in self.shared:
+            return True
+        return self.seen[name] >= self.min_pages or file_exists(self.dir / name)
+
+    def _count(self, name: str, counted: set[str]):
+        if name not in counted:
+            counted.add(name)
+            self.seen[name] += 1
+
+    def _blocks(self, soup: BeautifulSoup) -> list[tuple[Tag, str]]:
+        """Candidate elements, pre-order, with their fragment names."""
+        out: list[tuple[Tag, str]] = []
+
+        def walk(el: Tag, depth: int):
+            for child in el.find_all(recursive=False):
+                if child.name in SKIP_TAGS:
+                    continue
+                html = str(child)
+                if len(html) < self.min_bytes:
+                    continue
+                out.append((child, _sha(html) + ".js"))
+                if depth < MAX_DEPTH:
+                    walk(child, depth + 1)
+
+        if soup.body is not None:
+            walk(soup.body, 1)
+        return out
+
+    def _inline(self, soup: BeautifulSoup) -> list[tuple[Tag, str]]:
+        out = []
+        for tag in soup.find_all(["style", "script"]):
+            text = tag.string
+            if not text or len(text) < self.min_bytes // 4:
+                continue
+            if tag.name == "style":
+                if "url(" in text or "@import" in text or tag.get("media"):
+                    continue
+                out.append((tag, _sha(text) + ".css"))
+            elif not tag.get("src") and tag.get("type", "").lower() in JS_TYPES:
+                if tag.get("type", "").lower() == "module":
+                    continue
+                out.append((tag, _sha(text) + ".js"))
+        return out
+
+    # ----- extraction -----
+    async def extract(
+        self, soup: BeautifulSoup, page: str, fragments: list[str] | None = None
+    ) -> int:
+        """
+        Replace the shared blocks of `soup` (the page saved at `page`) by
+        references to assets/chrome. Returns the bytes moved out; the paths
+        of the block fragments used are appended to `fragments`.
+        """
+        counted: set[str] = set()
+        page_dir = os.path.dirname(page)
+        saved = 0
+
+        blocks = self._blocks(soup)
+        for _, name in blocks:
+            self._count(name, counted)
+        gone: set[int] = set()  # ids of replaced blocks (skip their descendants)
+        for el, name in blocks:
+            if any(id(p) in gone for p in el.parents) or not self._is_shared(name):
+                continue
+            body = optimize_html(str(el))
+            js = "document.write(%s);\n" % json.dumps(body).replace("</", "<\\/")
+            saved += await self._replace(soup, el, name, js, "script", page_dir)
+            gone.add(id(el))
+            if fragments is not None:
+                fragments.append(str(self.dir / name))
+
+        for tag, name in self._inline(soup):
+            self._count(name, counted)
+            if self._is_shared(name):
+                kind = "link" if name.endswith(".css") else "script"
+                saved += await self._replace(
+                    soup, tag, name, tag.string, kind, page_dir
+                )
+        return saved
+
+    async def _replace(self, soup, el: Tag, name: str, text: str, kind, page_dir):
+        size = self.shared.get(name)
+        if size is None:
+            path = self.dir / name
+            if not file_exists(path) and not await safe_file_write(path, text):
+                return 0
+            size = self.shared[name] = len(text.encode("utf-8"))
+        href = os.path.relpath(self.dir / name, page_dir).replace(os.sep, "/")
+        if kind == "link":
+            ref = soup.new_tag("link", rel="stylesheet", href=href)
+        else:
+            ref = soup.new_tag("script", src=href)
+        el.replace_with(ref)
+        return max(0, size - len(str(ref)))
+
+    def record(self, page: str, size: int, saved: int):
+        self._db.execute(
+            "INSERT OR REPLACE INTO pages VALUES (?, ?, ?)",
+            (os.path.relpath(page, self.root), size, saved),
+        )
+
+    def close(self):
+        self._db.close()
+
+
+_extractors: dict[str, ChromeExtractor] = {}
+
+
+def open_chrome(root: str | Path) -> ChromeExtractor:
+    """One ChromeExtractor per backup folder and process."""
+    key = os.path.abspath(root)
+    if key not in _extractors:
+        opts = settings.SHARED_CHROME or {}
+        _extractors[key] = ChromeExtractor(
+            key,
+            opts.get("min_pages", 3),
+            int((opts.get("min_kb") or 1) * 1024),
+        )
+    return _extractors[key]
+
+
+def chrome_report(root: str | Path) -> dict | None:
+    """
+    Size reduction from shared chrome over the whole mirror, or None when
+    the mode was never used.
+    """
+    db = Path(root) / "assets" / "chrome" / "index.sqlite"
+    if not db.exists():
+        return None
+    con = sqlite3.connect(str(db))
+    try:
+        pages, size, saved = con.execute(
+            "SELECT COUNT(*), COALESCE(SUM(bytes), 0), COALESCE(SUM(saved), 0)"
+            " FROM pages"
+        ).fetchone()
+    finally:
+        con.close()
+    fragments = [p for p in db.parent.iterdir() if p.suffix in (".js", ".css")]
+    shared = sum(p.stat().st_size for p in fragments)
+    without = size + saved
+    return {
+        "pages": pages,
+        "fragments": len(fragments),
+        "fragment_bytes": shared,
+        "bytes_saved": saved - shared,
+        "reduction": round((saved - shared) / without, 4) if without else 0.0,
+    }
@@ -0,0 +1,239 @@
+"""
+Output optimiser: the last stage of process_html.
+
+Public function
+---------------
+* run(html) -> html
+
+A single streaming pass over the serialized page (no second parse): the
+text between tags is whitespace-collapsed, comments are dropped, and
+<pre>/<textarea>/<code>/<script>/<style> bodies are copied verbatim.
+With `strip_offline` it also removes what cannot work in a mirror opened
+from disk: remote <script src>, inline analytics snippets, connection hints
+and the integrity/nonce/crossorigin attributes (which would block the
+localised, rewritten copies). `minify_inline` compacts inline CSS and,
+conservatively, inline JS.
+
+Options come from the `html_optimize` block of the settings.
+"""
+
+from __future__ import annotations
+
+import re
+
+import config.settings as settings
+
+# tags, comments, doctype / processing instructions
+TOKEN_RE = re.compile(
+    r"<!--.*?-->"
+    r"|<(/?)([a-zA-Z][\w:-]*)((?:[^>\"']|\"[^\"]*\"|'[^']*')*)>"
+    r"|<[!?][^>]*>",
+    re.S,
+)
+# only ASCII whitespace: &nbsp; (U+00A0) must survive
+WS_RE = re.compile(r"[ \t\n\r\f]+")
+
+# bodies copied as-is (<code> too: forum themes style it white-space: pre)
+VERBATIM = {"pre", "textarea", "code"}
+RAW_TEXT = {"script", "style"}
+CLOSE_RE = {name: re.compile(rf"</{name}\s*>", re.I) for name in VERBATIM | RAW_TEXT}
+# whitespace between two of these is never rendered; elsewhere a run of it
+# is kept as one space (div/li/p may be styled inline-block by the theme)
+STRUCTURAL = {
+    "html", "head", "body", "title", "meta", "link", "base", "script",
+    "style", "noscript", "table", "caption", "thead", "tbody", "tfoot",
+    "tr", "td", "th", "colgroup", "col", "select", "option", "optgroup",
+    "br",
+}  # fmt: skip
+
+# one attribute, quoted values consumed whole
+ATTR_RE = re.compile(r"""\s+([^\s=/>"']+)(?:\s*=\s*("[^"]*"|'[^']*'|[^\s"'>]+))?""")
+DROP_ATTRS = {"integrity", "nonce", "crossorigin"}
+REMOTE_RE = re.compile(r"\s*(?:https?:)?//", re.I)
+# inline snippets that only phone home
+ANALYTICS_RE = re.compile(
+    r"google-analytics\.com|googletagmanager\.com|\bgtag\(|\b_gaq\b"
+    r"|adsbygoogle|\bfbq\(|quantserve|scorecardresearch"
+)
+JS_TYPES = {"", "text/javascript", "application/javascript", "module"}
+
+# CSS gaps (whitespace and comments) and the strings they must not touch
+CSS_GAP_RE = re.compile(
+    r"""("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')|(?:[ \t\n\r\f]|/\*.*?\*/)+""", re.S
+)
+CSS_TIGHT_BEFORE = set("{};,>:(")
+CSS_TIGHT_AFTER = set("{};,>)!")
+
+
+def minify_css(css: str) -> str:
+    """Drop comments and the whitespace no CSS parser needs."""
+
+    def gap(m: re.Match) -> str:
+        if m.group(1):
+            return m.group(1)
+        s, i, j = m.string, m.start(), m.end()
+        if i == 0 or j == len(s):
+            return ""
+        if s[i - 1] in CSS_TIGHT_BEFORE or s[j] in CSS_TIGHT_AFTER:
+            return ""
+        return " "
+
+    return CSS_GAP_RE.sub(gap, css).replace(";}", "}")
+
+
+def minify_js(js: str) -> str:
+    """
+    Line-level only: indentation and blank lines go, newlines stay (so
+    automatic semicolon insertion is unaffected). Template literals may span
+    lines, so scripts with backticks are left alone.
+    """
+    if "`" in js:
+        return js
+    lines = (line.strip() for line in js.splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def _attr(attrs: str, name: str) -> str | None:
+    for m in ATTR_RE.finditer(attrs):
+        if m.group(1).lower() == name:
+            value = m.group(2) or ""
+            return value[1:-1] if value[:1] in "\"'" and value else value
+    return None
+
+
+def _edit_attrs(attrs: str, strip: bool, inline: bool) -> str:
+    def one(m: re.Match) -> str:
+        name = m.group(1).lower()
+        if strip and name in DROP_ATTRS:
+            return ""
+        value = m.group(2)
+        if inline and name == "style" and value and value[0] in "\"'":
+            head = m.group(0)[: m.start(2) - m.start()]
+            q = value[0]
+            return f"{head}{q}{minify_css(value[1:-1]).rstrip(';')}{q}"
+        return m.group(0)
+
+    return ATTR_RE.sub(one, attrs)
+
+
+def _maybe_drop(attrs: str) -> bool:
+    """Cheap pre-check before tokenising the attributes."""
+    return "integrity" in attrs or "nonce" in attrs or "crossorigin" in attrs
+
+
+def _remote_hint(attrs: str) -> bool:
+    rels = set((_attr(attrs, "rel") or "").lower().split())
+    if rels & {"preconnect", "dns-prefetch"}:
+        return True
+    href = _attr(attrs, "href") or ""
+    return bool(rels & {"preload", "prefetch"}) and bool(REMOTE_RE.match(href))
+
+
+class _Output:
+    """The minified page so far, and the whitespace waiting to be placed."""
+
+    def __init__(self):
+        self.parts: list[str] = []
+        self.prev_block = True  # start of document
+        self.gap = False  # whitespace seen since the last emitted token
+
+    def flush(self, block: bool):
+        if self.gap and not (self.prev_block and block):
+            self.parts.append(" ")
+        self.gap = False
+
+    def text(self, raw: str):
+        text = WS_RE.sub(" ", raw)
+        if text == " ":
+            self.gap = True
+            return
+        if text[0] == " ":
+            self.gap = True
+            text = text[1:]
+        self.flush(False)
+        if text[-1] == " ":
+            self.gap = True
+            text = text[:-1]
+        self.parts.append(text)
+        self.prev_block = False
+
+    def token(self, token: str, block: bool):
+        self.flush(block)
+        self.parts.append(token)
+        self.prev_block = block
+
+    def result(self) -> str:
+        self.flush(True)
+        return "".join(self.parts)
+
+
+def _raw_element(tag: str, attrs: str, body: str, strip: bool, inline: bool):
+    """A <script>/<style>/verbatim element as emitted; None drops it."""
+    name = tag.lower()
+    if strip and name == "script":
+        src = _attr(attrs, "src")
+        if src and REMOTE_RE.match(src) or ANALYTICS_RE.search(body):
+            return None
+    if strip or inline:
+        attrs = _edit_attrs(attrs, strip, inline)
+    if inline and body.strip():
+        if name == "style":
+            body = minify_css(body)
+        elif name == "script" and (_attr(attrs, "type") or "").lower() in JS_TYPES:
+            body = minify_js(body)
+    return f"<{tag}{attrs}>{body}</{tag}>"
+
+
+def _start_tag(m: re.Match, strip: bool, inline: bool) -> str | None:
+    """An opening tag with attributes as emitted; None drops it."""
+    tag, attrs = m.group(2), m.group(3)
+    if strip and tag.lower() == "link" and _remote_hint(attrs):
+        return None
+    if (strip and _maybe_drop(attrs)) or (inline and "style" in attrs):
+        return f"<{tag}{_edit_attrs(attrs, strip, inline)}>"
+    return m.group(0)
+
+
+def minify(html: str, strip_offline: bool = True, inline: bool = False) -> str:
+    """One left-to-right pass; see the module docstring for what changes."""
+    out = _Output()
+    pos, n = 0, len(html)
+    while pos < n:
+        m = TOKEN_RE.search(html, pos)
+        end = m.start() if m else n
+        if end > pos:
+            out.text(html[pos:end])
+        if m is None:
+            break
+        pos = m.end()
+        name = (m.group(2) or "").lower()
+        if not name:
+            if not m.group(0).startswith("<!--"):
+                out.flush(True)
+                out.parts.append(m.group(0))  # doctype
+            continue
+        closing, attrs = m.group(1), m.group(3)
+        if not closing and name in CLOSE_RE:
+            close = CLOSE_RE[name].search(html, pos)
+            body = html[pos : close.start() if close else n]
+            pos = close.end() if close else n
+            token = _raw_element(m.group(2), attrs, body, strip_offline, inline)
+        elif attrs and not closing:
+            token = _start_tag(m, strip_offline, inline)
+        else:
+            token = m.group(0)
+        if token is not None:
+            out.token(token, name in STRUCTURAL)
+    return out.result()
+
+
+def run(html: str) -> str:
+    """Optimiser hook called by process_html on the final HTML."""
+    opts = settings.HTML_OPTIMIZE or {}
+    if not opts.get("enabled", True):
+        return html
+    return minify(
+        html,
+        strip_offline=opts.get("strip_offline", True),
+        inline=opts.get("minify_inline", False),
+    )
@@ -1,36 +1,66 @@
 """
-Coordinate HTML rewriting: assets, links, future optimizations.
+Coordinate HTML rewriting: assets, links, shared chrome, output optimisation.
 """
 
-import pathlib
+from __future__ import annotations
 
 from bs4 import BeautifulSoup
 
+import config.settings as settings
 from core.pathutils import url_to_local_path
 from core.state import State
 from downloader.assets import AssetManager
-from processor.rewrite.assets import _rewrite_body_assets, _rewrite_head
+from processor.optimize.chrome import open_chrome
+from processor.optimize.htmlmin import run as optimize_html
+from processor.rewrite.assets import rewrite_assets
 from processor.rewrite.links import rewrite_links
 
 
-async def process_html(page_url: str, html: str, fetcher, state: State) -> str:
+async def process_html(
+    page_url: str,
+    html: str,
+    fetcher,
+    state: State,
+    out_path: str | None = None,
+    assets=None,
+    deps: dict | None = None,
+) -> str:
     """
     • Parse HTML with BeautifulSoup
-    • Localise head assets, body assets
+    • Localise head assets, body assets through `assets`, the run's
+      AssetManager (a one-off one when not given)
     • Rewrite internal anchors
-    • (Future) Pass through optimiser hook
+    • With shared_chrome enabled, move the repeated theme blocks out to
+      assets/chrome
+    • Pass the serialized page through the optimiser (htmlmin)
+
+    `deps`, when given, is filled with the internal link keys (and the hrefs
+    written for them) and asset URLs the output depends on (see
+    processor.cache and processor.linkindex).
     """
 
     soup = BeautifulSoup(html, "html.parser")
-    mgr = AssetManager(fetcher, state)
-    # rewrite head
-    await _rewrite_head(soup, page_url, mgr)
-    # rewrite body
-    await _rewrite_body_assets(soup, page_url, mgr)
+    if out_path is None:
+        out_path = url_to_local_path(page_url)
+    if assets is None:
+        assets = AssetManager(fetcher, state)
+    mgr = assets.for_page(str(out_path))
+    # rewrite head and body assets
+    await rewrite_assets(soup, page_url, mgr)
     # rewrite links
-    out_path = pathlib.Path(url_to_local_path(page_url))
-    rewrite_links(soup, str(out_path), state)
-    # future hook
-    from processor.optimize.htmlmin import run as _opt_run
-
-    return _opt_run(str(soup))
+    links = rewrite_links(soup, str(out_path), state)
+    if deps is not None:
+        deps["links"] = list(dict.fromkeys(key for key, _ in links))
+        deps["hrefs"] = list(dict.fromkeys(links))
+        deps["assets"] = mgr.urls
+    chrome = None
+    if settings.SHARED_CHROME.get("enabled"):
+        chrome = open_chrome(settings.BACKUP_ROOT)
+        fragments: list[str] = []
+        saved = await chrome.extract(soup, str(out_path), fragments)
+        for path in fragments:
+            mgr.also_in(path)  # its asset paths may still fail
+    html = optimize_html(str(soup))
+    if chrome is not None:
+        chrome.record(str(out_path), len(html.encode("utf-8")), saved)
+    return html
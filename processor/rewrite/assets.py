@@ -1,145 +1,197 @@
 """
 Download & rewrite <head> and <body>‐level external resources.
 
-Public coroutines
------------------
-* _rewrite_head(soup, page_url, asset_mgr)
-* _rewrite_body_assets(soup, page_url, asset_mgr)
-
-Both modify the BeautifulSoup object **in-place** and never return HTML text.
+Public coroutine
+----------------
+* rewrite_assets(soup, page_url, page_assets, limit)
+
+Works in three passes over the page:
+  1. collect every asset reference (stylesheets, icons, scripts, inline
+     <style>, <img>/<input>, srcset candidates, style="url(...)"),
+     dropping tracker / ad-host tags on the way
+  2. resolve the distinct URLs concurrently, at most `limit` at a time
+  3. apply the local paths, relative to the page, in one rewrite pass
+
+It modifies the BeautifulSoup object **in-place** and never returns HTML text.
 """
 
 from __future__ import annotations
 
 import asyncio
-import re
-from urllib.parse import urljoin, urlparse
+from typing import Callable
+from urllib.parse import urlparse
 
 from bs4 import BeautifulSoup
 
-from config.settings import BASE_URL
+import config.settings as settings
 from core.adblock import is_blocked_host
-from downloader.assets import AssetManager
+from core.urlfilter import SKIP, TRACKER
+from downloader.assets import PageAssets
+from processor.rewrite.css import css_refs, rewrite_css
 
 # ───────────────────────── helpers ──────────────────────────
-CSS_URL_RE = re.compile(r"url\\(['\\\"]?(.*?)['\\\"]?\\)")
 IMG_TAGS = ("img", "input")  # tags that normally carry 'src'
 
-
-async def _download_and_replace(tag, attr, mgr: AssetManager):
-    url = urljoin(BASE_URL, tag[attr])
-    rep = await mgr.fetch(url, "images")
-    if rep:
-        tag[attr] = rep
+# url -> page-relative local path, for the URLs that were localised
+Resolved = dict[str, str]
 
 
-# ───────────────────────── <head> ───────────────────────────
-async def _rewrite_head(soup: BeautifulSoup, page_url: str, mgr: AssetManager):
+def _asset_url(href: str, base: str | None = None) -> str | None:
     """
-    Rewrite <head> resources: stylesheets, icons, scripts, inline styles.
-    Delegates to helper functions for clarity and testability.
+    Absolute URL for an asset reference, or None when it must not be fetched
+    (data:/javascript: URIs, tracker patterns).
     """
-    head = soup.head
-    if not head:
-        return
-
-    await _handle_link_tags(head, mgr)
-    await _handle_head_scripts(head, mgr)
-    await _handle_inline_styles(head, page_url, mgr)
+    v = settings.URL_FILTER.classify(href, base)
+    if v.kind in (SKIP, TRACKER):
+        return None
+    return v.url
+
+
+class _Collector:
+    """Asset URLs wanted by one page, and the edits to make once resolved."""
+
+    def __init__(self, page_url: str):
+        self.page_url = page_url
+        self.wanted: dict[str, str] = {}  # url -> kind hint (first one wins)
+        self.fixes: list[Callable[[Resolved], None]] = []
+
+    def want(self, url: str, kind: str):
+        self.wanted.setdefault(url, kind)
+
+    def attr(self, tag, attr: str, kind: str, drop_blocked: bool = False):
+        """Localise tag[attr]; trackers (and blocked hosts) remove the tag."""
+        v = settings.URL_FILTER.classify(tag[attr], self.page_url)
+        if v.kind == SKIP:
+            return
+        if v.kind == TRACKER or (
+            drop_blocked and is_blocked_host(urlparse(v.url).netloc.lower())
+        ):
+            tag.decompose()
+            return
+        url = v.url
+        self.want(url, kind)
+
+        def fix(res: Resolved):
+            if url in res:
+                tag[attr] = res[url]
+
+        self.fixes.append(fix)
+
+    def css(self, css: str, kind: str, set_css: Callable[[str], None]):
+        """Localise the url()/@import references of a CSS snippet."""
+        refs = {}
+        for orig, is_import in css_refs(css):
+            url = _asset_url(orig, self.page_url)
+            if url:
+                refs[orig] = url
+                self.want(url, "css" if is_import else kind)
+        if not refs:
+            return
+
+        def fix(res: Resolved):
+            mapping = {o: res[u] for o, u in refs.items() if u in res}
+            if mapping:
+                set_css(rewrite_css(css, mapping))
+
+        self.fixes.append(fix)
+
+    def srcset(self, tag):
+        parts = []
+        for part in tag["srcset"].split(","):
+            bits = part.split()
+            url = _asset_url(bits[0], self.page_url) if bits else None
+            if url:
+                self.want(url, "images")
+            parts.append((part, bits[0] if bits else "", url))
+
+        def fix(res: Resolved):
+            tag["srcset"] = ",".join(
+                p.replace(orig, res[u], 1) if u in res else p for p, orig, u in parts
+            )
+
+        self.fixes.append(fix)
 
 
-async def _handle_link_tags(head: BeautifulSoup, mgr: AssetManager):
+# ───────────────────────── <head> ───────────────────────────
+def _collect_head(head, c: _Collector):
     """
-    Process <link> tags in <head>: stylesheets, preload/prefetch, icons.
+    <head> resources: stylesheets, preload/prefetch, icons, scripts,
+    inline styles.
     """
     for link in head.find_all("link", href=True):
         rels = {r.lower() for r in link.get("rel", [])}
-        href = urljoin(BASE_URL, link["href"])
-        host = urlparse(href).netloc.lower()
-        if is_blocked_host(host):
-            link.decompose()
-            continue
-
         if "stylesheet" in rels:
-            repl = await mgr.fetch(href, "css")
-            if repl:
-                link["href"] = repl
-
+            kind = "css"
         elif rels & {"preload", "prefetch"}:
-            repl = await mgr.fetch(href, "misc")
-            if repl:
-                link["href"] = repl
-
+            kind = "misc"
         elif "icon" in rels:
-            repl = await mgr.fetch(href, "images")
-            if repl:
-                link["href"] = repl
-
-
-async def _handle_head_scripts(head: BeautifulSoup, mgr: AssetManager):
-    """
-    Process <script src="…"> tags in <head>.
-    """
-    for script in head.find_all("script", src=True):
-        src_abs = urljoin(BASE_URL, script["src"])
-        if is_blocked_host(urlparse(src_abs).netloc.lower()):
-            script.decompose()
+            kind = "images"
+        else:
+            kind = None
+        if kind is None:
+            # still drop tracker / ad links, leave the rest alone
+            v = settings.URL_FILTER.classify(link["href"], c.page_url)
+            if v.kind == TRACKER or (
+                v.kind != SKIP and is_blocked_host(urlparse(v.url).netloc.lower())
+            ):
+                link.decompose()
             continue
-        repl = await mgr.fetch(src_abs, "js")
-        if repl:
-            script["src"] = repl
+        c.attr(link, "href", kind, drop_blocked=True)
 
+    for script in head.find_all("script", src=True):
+        c.attr(script, "src", "js", drop_blocked=True)
 
-async def _handle_inline_styles(head: BeautifulSoup, page_url: str, mgr: AssetManager):
-    """
-    Process inline <style> tags: find font URLs and download them.
-    """
     for style in head.find_all("style"):
-        if not style.string:
-            continue
-        css = style.string
-        for orig in CSS_URL_RE.findall(css):
-            abs_u = urljoin(page_url, orig)
-            repl = await mgr.fetch(abs_u, "fonts")
-            if repl:
-                css = css.replace(orig, repl)
-        style.string.replace_with(css)
+        if style.string:
+            c.css(style.string, "fonts", style.string.replace_with)
 
 
 # ────────────────────── <body> & inline ─────────────────────
-async def _rewrite_body_assets(soup: BeautifulSoup, page_url: str, mgr: AssetManager):
+def _collect_body(soup: BeautifulSoup, c: _Collector):
     # <img>, <input type="image">
-    await asyncio.gather(
-        *[
-            _download_and_replace(tag, "src", mgr)
-            for tag in soup.find_all(IMG_TAGS, src=True)
-        ]
-    )
-
-    # <script src> inside body
-    await asyncio.gather(
-        *[
-            _download_and_replace(script, "src", mgr)
-            for script in soup.find_all("script", src=True)
-        ]
-    )
-
+    for tag in soup.find_all(IMG_TAGS, src=True):
+        c.attr(tag, "src", "images")
+    # <script src> outside <head>
+    for script in soup.find_all("script", src=True):
+        if script.find_parent("head") is None:
+            c.attr(script, "src", "js")
     # <source srcset="a.jpg 1x, b.jpg 2x">
     for src in soup.find_all("source", srcset=True):
-        newset = []
-        for part in src["srcset"].split(","):
-            url = part.split()[0]
-            repl = await mgr.fetch(urljoin(BASE_URL, url), "images")
-            if repl:
-                newset.append(part.replace(url, repl))
-        if newset:
-            src["srcset"] = ",".join(newset)
-
+        c.srcset(src)
     # inline style="background:url(...)"
     for tag in soup.find_all(style=True):
-        style = tag["style"]
-        for orig in CSS_URL_RE.findall(style):
-            repl = await mgr.fetch(urljoin(page_url, orig), "images")
-            if repl:
-                style = style.replace(orig, repl)
-        tag["style"] = style
+        c.css(
+            tag["style"], "images", lambda css, tag=tag: tag.__setitem__("style", css)
+        )
+
+
+async def _resolve(wanted: dict[str, str], mgr: PageAssets, limit: int) -> Resolved:
+    sem = asyncio.Semaphore(max(1, limit))
+
+    async def one(url: str, kind: str):
+        async with sem:
+            return url, await mgr.fetch(url, kind)
+
+    done = await asyncio.gather(*(one(u, k) for u, k in wanted.items()))
+    return {url: mgr.href(rel) for url, rel in done if rel}
+
+
+async def rewrite_assets(
+    soup: BeautifulSoup, page_url: str, mgr: PageAssets, limit: int | None = None
+) -> int:
+    """
+    Localise every asset the page references. Returns how many distinct
+    asset URLs were resolved to local files.
+    """
+    c = _Collector(page_url)
+    if soup.head:
+        _collect_head(soup.head, c)
+    _collect_body(soup, c)
+    if not c.wanted:
+        return 0
+    if limit is None:
+        limit = getattr(settings, "ASSET_CONCURRENCY", 16)
+    resolved = await _resolve(c.wanted, mgr, limit)
+    for fix in c.fixes:
+        fix(resolved)
+    return len(resolved)
@@ -0,0 +1,51 @@
+"""
+CSS reference helpers shared by stylesheet localisation and inline styles.
+
+* css_refs(css)               -> [(ref, is_import), ...] in order, unique
+* rewrite_css(css, mapping)   -> css with every ref in `mapping` replaced
+"""
+
+from __future__ import annotations
+
+import re
+
+# url(x), url('x'), url("x")
+CSS_URL_RE = re.compile(r"""url\(\s*(['"]?)([^'")]*?)\1\s*\)""", re.I)
+# @import "x" / @import 'x' (the url() form is matched by CSS_URL_RE)
+CSS_IMPORT_RE = re.compile(r"""@import\s+(['"])([^'"]+)\1""", re.I)
+CSS_IMPORT_URL_RE = re.compile(r"""@import\s+url\(\s*(['"]?)([^'")]*?)\1\s*\)""", re.I)
+
+FONT_EXTS = {".woff", ".woff2", ".ttf", ".otf", ".eot"}
+
+
+def css_refs(css: str) -> list[tuple[str, bool]]:
+    """
+    Every distinct url()/@import reference in `css`, with whether it is a
+    stylesheet import.
+    """
+    imports = {m.group(2).strip() for m in CSS_IMPORT_RE.finditer(css)}
+    imports |= {m.group(2).strip() for m in CSS_IMPORT_URL_RE.finditer(css)}
+    seen: dict[str, bool] = {}
+    for m in CSS_URL_RE.finditer(css):
+        ref = m.group(2).strip()
+        if ref and ref not in seen:
+            seen[ref] = ref in imports
+    for ref in imports:
+        seen.setdefault(ref, True)
+    return list(seen.items())
+
+
+def rewrite_css(css: str, mapping: dict[str, str]) -> str:
+    """Replace the references in `mapping`, keeping their quoting."""
+    if not mapping:
+        return css
+
+    def _url(m: re.Match) -> str:
+        new = mapping.get(m.group(2).strip())
+        return m.group(0) if new is None else f"url({m.group(1)}{new}{m.group(1)})"
+
+    def _import(m: re.Match) -> str:
+        new = mapping.get(m.group(2).strip())
+        return m.group(0) if new is None else f"@import {m.group(1)}{new}{m.group(1)}"
+
+    return CSS_IMPORT_RE.sub(_import, CSS_URL_RE.sub(_url, css))
@@ -1,44 +1,104 @@
 """
 Rewrite every internal <a href> so it points to the correct local file.
+
+Pages of one folder all link into the same few folders, so the relative
+path between two folders (BACKUP_ROOT-relative) is computed once per run
+and a link becomes that prefix plus the target's file name. Within a page,
+each distinct href is classified and resolved once, however many anchors
+repeat it.
 """
 
+from __future__ import annotations
+
 import os
-from urllib.parse import urljoin, urlparse
+import posixpath
+from functools import lru_cache
 
 from bs4 import BeautifulSoup
 
-from config.settings import BASE_DOMAIN, BASE_URL
+import config.settings as settings
+from core.pathutils import rel_to_abs
 from core.redirects import redirects
 from core.state import REL, State  # index 0 in the compact record
+from core.urlfilter import EXTERNAL, SKIP, TRACKER
 
 
-def rewrite_links(soup: BeautifulSoup, cur_file: str, state: State):
-    cur_dir = os.path.dirname(cur_file)
+@lru_cache(maxsize=4096)
+def _dir_prefix(cur_dir: str, target_dir: str) -> str:
+    """'../topicos/' from 'categorias' to 'topicos' ('' for the same folder)."""
+    rel = posixpath.relpath(target_dir or ".", cur_dir or ".")
+    return "" if rel == "." else rel + "/"
 
-    for a in soup.find_all("a", href=True):
-        href = a["href"]
-        if href.startswith(("mailto:", "javascript:", "#")):
-            continue
 
-        abs_url = urljoin(BASE_URL, href)
-        base, *frag = abs_url.split("#", 1)
-        netloc = urlparse(base).netloc
-        if netloc and netloc != BASE_DOMAIN:
-            # external link: leave unchanged
-            continue
+def root_rel_dir(cur_dir: str) -> str | None:
+    """`cur_dir` relative to BACKUP_ROOT ("" for the root), None if outside."""
+    rel = os.path.relpath(cur_dir, settings.BACKUP_ROOT).replace(os.sep, "/")
+    if rel == ".." or rel.startswith("../"):
+        return None
+    return "" if rel == "." else rel
 
-        key = urlparse(base).path + (
-            f"?{urlparse(base).query}" if urlparse(base).query else ""
-        )
-        key = redirects.resolve(key)
 
-        rec = state.urls.get(key)
-        if not rec:
-            continue
-        target_file = rec[REL]
-        rel_link = os.path.relpath(target_file, cur_dir).replace(os.sep, "/")
+def rel_href(rel: str, cur_rel: str | None, cur_dir: str) -> str:
+    """Href from folder `cur_rel` (`cur_dir` on disk) to the file at REL `rel`."""
+    if cur_rel is None or os.path.isabs(rel):
+        # legacy absolute REL, or a page outside the backup: the slow way
+        rel_link = os.path.relpath(rel_to_abs(rel), cur_dir).replace(os.sep, "/")
         if rel_link.endswith("/index.html"):
-            rel_link = rel_link[: -len("index.html")] or "./"
-        if frag:
-            rel_link += "#" + frag[0]
-        a["href"] = rel_link
+            rel_link = rel_link[: -len("index.html")]
+        return rel_link
+    target_dir, _, name = rel.rpartition("/")
+    prefix = _dir_prefix(cur_rel, target_dir)
+    if name == "index.html" and prefix:
+        return prefix
+    return prefix + name
+
+
+def local_href(key: str, cur_dir: str, state: State) -> str | None:
+    """
+    Href from a page in `cur_dir` to the local file of internal `key`
+    (redirects followed), or None while the target has no record.
+    """
+    rec = state.urls.get(redirects.resolve(key))
+    if not rec:
+        return None
+    return rel_href(rec[REL], root_rel_dir(cur_dir), cur_dir)
+
+
+def rewrite_links(
+    soup: BeautifulSoup, cur_file: str, state: State
+) -> list[tuple[str, str]]:
+    """
+    Point internal anchors at their local files. Returns (key, href as
+    written) for every internal anchor, known target or not: the page's
+    output depends on what those keys resolve to (see processor.linkindex).
+    """
+    cur_dir = os.path.dirname(cur_file)
+    cur_rel = root_rel_dir(cur_dir)
+    classify = settings.URL_FILTER.classify
+    urls = state.urls
+    links: list[tuple[str, str]] = []
+    # href as found -> (key, href to write), or None for non-internal links
+    done: dict[str, tuple[str, str] | None] = {}
+
+    for a in soup.find_all("a", href=True):
+        href = a["href"]
+        hit = done.get(href, ())
+        if hit == ():
+            v = classify(href)
+            if v.kind in (SKIP, EXTERNAL, TRACKER):
+                # external link: leave unchanged
+                hit = None
+            else:
+                rec = urls.get(redirects.resolve(v.key))
+                new = href
+                if rec:
+                    new = rel_href(rec[REL], cur_rel, cur_dir)
+                    if v.fragment:
+                        new += "#" + v.fragment
+                hit = (v.key, new)
+            done[href] = hit
+        if hit is None:
+            continue
+        a["href"] = hit[1]
+        links.append(hit)
+    return links
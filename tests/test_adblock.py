@@ -0,0 +1,77 @@
+import asyncio
+import json
+import time
+
+import config.settings as settings
+from core import adblock
+from core.adblock import HOSTLINE_RE, HostMatcher
+
+
+def test_subdomains_blocked():
+    m = HostMatcher({"doubleclick.net"})
+    assert m.is_blocked("doubleclick.net")
+    assert m.is_blocked("x.y.DoubleClick.net")
+    assert not m.is_blocked("notdoubleclick.net")
+    assert not m.is_blocked("net")
+
+
+def test_allow_list_wins():
+    m = HostMatcher({"example.com"}, allowed={"img.example.com"})
+    assert m.is_blocked("ads.example.com")
+    assert not m.is_blocked("img.example.com")
+    assert not m.is_blocked("a.img.example.com")
+
+
+def test_hostline_regex():
+    assert (
+        HOSTLINE_RE.match("0.0.0.0 ads.example.com # c").group(1) == "ads.example.com"
+    )
+
+
+class _Session:
+    """Fake aiohttp session answering every GET with `status` and `headers`."""
+
+    def __init__(self, status, headers):
+        self.response = type("R", (), {"status": status, "headers": headers})()
+        self.sent: dict = {}
+
+    def get(self, url, headers):
+        self.sent = headers
+        session = self
+
+        class _Ctx:
+            async def __aenter__(self):
+                return session.response
+
+            async def __aexit__(self, *exc):
+                return False
+
+        return _Ctx()
+
+
+def test_bare_304_keeps_the_validators(tmp_path):
+    cache = tmp_path / "hosts_x.txt"
+    cache.write_text("0.0.0.0 ads.example.com\n")
+    meta = {"sha256": "s", "checked": 0, "etag": '"v1"', "last_modified": "d"}
+    cache.with_suffix(".meta.json").write_text(json.dumps(meta))
+    session = _Session(304, {})
+
+    digest = asyncio.run(
+        adblock._refresh_source(session, {"url": "http://x/hosts"}, cache)
+    )
+    assert digest == "s"
+    assert session.sent == {"If-None-Match": '"v1"', "If-Modified-Since": "d"}
+    meta = json.loads(cache.with_suffix(".meta.json").read_text())
+    assert meta["etag"] == '"v1"' and meta["last_modified"] == "d"
+    assert meta["checked"] > time.time() - 60
+
+
+def test_unreadable_host_list_falls_back_to_config(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "AD_SOURCES", [])
+    monkeypatch.setattr(settings, "AD_HOSTS", {"ads.example.com"})
+    monkeypatch.setattr(adblock.HostList, "open", lambda *a: None)
+    monkeypatch.setattr(adblock, "_matcher", None)
+
+    asyncio.run(adblock.update_hosts(tmp_path))
+    assert adblock.is_blocked_host("x.ads.example.com")
+    assert not adblock.is_blocked_host("example.org")
@@ -0,0 +1,64 @@
+import asyncio
+import zipfile
+
+from utils.archive import PackedArchive, packing, start_packing, stop_packing
+from utils.files import file_exists, is_remote, safe_file_read, safe_file_write
+
+
+def test_packed_runs_append_and_extract(tmp_root, monkeypatch):
+    monkeypatch.setattr("config.settings.PACKED_OUTPUT", {"enabled": True})
+
+    async def run(n):
+        packed = start_packing(tmp_root)
+        assert packing()
+        try:
+            await safe_file_write(tmp_root / "topicos" / f"t{n}.html", f"página {n}")
+            await safe_file_write(tmp_root / "index.html", f"home {n}")
+            await safe_file_write(
+                tmp_root / "assets" / "imagens" / "a.png", b"\x89PNG", mode="wb"
+            )
+            await safe_file_write(tmp_root / "crawl_state.json", "{}")
+            blob = tmp_root / "assets" / "objects" / "ab" / "ab.png"
+            await safe_file_write(blob, b"\x89PNG", mode="wb")  # content store
+            assert await safe_file_read(tmp_root / "index.html") == f"home {n}"
+            # local output: caches and indexes still apply
+            assert not is_remote(tmp_root / "index.html")
+            assert file_exists(tmp_root / "topicos" / f"t{n}.html")
+            assert not file_exists(tmp_root / "topicos" / "nope.html")
+            assert blob.exists()
+        finally:
+            stop_packing(packed)
+        return packed
+
+    asyncio.run(run(1))
+    packed = asyncio.run(run(2))  # a resumed run adds a part
+    assert not packing()
+    assert (tmp_root / "crawl_state.json").read_text() == "{}"  # stays on disk
+    assert not (tmp_root / "index.html").exists()
+    parts = sorted((tmp_root / "archive").glob("part-*.zip"))
+    assert len(parts) == 2
+    for part in parts:
+        with zipfile.ZipFile(part) as zf:
+            assert zf.testzip() is None
+    assert packed.report()["files"] == 4 and packed.report()["parts"] == 2
+
+    out = tmp_root / "tree"
+    assert asyncio.run(packed.extract(out)) == 4
+    assert (out / "index.html").read_text("utf-8") == "home 2"  # newest copy
+    assert (out / "topicos" / "t1.html").read_text("utf-8") == "página 1"
+    assert (out / "assets" / "imagens" / "a.png").read_bytes() == b"\x89PNG"
+
+
+def test_repair_after_crash(tmp_root):
+    crashed = PackedArchive(tmp_root)
+    crashed.put("topicos/t1.html", "x".encode() * 1000)
+    crashed.put("misc/a.html", b"a")  # never closed: no central directory
+
+    archive = PackedArchive(tmp_root)
+    assert archive.repair() == 2
+    archive.close()
+    assert not archive.part_path(1).exists()
+    with zipfile.ZipFile(archive.part_path(2)) as zf:
+        assert zf.read("topicos/t1.html") == b"x" * 1000
+    assert archive.read("misc/a.html") == b"a"
+    assert archive.report()["parts"] == 1
@@ -0,0 +1,73 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from downloader.asset_queue import AssetQueue
+
+
+class _Mgr:
+    """Fake AssetManager: per-URL scripted statuses, records call order."""
+
+    def __init__(self, statuses):
+        self.fetcher = SimpleNamespace(budget=None)
+        self.statuses = statuses
+        self.calls: list[str] = []
+
+    async def download(self, url, rel):
+        self.calls.append(url)
+        script = self.statuses[url]
+        return script.pop(0) if len(script) > 1 else script[0]
+
+
+def test_priority_retry_and_reconcile(tmp_root):
+    page = tmp_root / "topicos" / "t1.html"
+    page.parent.mkdir()
+    page.write_text(
+        '<link href="../assets/files/internal/aa.css">'
+        '<img src="../assets/imagens/internal/bb.png">'
+        '<img src="../assets/imagens/internal/cc.png">',
+        "utf-8",
+    )
+
+    async def go():
+        mgr = _Mgr({"i1": [200], "css": [503, 200], "i2": [404]})
+        q = AssetQueue(mgr, workers=1, retries=3, backoff=0)
+        # queued before the pool starts, so priority decides the order
+        assert q.put("i1", "images", "assets/imagens/internal/bb.png", str(page))
+        q.put("i2", "images", "assets/imagens/internal/cc.png", str(page))
+        q.put("css", "css", "assets/files/internal/aa.css", str(page))
+        q.put("css", "css", "assets/files/internal/aa.css", str(page))
+        q.start()
+        await q.join()
+        fixed = await q.close()
+        return mgr, q, fixed
+
+    mgr, q, fixed = asyncio.run(go())
+    assert mgr.calls == ["css", "css", "i1", "i2"]
+    assert q.done == 2 and list(q.failed) == ["i2"]
+    assert q.put("i2", "images", "x/cc.png") is None
+    assert fixed == 1
+    html = page.read_text("utf-8")
+    assert 'src="i2"' in html
+    assert "../assets/imagens/internal/bb.png" in html
+
+
+def test_reconcile_rewrites_chrome_fragments(tmp_root):
+    frag = tmp_root / "assets" / "chrome" / "abc.js"
+    frag.parent.mkdir(parents=True)
+    body = '<div class="nav"><img src="../imagens/internal/dd.png"></div>'
+    frag.write_text("document.write(%s);\n" % json.dumps(body), "utf-8")
+
+    async def go():
+        q = AssetQueue(_Mgr({"https://x/d.png": [404]}), workers=1, backoff=0)
+        q.put("https://x/d.png", "images", "assets/imagens/internal/dd.png", "p")
+        q.refer("https://x/d.png", str(frag))
+        q.start()
+        await q.join()
+        return await q.close()
+
+    assert asyncio.run(go()) == 1
+    js = frag.read_text("utf-8")
+    assert json.loads(js[len("document.write(") : -3]) == body.replace(
+        "../imagens/internal/dd.png", "https://x/d.png"
+    )
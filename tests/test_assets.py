@@ -0,0 +1,68 @@
+import asyncio
+from types import SimpleNamespace
+
+from core.state import State
+from downloader.assets import AssetManager
+from utils.archive import start_packing, stop_packing
+
+
+class _Fetcher:
+    budget = None
+
+    def __init__(self):
+        self.calls = 0
+
+    async def fetch_bytes(self, url, max_bytes=None):
+        self.calls += 1
+        return 200, b"same bytes"
+
+
+def test_shared_manager_counts_hits_and_dedupes(tmp_root, monkeypatch):
+    monkeypatch.setattr("config.settings.BACKUP_ROOT", tmp_root)
+    monkeypatch.setattr("config.settings.SHARED_ASSET_STORE", None)
+    cfg = SimpleNamespace(retry_limit=3)
+    state = State(cfg, str(tmp_root / "s.json"), str(tmp_root / "a.json"))
+    fetcher = _Fetcher()
+    mgr = AssetManager(fetcher, state)
+
+    async def go():
+        page1, page2 = mgr.for_page("p1.html"), mgr.for_page("p2.html")
+        a = await page1.fetch("http://cdn/a.png")
+        b = await page2.fetch("http://cdn/a.png?v=2")
+        again = await page2.fetch("http://cdn/a.png")
+        return a, b, again
+
+    a, b, again = asyncio.run(go())
+    assert a != b and again == a
+    assert (tmp_root / a).read_bytes() == (tmp_root / b).read_bytes()
+    assert fetcher.calls == 2
+    assert state.get_asset("http://cdn/a.png") == a
+    stats = mgr.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 2
+    assert stats["dedupes"] == 1 and stats["bytes"] == 20
+
+
+def test_packed_output_keeps_the_content_store(tmp_root, monkeypatch):
+    monkeypatch.setattr("config.settings.BACKUP_ROOT", tmp_root)
+    monkeypatch.setattr("config.settings.SHARED_ASSET_STORE", None)
+    monkeypatch.setattr("config.settings.PACKED_OUTPUT", {"enabled": True})
+    cfg = SimpleNamespace(retry_limit=3)
+    state = State(cfg, str(tmp_root / "s.json"), str(tmp_root / "a.json"))
+    mgr = AssetManager(_Fetcher(), state)
+
+    async def go():
+        archive = start_packing(tmp_root)
+        try:
+            page = mgr.for_page("p1.html")
+            return (
+                await page.fetch("http://cdn/a.png"),
+                await page.fetch("http://cdn/b.png"),
+                archive,
+            )
+        finally:
+            stop_packing(archive)
+
+    a, b, archive = asyncio.run(go())
+    assert archive.read(a) == archive.read(b) == b"same bytes"
+    assert not (tmp_root / a).exists()  # in the archive, not the folder
+    assert mgr.stats()["dedupes"] == 1
@@ -0,0 +1,35 @@
+from crawler.budget import CrawlBudget, coverage_report
+
+
+def test_discovery_share():
+    b = CrawlBudget(max_pages=10, discovery_share=0.5)
+    for _ in range(5):
+        b.charge_page(100)
+    assert b.exhausted("discover") == "pages"
+    assert b.exhausted("download") is None
+    for _ in range(5):
+        b.charge_page(100)
+    assert b.exhausted("download") == "pages"
+    assert b.reason == "pages"
+
+
+def test_asset_limit():
+    b = CrawlBudget(max_assets=1)
+    assert not b.assets_exhausted()
+    b.charge_asset(10)
+    assert b.assets_exhausted()
+
+
+def test_coverage_report():
+    class S:
+        urls = {
+            "/": ["index.html", 0, "p", 0, ""],
+            "/t1": ["t1.html", 0, "d", 0, ""],
+            "/old": ["", 1, "e", 0, ""],
+        }
+        assets = {}
+
+    r = coverage_report(S(), CrawlBudget(max_seconds=60))
+    assert r["urls"] == {"downloaded": 1, "discovered": 1, "redirect": 1}
+    assert r["missing"] == ["/t1"] and not r["complete"]
+    assert r["budget"]["limits"]["seconds"] == 60
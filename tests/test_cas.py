@@ -0,0 +1,50 @@
+import asyncio
+import os
+
+import pytest
+
+from downloader.cas import ContentStore, link_or_copy
+
+
+def test_same_bytes_stored_once(tmp_root):
+    store = ContentStore(tmp_root / "objects")
+
+    async def go():
+        a, new_a = await store.put("http://x/a.png?v=1", b"PNG", ".png")
+        b, new_b = await store.put("https://cdn/a.png", b"PNG", ".png")
+        return a, new_a, b, new_b
+
+    a, new_a, b, new_b = asyncio.run(go())
+    assert a == b and new_a and not new_b
+    assert store.lookup("https://cdn/a.png") == a
+    assert store.lookup("http://x/other.png") is None
+
+    # per-URL files are links to the blob
+    link_or_copy(a, tmp_root / "assets" / "one.png")
+    link_or_copy(a, tmp_root / "assets" / "two.png")
+    assert os.path.samefile(tmp_root / "assets" / "one.png", a)
+    assert os.stat(a).st_nlink == 3
+
+
+def test_adopt_from_shared_store(tmp_root):
+    shared = ContentStore(tmp_root / "shared")
+    local = ContentStore(tmp_root / "local")
+    blob, _ = asyncio.run(shared.put("http://theme/smile.gif", b"GIF89a", ".gif"))
+
+    hit = shared.lookup("http://theme/smile.gif")
+    mine, new = local.adopt("http://theme/smile.gif", hit)
+    assert new and mine.read_bytes() == b"GIF89a"
+    assert local.lookup("http://theme/smile.gif") == mine
+    assert local.adopt("http://theme/smile.gif", hit) == (mine, False)
+
+
+def test_failed_write_is_not_indexed(tmp_root, monkeypatch):
+    store = ContentStore(tmp_root / "objects")
+
+    async def fail(*args, **kwargs):
+        return False
+
+    monkeypatch.setattr("downloader.cas.safe_file_write", fail)
+    with pytest.raises(OSError):
+        asyncio.run(store.put("http://x/a.png", b"PNG", ".png"))
+    assert store.lookup("http://x/a.png") is None
@@ -0,0 +1,36 @@
+import pytest
+
+from core.charset import resolve
+from core.fetcher import BODY_STATS, Page
+
+LATIN = "<p>Olá, ação</p>".encode("cp1252")
+
+
+@pytest.mark.parametrize(
+    "content_type, body, want",
+    [
+        ("text/html; charset=UTF-8", b"<p>x</p>", "utf_8"),
+        ('text/html; charset="ISO-8859-1"', LATIN, "cp1252"),  # WHATWG alias
+        ("text/html", b'<meta charset="windows-1252">' + LATIN, "cp1252"),
+        (
+            None,
+            b'<meta http-equiv="Content-Type" content="text/html; charset=gb2312">',
+            "gbk",
+        ),
+        ("text/html; charset=bogus", b'<meta charset="utf-16">', "utf-8"),
+        ("text/html; charset=cp1252", b"\xef\xbb\xbf<p>x</p>", "utf-8-sig"),
+        (None, b" " * 2000 + b'<meta charset="koi8-r">', "utf-8"),  # past prescan
+    ],
+)
+def test_resolve(content_type, body, want):
+    assert resolve(content_type, body) == want
+
+
+def test_page_decodes_once():
+    before = BODY_STATS["decodes"]
+    page = Page(200, LATIN, resolve("text/html; charset=latin1", LATIN), "u")
+    assert BODY_STATS["decodes"] == before
+    assert page.text() == "<p>Olá, ação</p>"
+    assert page.text() is page.text()
+    assert BODY_STATS["decodes"] == before + 1
+    assert Page(404, None, "utf-8", "u").text() is None
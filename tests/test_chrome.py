@@ -0,0 +1,50 @@
+import asyncio
+import json
+
+from bs4 import BeautifulSoup
+
+from processor.optimize.chrome import ChromeExtractor, chrome_report
+
+HEADER = '<div id="header">' + '<a href="../index.html">Forum</a> ' * 40 + "</div>"
+STYLE = "<style>" + ".row{color:red}" * 20 + "</style>"
+
+
+def page(n: int) -> str:
+    return (
+        f"<html><head>{STYLE}</head><body><div id='wrap'>{HEADER}"
+        f"<div id='content'><p>post {n}</p></div></div></body></html>"
+    )
+
+
+def test_repeated_chrome_moves_to_shared_files(tmp_root):
+    ex = ChromeExtractor(tmp_root, min_pages=2, min_bytes=512)
+    out = tmp_root / "topicos" / "t1.html"
+    out.parent.mkdir()
+
+    async def go():
+        results = []
+        for n in range(3):
+            soup = BeautifulSoup(page(n), "html.parser")
+            saved = await ex.extract(soup, str(out))
+            ex.record(str(out.with_name(f"t{n}.html")), len(str(soup)), saved)
+            results.append((str(soup), saved))
+        return results
+
+    (first, s1), (second, s2), (third, _) = asyncio.run(go())
+    assert s1 == 0 and HEADER in first  # seen once: stays inline
+    assert s2 > 0 and HEADER not in second and "post 1" in second
+    assert second.replace("1", "2") == third.replace("1", "2")
+
+    soup = BeautifulSoup(second, "html.parser")
+    js_src = soup.body.find("script")["src"]
+    css_href = soup.head.find("link")["href"]
+    assert js_src.startswith("../assets/chrome/") and css_href.endswith(".css")
+    js = (out.parent / js_src).read_text("utf-8")
+    assert js.startswith("document.write(") and "</" not in js
+    assert json.loads(js[len("document.write(") : -3]) == HEADER
+    assert (out.parent / css_href).read_text("utf-8") == STYLE[7:-8]
+
+    ex.close()
+    report = chrome_report(tmp_root)
+    assert report["pages"] == 3 and report["fragments"] == 2
+    assert 0 < report["reduction"] < 1
@@ -0,0 +1,99 @@
+import asyncio
+from types import SimpleNamespace
+
+from core.state import State
+from core.urlfilter import UrlFilter
+from downloader.assets import AssetManager
+from processor.rewrite.css import css_refs, rewrite_css
+
+
+def test_refs_and_rewrite_keep_quoting():
+    css = (
+        '@import "theme.css";\n'
+        "@import url('print.css');\n"
+        'a { background: url( "img/bg.png" ) }\n'
+        "b { background: url(img/bg.png); src: url(data:font/woff;base64,AA) }"
+    )
+    refs = dict(css_refs(css))
+    assert refs == {
+        "print.css": True,
+        "img/bg.png": False,
+        "data:font/woff;base64,AA": False,
+        "theme.css": True,
+    }
+    out = rewrite_css(css, {"theme.css": "x.css", "img/bg.png": "../i/bg.png"})
+    assert '@import "x.css"' in out
+    assert 'url("../i/bg.png")' in out and "url(../i/bg.png)" in out
+    assert "url('print.css')" in out
+
+
+class _Fetcher:
+    budget = None
+
+    def __init__(self, files):
+        self.files = files
+        self.calls: list[str] = []
+
+    async def fetch_bytes(self, url, max_bytes=None):
+        self.calls.append(url)
+        return (200, self.files[url]) if url in self.files else (404, None)
+
+
+def test_stylesheets_localised_recursively(tmp_root, monkeypatch):
+    monkeypatch.setattr("config.settings.BACKUP_ROOT", tmp_root)
+    monkeypatch.setattr("config.settings.SHARED_ASSET_STORE", None)
+    monkeypatch.setattr(
+        "config.settings.URL_FILTER", UrlFilter("https://f.example", (), (), ())
+    )
+    files = {
+        "https://cdn.example/t/main.css": b'@import "more.css"; a{background:url(bg.png)}',
+        # imports main.css back: a cycle
+        "https://cdn.example/t/more.css": b'@import url("main.css"); b{src:url(f.woff)}',
+        "https://cdn.example/t/bg.png": b"PNG",
+        "https://cdn.example/t/f.woff": b"WOFF",
+    }
+    fetcher = _Fetcher(files)
+    state = State(
+        SimpleNamespace(retry_limit=3), str(tmp_root / "s"), str(tmp_root / "a")
+    )
+    mgr = AssetManager(fetcher, state)
+
+    rel = asyncio.run(mgr.fetch("https://cdn.example/t/main.css", "css"))
+    main = (tmp_root / rel).read_text("utf-8")
+    more_rel = state.get_asset("https://cdn.example/t/more.css")
+    more = (tmp_root / more_rel).read_text("utf-8")
+    bg = state.get_asset("https://cdn.example/t/bg.png")
+
+    assert '@import "' + more_rel.rsplit("/", 1)[1] + '"' in main
+    assert "url(../../imagens/internal/" + bg.rsplit("/", 1)[1] + ")" in main
+    assert 'url("' + rel.rsplit("/", 1)[1] + '")' in more
+    assert sorted(fetcher.calls) == sorted(files)  # each fetched once
+
+    # same bytes under another URL: served from the parsed-CSS cache
+    files["https://cdn.example/t/main.css?v=2"] = files[
+        "https://cdn.example/t/main.css"
+    ]
+    asyncio.run(mgr.fetch("https://cdn.example/t/main.css?v=2", "css"))
+    assert mgr.counters["css_cached"] == 1
+
+
+def test_extensionless_stylesheet_is_localised(tmp_root, monkeypatch):
+    monkeypatch.setattr("config.settings.BACKUP_ROOT", tmp_root)
+    monkeypatch.setattr("config.settings.SHARED_ASSET_STORE", None)
+    monkeypatch.setattr(
+        "config.settings.URL_FILTER", UrlFilter("https://f.example", (), (), ())
+    )
+    css_url = "https://fonts.googleapis.com/css?family=Roboto"
+    font = "https://fonts.gstatic.com/s/roboto.woff2"
+    fetcher = _Fetcher({css_url: b"@font-face{src:url(%s)}" % font.encode()})
+    fetcher.files[font] = b"WOFF2"
+    state = State(
+        SimpleNamespace(retry_limit=3), str(tmp_root / "s"), str(tmp_root / "a")
+    )
+    mgr = AssetManager(fetcher, state)
+
+    rel = asyncio.run(mgr.fetch(css_url, "css"))
+    assert rel.endswith(".css")
+    css = (tmp_root / rel).read_text("utf-8")
+    assert font not in css
+    assert state.get_asset(font).rsplit("/", 1)[1] in css
@@ -0,0 +1,91 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+from core.state import STA, State
+from crawler.distributed import Coordinator
+
+
+def _coordinator(tmp_root):
+    cfg = SimpleNamespace(retry_limit=3, LEASE_SECONDS=60)
+    state = State(cfg, str(tmp_root / "s.json"), str(tmp_root / "a.json"))
+    state.add_url("/", "index.html")
+    return Coordinator(state, tmp_root)
+
+
+def test_claims_are_leased_and_phases_advance(tmp_root):
+    coord = _coordinator(tmp_root)
+    state = coord.state
+
+    got = coord.claim("n1", "discover", 10)
+    assert got == {"phase": "discover", "paths": [["/", state.urls["/"]]]}
+    # leased to n1: nothing left for n2
+    assert coord.claim("n2", "discover", 10)["paths"] == []
+    state.leases["/"][1] = 0  # still working on it: renewed, not reaped
+    asyncio.run(coord.apply("n1", [["renew", "/"], ["renew", "/gone"]]))
+    assert not state.reap_expired() and "/gone" not in state.leases
+
+    ops = [
+        ["add_url", "/t1-a", "topicos/t1-a.html"],
+        ["add_url", "/t2-b", "topicos/t2-b.html"],
+        ["mark_discovered", "/"],
+        ["release", "/"],
+    ]
+    asyncio.run(coord.apply("n1", ops))
+    assert state.urls["/"][STA] == "d" and not state.leases
+    assert len(coord.claim("n2", "discover", 1)["paths"]) == 1
+    assert len(coord.claim("n1", "discover", 10)["paths"]) == 1
+
+    done = [["update_after_fetch", "/t1-a", True, ""], ["release", "/t1-a"]]
+    asyncio.run(coord.apply("n2", done))
+    asyncio.run(coord.apply("n1", [["mark_discovered", "/t2-b"], ["release", "/t2-b"]]))
+    # input status drained: a discover claim now learns the phase moved on
+    assert coord.claim("n1", "discover", 10) == {"phase": "download", "paths": []}
+    paths = coord.claim("n1", "download", 10)["paths"]
+    assert {p for p, _ in paths} == {"/", "/t1-a", "/t2-b"}
+
+    asyncio.run(coord.apply("n1", [["mark_downloaded", p] for p, _ in paths]))
+    coord.bye("n1")
+    assert coord.claim("n2", "download", 10)["phase"] == "done"
+    coord.bye("n2")
+    assert coord.finished_all and not state.leases
+
+
+def test_write_file_stays_inside_root(tmp_root):
+    coord = _coordinator(tmp_root)
+    asyncio.run(coord.write_file("topicos/t1.html", b"<p>x</p>"))
+    assert (tmp_root / "topicos" / "t1.html").read_bytes() == b"<p>x</p>"
+    bad_paths = ("../evil.html", "/etc/passwd", "settings.yaml", "cookies.json")
+    bad_paths += ("crawl_state.json", "archive/index.sqlite", "topicos")
+    for bad in bad_paths:
+        with pytest.raises(ValueError):
+            asyncio.run(coord.write_file(bad, b""))
+
+
+def test_token_is_required(tmp_root):
+    coord = _coordinator(tmp_root)
+    coord.token = "s3cret"
+
+    async def run():
+        async with TestClient(TestServer(coord.make_app())) as client:
+            r = await client.get("/config")
+            assert r.status == 403
+            r = await client.get("/config", headers={"X-Mirror-Token": "wrong"})
+            assert r.status == 403
+            r = await client.get("/config", headers={"X-Mirror-Token": "s3cret"})
+            assert r.status == 200
+            r = await client.put(
+                "/files/settings.yaml", data=b"x", headers={"X-Mirror-Token": "s3cret"}
+            )
+            assert r.status == 400
+
+    asyncio.run(run())
+    assert not (tmp_root / "settings.yaml").exists()
+
+
+def test_unknown_op_is_rejected(tmp_root):
+    coord = _coordinator(tmp_root)
+    with pytest.raises(ValueError):
+        asyncio.run(coord.apply("n1", [["drop_table", "urls"]]))
@@ -0,0 +1,51 @@
+import asyncio
+from types import SimpleNamespace
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from core.fetcher import Fetcher
+
+CHUNK = bytes(range(256)) * 256  # 64 KiB
+PARTS = 48  # 3 MiB, sent chunked (no Content-Length)
+
+
+class _Throttle:
+    async def before_request(self):
+        pass
+
+    def after_response(self, status):
+        pass
+
+
+async def _chunked(request):
+    resp = web.StreamResponse()
+    resp.enable_chunked_encoding()
+    await resp.prepare(request)
+    for _ in range(PARTS):
+        await resp.write(CHUNK)
+        await asyncio.sleep(0)
+    await resp.write_eof()
+    return resp
+
+
+def test_fetch_bytes_reads_a_multi_chunk_body_whole():
+    async def run():
+        app = web.Application()
+        app.router.add_get("/big", _chunked)
+        async with TestServer(app) as server:
+            cfg = SimpleNamespace(workers=1, USER_AGENT="test")
+            fetcher = Fetcher(cfg, _Throttle(), {})
+            url = str(server.make_url("/big"))
+            try:
+                capped = await fetcher.fetch_bytes(url, max_bytes=10 * 1024 * 1024)
+                uncapped = await fetcher.fetch_bytes(url)
+                too_big = await fetcher.fetch_bytes(url, max_bytes=len(CHUNK) * 2)
+            finally:
+                await fetcher.close()
+        return capped, uncapped, too_big
+
+    capped, uncapped, too_big = asyncio.run(run())
+    assert capped == (200, CHUNK * PARTS)
+    assert uncapped == (200, CHUNK * PARTS)
+    assert too_big == (413, None)
@@ -0,0 +1,20 @@
+from core.hostlist import HostList, compile_hosts
+
+
+def test_compile_and_lookup(tmp_root):
+    blob = tmp_root / "hosts.bin"
+    sig = b"s" * 32
+    n = compile_hosts(["b.com", "a.com", "c.net", "a.com"], blob, sig)
+    assert n == 3
+    hl = HostList.open(blob, sig)
+    assert len(hl) == 3
+    assert "a.com" in hl and "c.net" in hl
+    assert "b.co" not in hl and "zz.com" not in hl
+    hl.close()
+
+
+def test_signature_mismatch(tmp_root):
+    blob = tmp_root / "hosts.bin"
+    compile_hosts(["a.com"], blob, b"1" * 32)
+    assert HostList.open(blob, b"2" * 32) is None
+    assert HostList.open(tmp_root / "missing.bin", b"1" * 32) is None
@@ -0,0 +1,62 @@
+from processor.optimize.htmlmin import minify, minify_css, run
+
+PAGE = """<!DOCTYPE html>
+<html>
+ <head>
+  <!-- theme v2 -->
+  <title>Topic</title>
+  <link rel="preconnect" href="https://cdn.example">
+  <link rel="stylesheet" href="../a.css" integrity="sha384-x" crossorigin="anonymous">
+  <script src="https://ads.example/x.js"></script>
+  <script>gtag('config', 'UA-1');</script>
+  <script>
+      var a = 1;
+
+      var b = "x  y";
+  </script>
+  <style> a  >  b { color : red ; }  /* x */ a :hover { x : y } </style>
+ </head>
+ <body>
+  <div title="a nonce b" style="color : red ;">  Hello   <b>bold</b>  world&nbsp;\xa0 x </div>
+  <pre>  keep
+    this </pre>
+  <ul>
+    <li>one</li>
+    <li>two</li>
+  </ul>
+  <table>
+    <tr> <td>1</td> <td>2</td> </tr>
+  </table>
+ </body>
+</html>"""
+
+
+def test_whitespace_comments_and_offline_cruft():
+    out = minify(PAGE)
+    assert out.startswith("<!DOCTYPE html><html><head><title>Topic</title>")
+    assert "<!--" not in out and "preconnect" not in out
+    assert "ads.example" not in out and "gtag" not in out
+    assert '<link rel="stylesheet" href="../a.css">' in out
+    assert 'title="a nonce b"' in out  # attribute values are not touched
+    assert " Hello <b>bold</b> world&nbsp;\xa0 x " in out
+    assert "<pre>  keep\n    this </pre>" in out
+    assert "<li>one</li> <li>two</li>" in out  # may be inline-block
+    assert "<tr><td>1</td><td>2</td></tr>" in out
+    assert 'var b = "x  y";' in out and 'style="color : red ;"' in out
+    assert len(out) < len(PAGE)
+    assert minify(out) == out
+
+
+def test_inline_minification():
+    out = minify(PAGE, inline=True)
+    assert "<style>a>b{color :red}a :hover{x :y}</style>" in out
+    assert '<script>var a = 1;\nvar b = "x  y";</script>' in out
+    assert 'style="color :red"' in out
+    assert minify_css("a{content:'a  ;  b'}") == "a{content:'a  ;  b'}"
+
+
+def test_run_honours_settings(monkeypatch):
+    monkeypatch.setattr("config.settings.HTML_OPTIMIZE", {"enabled": False})
+    assert run(PAGE) == PAGE
+    monkeypatch.setattr("config.settings.HTML_OPTIMIZE", {"strip_offline": False})
+    assert "ads.example" in run(PAGE)
@@ -0,0 +1,87 @@
+import asyncio
+from types import SimpleNamespace
+
+from core.pathutils import shard_dirs, url_to_local_path
+from core.state import REL, State
+from processor.layout import migrate_layout
+from processor.linkindex import LinkIndex
+
+PAGES = {
+    "/": (
+        "index.html",
+        '<a href="topicos/t1234-hello.html">t</a> <a href="users/u7-ana.html">u</a>',
+    ),
+    "/t1234-hello": (
+        "topicos/t1234-hello.html",
+        '<a href="../">home</a> <a href="t56-other.html#p3">next</a>'
+        ' <img src="../assets/imagens/internal/a.png">'
+        ' <div style="background:url(../assets/imagens/internal/a.png)"></div>'
+        ' <a href="https://x.org/">out</a> <a href="/t9-unknown">later</a>',
+    ),
+    "/t56-other": ("topicos/t56-other.html", '<a href="../users/u7-ana.html">u</a>'),
+    "/u7-ana": ("users/u7-ana.html", '<a href="../topicos/t1234-hello.html">t</a>'),
+}
+
+
+def test_shard_dirs(tmp_root, monkeypatch):
+    monkeypatch.setattr("config.settings.BACKUP_ROOT", tmp_root)
+    monkeypatch.setattr("config.settings.SHARDING", {"mode": "id"})
+    assert shard_dirs("t1234-slug.html") == ["12", "34"]
+    assert shard_dirs("t5-x-dup1.html") == ["00", "05"]
+    assert shard_dirs("t987654-x.html") == ["76", "54"]
+    assert url_to_local_path("/t1234-slug").endswith("topicos/12/34/t1234-slug.html")
+    monkeypatch.setattr("config.settings.SHARDING", {"mode": "hash", "levels": 1})
+    name = shard_dirs("t1234-slug.html")
+    assert len(name) == 1 and len(name[0]) == 2
+    assert shard_dirs("t1234-slug-dup2.html") == name
+    monkeypatch.setattr("config.settings.SHARDING", {})
+    assert shard_dirs("t1234-slug.html") == []
+
+
+def test_migrate_round_trip(tmp_root, monkeypatch):
+    monkeypatch.setattr("config.settings.BACKUP_ROOT", tmp_root)
+    state = State(
+        SimpleNamespace(retry_limit=3), str(tmp_root / "s.json"), str(tmp_root / "a")
+    )
+    for path, (rel, html) in PAGES.items():
+        state.add_url(path, rel)
+        (tmp_root / rel).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_root / rel).write_text(html, "utf-8")
+    asset = tmp_root / "assets" / "imagens" / "internal" / "a.png"
+    asset.parent.mkdir(parents=True)
+    asset.write_bytes(b"png")
+    state.add_url("/t77-pending", "topicos/t77-pending.html")  # not saved yet
+    index = LinkIndex(tmp_root)
+    index.record(
+        "/t56-other",
+        "topicos/t56-other.html",
+        [("/u7-ana", "../users/u7-ana.html")],
+        state,
+    )
+
+    monkeypatch.setattr("config.settings.SHARDING", {"mode": "id"})
+    stats = asyncio.run(migrate_layout(state, tmp_root, index))
+    assert stats == {"records": 4, "moved": 3, "rewritten": 4, "links": 8}
+    assert state.urls["/t77-pending"][REL] == "topicos/00/77/t77-pending.html"
+    topic = (tmp_root / "topicos/12/34/t1234-hello.html").read_text("utf-8")
+    assert (
+        'href="../../../"' in topic and 'href="../../00/56/t56-other.html#p3"' in topic
+    )
+    assert topic.count("../../../assets/imagens/internal/a.png") == 2
+    assert 'href="https://x.org/"' in topic and 'href="/t9-unknown"' in topic
+    assert (
+        'href="topicos/12/34/t1234-hello.html"' in (tmp_root / "index.html").read_text()
+    )
+    assert not (tmp_root / "topicos" / "t1234-hello.html").exists()
+    assert index.stale(state) == []
+    assert index._db.execute("SELECT href FROM edges").fetchall() == [
+        ("../../../users/00/07/u7-ana.html",)
+    ]
+
+    # a second run finds nothing to do; going back to flat restores the pages
+    assert asyncio.run(migrate_layout(state, tmp_root))["moved"] == 0
+    monkeypatch.setattr("config.settings.SHARDING", {"mode": "none"})
+    asyncio.run(migrate_layout(state, tmp_root, index))
+    for rel, html in PAGES.values():
+        assert (tmp_root / rel).read_text("utf-8") == html
+    assert not (tmp_root / "topicos" / "12").exists()
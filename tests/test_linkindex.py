@@ -0,0 +1,63 @@
+import asyncio
+from types import SimpleNamespace
+
+from bs4 import BeautifulSoup
+
+from core.state import REL, State
+from core.urlfilter import UrlFilter
+from processor.linkindex import LinkIndex, relink
+from processor.rewrite.links import rewrite_links
+
+PAGE = (
+    '<a href="/t2-x">moved</a> <a href="https://f.example/t3-y#p5">later</a>'
+    ' <a href="/t4-z">same</a> <a href="/t2-x">moved again</a>'
+)
+
+
+def test_relink_rewrites_only_changed_hrefs(tmp_root, monkeypatch):
+    monkeypatch.setattr("config.settings.BACKUP_ROOT", tmp_root)
+    monkeypatch.setattr(
+        "config.settings.URL_FILTER", UrlFilter("https://f.example", (), (), ())
+    )
+    monkeypatch.setattr("core.redirects.redirects.map", {})
+    state = State(
+        SimpleNamespace(retry_limit=3), str(tmp_root / "s"), str(tmp_root / "a")
+    )
+    for path, rel in (("/t1-a", "topicos/t1.html"), ("/t2-x", "topicos/t2.html")):
+        state.add_url(path, rel)
+    state.add_url("/t4-z", "topicos/t4.html")
+
+    out = tmp_root / "topicos" / "t1.html"
+    out.parent.mkdir()
+    soup = BeautifulSoup(PAGE, "html.parser")
+    links = rewrite_links(soup, str(out), state)
+    out.write_text(str(soup), "utf-8")
+    index = LinkIndex(tmp_root)
+    index.record("/t1-a", "topicos/t1.html", dict.fromkeys(links), state)
+    assert index.stale(state) == []
+
+    # /t2-x turns out to redirect, /t3-y gets a record
+    from core.redirects import redirects
+
+    redirects.map["/t2-x"] = "/t2-new"
+    state.add_url("/t2-new", "topicos/t2-new.html")
+    state.add_url("/t3-y", "topicos/t3.html")
+
+    # an unreadable page keeps its keys stale for the next relink
+    hidden = out.with_suffix(".bak")
+    out.rename(hidden)
+    assert asyncio.run(relink(state, index))["pages"] == 0
+    assert len(index.stale(state)) == 2
+    hidden.rename(out)
+
+    stats = asyncio.run(relink(state, index))
+
+    text = out.read_text("utf-8")
+    assert text.count('href="t2-new.html"') == 2
+    assert 'href="t3.html#p5"' in text and 'href="t4.html"' in text
+    assert stats == {"keys": 2, "pages": 1, "hrefs": 3}
+    assert index.stale(state) == []
+
+    # a second relink has nothing to do
+    state.urls["/t4-z"][REL] = "topicos/t4.html"
+    assert asyncio.run(relink(state, index))["pages"] == 0
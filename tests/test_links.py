@@ -0,0 +1,47 @@
+import os
+from types import SimpleNamespace
+
+from bs4 import BeautifulSoup
+
+from core.state import State
+from core.urlfilter import UrlFilter
+from processor.rewrite.links import rewrite_links
+
+TARGETS = {
+    "/": "index.html",
+    "/f1-news": "categorias/f1-news.html",
+    "/t2-hello": "topicos/t2-hello.html",
+    "/t3-deep": "topicos/2024/t3-deep.html",
+    "/g4-sub": "grupos/index.html",
+}
+
+
+def _expected(rel: str, cur_dir: str, root) -> str:
+    """The plain relpath formula the table must reproduce."""
+    link = os.path.relpath(os.path.join(root, rel), cur_dir).replace(os.sep, "/")
+    return link[: -len("index.html")] if link.endswith("/index.html") else link
+
+
+def test_prefix_table_matches_relpath(tmp_root, monkeypatch):
+    monkeypatch.setattr("config.settings.BACKUP_ROOT", tmp_root)
+    monkeypatch.setattr(
+        "config.settings.URL_FILTER", UrlFilter("https://f.example", (), (), ())
+    )
+    monkeypatch.setattr("core.redirects.redirects.map", {"/t9-old": "/t2-hello"})
+    state = State(SimpleNamespace(retry_limit=3), str(tmp_root / "s"), "")
+    for path, rel in TARGETS.items():
+        state.add_url(path, rel)
+
+    anchors = [*TARGETS, "/t9-old", "/t2-hello#p7", "/t5-unknown", "http://x.org/"]
+    page = "".join(f'<a href="{h}">x</a>' for h in anchors * 2)
+    for rel in TARGETS.values():
+        cur = os.path.join(tmp_root, rel)
+        soup = BeautifulSoup(page, "html.parser")
+        links = rewrite_links(soup, cur, state)
+        got = [a["href"] for a in soup.find_all("a")][: len(anchors)]
+        cur_dir = os.path.dirname(cur)
+        want = [_expected(r, cur_dir, tmp_root) for r in TARGETS.values()]
+        want += [want[2], want[2] + "#p7", "/t5-unknown", "http://x.org/"]
+        assert got == want
+        assert len(links) == 2 * (len(anchors) - 1)  # external link skipped
+        assert links[len(TARGETS)] == ("/t9-old", want[2])
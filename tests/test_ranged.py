@@ -0,0 +1,91 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from core.state import State
+from downloader.assets import AssetManager
+from downloader.ranged import RangedDownload
+
+BODY = bytes(range(256)) * 40  # 10 KiB
+
+
+class _Fetcher:
+    """Serves BODY by Range; can cut a stream short after `fail_after` bytes."""
+
+    budget = None
+
+    def __init__(self, fail_after=None):
+        self.fail_after = fail_after
+        self.ranges: list[tuple[int, int]] = []
+        self.gets = 0
+
+    async def head(self, url):
+        return 200, {"length": len(BODY), "ranges": True, "etag": '"v1"'}
+
+    async def fetch_bytes(self, url, max_bytes=None):
+        self.gets += 1
+        if max_bytes is not None and len(BODY) > max_bytes:
+            return 413, None
+        return 200, BODY
+
+    async def fetch_range(self, url, fh, start, end=None, if_range=None, on_chunk=None):
+        end = len(BODY) - 1 if end is None else end
+        self.ranges.append((start, end))
+        fh.seek(start)
+        n = 0
+        for i in range(start, end + 1, 1024):
+            chunk = BODY[i : min(i + 1024, end + 1)]
+            if self.fail_after is not None and n >= self.fail_after:
+                self.fail_after = None
+                return 206, n  # connection dropped
+            fh.write(chunk)
+            n += len(chunk)
+            on_chunk(len(chunk))
+        return 206, n
+
+
+def test_resume_from_sidecar(tmp_path):
+    part = tmp_path / "x.part"
+    info = {"length": len(BODY), "ranges": True, "etag": '"v1"'}
+
+    first = _Fetcher(fail_after=4096)
+    assert asyncio.run(RangedDownload(first, "u", part, info).run())
+    # the dropped stream was resumed from byte 4096, not restarted
+    assert first.ranges == [(0, len(BODY) - 1), (4096, len(BODY) - 1)]
+    assert part.read_bytes() == BODY
+
+    # a sidecar left by an interrupted run picks up where it stopped
+    part.write_bytes(BODY[:6000] + bytes(len(BODY) - 6000))
+    meta = {"url": "u", "length": len(BODY), "etag": '"v1"', "segments": []}
+    meta["segments"] = [[0, len(BODY) - 1, 6000]]
+    (tmp_path / "x.part.json").write_text(json.dumps(meta))
+    second = _Fetcher()
+    job = RangedDownload(second, "u", part, info)
+    assert asyncio.run(job.run())
+    assert second.ranges == [(6000, len(BODY) - 1)]
+    assert part.read_bytes() == BODY
+    assert not (tmp_path / "x.part.json").exists()
+
+
+def test_segments_and_asset_manager(tmp_root, monkeypatch):
+    monkeypatch.setattr("config.settings.BACKUP_ROOT", tmp_root)
+    monkeypatch.setattr("config.settings.SHARED_ASSET_STORE", None)
+    monkeypatch.setattr("config.settings.LARGE_ASSET_MB", 0.005)
+    monkeypatch.setattr("config.settings.RANGE_SEGMENTS", 4)
+    monkeypatch.setattr("config.settings.MAX_ASSET_KB", None)
+    state = State(
+        SimpleNamespace(retry_limit=3), str(tmp_root / "s"), str(tmp_root / "a")
+    )
+    fetcher = _Fetcher()
+    mgr = AssetManager(fetcher, state)
+
+    rel = asyncio.run(mgr.fetch("https://f.example/file/video.mp4", "misc"))
+    assert (tmp_root / rel).read_bytes() == BODY
+    assert len(fetcher.ranges) == 4 and fetcher.gets == 0
+    assert mgr.counters["ranged"] == 1
+
+    # over the size cap: refused on the HEAD, no body transferred
+    monkeypatch.setattr("config.settings.MAX_ASSET_KB", 4)
+    assert asyncio.run(mgr.fetch("https://f.example/file/big.zip", "misc")) is None
+    assert len(fetcher.ranges) == 4 and fetcher.gets == 0
+    assert mgr.counters["too_big"] == 1
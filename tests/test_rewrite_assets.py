@@ -0,0 +1,59 @@
+import asyncio
+
+from bs4 import BeautifulSoup
+
+from core.urlfilter import UrlFilter
+from downloader.assets import PageAssets
+from processor.rewrite.assets import rewrite_assets
+
+PAGE = """<html><head>
+<link rel="stylesheet" href="/theme.css">
+<script src="https://ads.example/track.js"></script>
+<style>body { background: url('/bg.png') }</style>
+</head><body>
+<img src="/a.png"><img src="/b.png"><img src="data:image/png;base64,AA">
+<picture><source srcset="/a.png 1x, /c.png 2x"></picture>
+<div style="background:url(/avatar1.png)"></div>
+<div style="background:url(/avatar2.png)"></div>
+</body></html>"""
+
+
+class _Mgr:
+    """AssetManager stand-in: slow lookups, tracks concurrency."""
+
+    def __init__(self, root):
+        self.root = str(root)
+        self.active = self.peak = 0
+        self.calls: list[str] = []
+
+    async def fetch(self, url, kind_hint="", page=None):
+        self.calls.append(url)
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        if url.endswith("c.png"):
+            return None  # not available
+        return "assets/imagens/internal/" + url.rsplit("/", 1)[1]
+
+
+def test_collect_resolve_apply(tmp_root, monkeypatch):
+    monkeypatch.setattr(
+        "config.settings.URL_FILTER",
+        UrlFilter("https://f.example", (), (), (r"ads\.example",)),
+    )
+    soup = BeautifulSoup(PAGE, "html.parser")
+    mgr = _Mgr(tmp_root)
+    page = PageAssets(mgr, str(tmp_root / "topicos" / "t1.html"))
+    n = asyncio.run(rewrite_assets(soup, "https://f.example/t1-x", page, limit=3))
+
+    assert n == 6
+    assert len(mgr.calls) == 7 == len(set(mgr.calls))  # each URL once
+    assert 1 < mgr.peak <= 3
+    out = str(soup)
+    assert "track.js" not in out
+    assert 'href="../assets/imagens/internal/theme.css"' in out
+    assert "url('../assets/imagens/internal/bg.png')" in out
+    assert 'srcset="../assets/imagens/internal/a.png 1x, /c.png 2x"' in out
+    assert "url(../assets/imagens/internal/avatar2.png)" in out
+    assert "data:image/png;base64,AA" in out
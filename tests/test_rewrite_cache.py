@@ -0,0 +1,79 @@
+import asyncio
+from types import SimpleNamespace
+
+import downloader.workers as workers
+from core.fetcher import Page
+from core.hostlist import compile_hosts
+from core.state import REL, State
+from downloader.workers import DownloadWorker
+from processor.cache import RewriteCache
+
+
+class _Fetcher:
+    budget = None
+    html = "<html><a href='/t2-x'>next</a><img src='http://cdn/a.png'></html>"
+
+    async def fetch_page(self, url):
+        return Page(200, self.html.encode(), "utf-8", url)
+
+
+def test_unchanged_pages_skip_the_rewrite(tmp_root, monkeypatch):
+    monkeypatch.setattr("config.settings.BACKUP_ROOT", tmp_root)
+    calls = []
+
+    async def fake_process(final, html, fetcher, state, out, assets, deps):
+        calls.append(final)
+        deps.update(
+            links=["/t2-x"],
+            hrefs=[("/t2-x", "t2.html")],
+            assets=["http://cdn/a.png"],
+        )
+        return f"<html>{len(calls)}</html>"
+
+    monkeypatch.setattr(workers, "process_html", fake_process)
+    cfg = SimpleNamespace(
+        BASE_URL="https://f.example",
+        BACKUP_ROOT=tmp_root,
+        REWRITE_CACHE=True,
+        retry_limit=3,
+    )
+    state = State(cfg, str(tmp_root / "s.json"), str(tmp_root / "a.json"))
+    state.add_url("/t1-x", "topicos/t1.html")
+    state.add_url("/t2-x", "topicos/t2.html")
+    fetcher = _Fetcher()
+    worker = DownloadWorker(cfg, state, fetcher)
+
+    def run():
+        asyncio.run(worker._process("/t1-x"))
+        return len(calls)
+
+    assert run() == 1
+    assert run() == 2  # the asset is not cached yet: rewrite (and retry it)
+    state.add_asset("http://cdn/a.png", "assets/imagens/internal/a.png")
+    assert run() == 2  # same HTML, links and rules: output kept
+    assert (tmp_root / "topicos" / "t1.html").read_text() == "<html>2</html>"
+
+    state.urls["/t2-x"][REL] = "topicos/t2-renamed.html"  # link target moved
+    assert run() == 3
+    fetcher.html += "<p>edited</p>"
+    assert run() == 4
+    (tmp_root / "topicos" / "t1.html").unlink()
+    assert run() == 5
+    assert run() == 5
+
+
+def test_new_blocklist_invalidates_the_cache(tmp_root, monkeypatch):
+    monkeypatch.setattr("config.settings.BACKUP_ROOT", tmp_root)
+    cfg = SimpleNamespace(retry_limit=3)
+    state = State(cfg, str(tmp_root / "s.json"), str(tmp_root / "a.json"))
+    out = tmp_root / "t1.html"
+    out.write_text("<html></html>")
+    deps = {"links": [], "assets": []}
+
+    compile_hosts(["ads.example"], tmp_root / "hosts.bin", b"a" * 32)
+    cache = RewriteCache(tmp_root)
+    cache.store("/t1", "raw", state, deps)
+    assert RewriteCache(tmp_root).fresh("/t1", "raw", state, out)
+
+    compile_hosts(["ads.example", "more.example"], tmp_root / "hosts.bin", b"b" * 32)
+    assert not RewriteCache(tmp_root).fresh("/t1", "raw", state, out)
@@ -0,0 +1,115 @@
+import asyncio
+from types import SimpleNamespace
+
+from core.state import State
+from crawler.scheduler import WorkQueue, _run_phase
+
+
+class _Worker:
+    """Discovers two children per page until depth 3."""
+
+    def __init__(self, state, seen):
+        self.state = state
+        self.seen = seen
+
+    async def run(self, queue):
+        while True:
+            path = await queue.get("w")
+            try:
+                await asyncio.sleep(0.01)
+                self.seen.append(path)
+                if path.count("/") < 3:
+                    for c in ("a", "b"):
+                        self.state.add_url(f"{path}/{c}", "")
+                self.state.mark_discovered(path)
+            finally:
+                queue.task_done(path, "w")
+
+
+def test_phase_ends_when_frontier_drained(tmp_root):
+    async def go():
+        cfg = SimpleNamespace(retry_limit=3, LEASE_SECONDS=60)
+        state = State(cfg, str(tmp_root / "s.json"), str(tmp_root / "a.json"))
+        state.add_url("/r", "")
+        seen: list[str] = []
+        queue = WorkQueue(state, "discover")
+        await _run_phase(queue, [_Worker(state, seen) for _ in range(3)])
+        return state, seen
+
+    state, seen = asyncio.run(go())
+    assert len(seen) == 7 == len(set(seen))
+    assert all(rec[2] == "d" for rec in state.urls.values())
+    assert not state.leases
+
+
+def test_shared_slots_follow_weights():
+    from crawler.scheduler import SharedSlots
+
+    async def go():
+        slots = SharedSlots(4, {"discover": 1, "download": 3})
+        for _ in range(4):
+            await slots.acquire("discover")
+        waiters = [
+            asyncio.create_task(slots.acquire(stage))
+            for stage in ["discover"] * 4 + ["download"] * 4
+        ]
+        await asyncio.sleep(0)
+        for _ in range(4):
+            slots.release("discover")
+        await asyncio.sleep(0)
+        for t in waiters:
+            t.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        return slots.in_use
+
+    assert asyncio.run(go()) == {"discover": 1, "download": 3}
+
+
+def test_leases_expire_and_recover(tmp_root):
+    async def go():
+        cfg = SimpleNamespace(retry_limit=3, LEASE_SECONDS=60)
+        state = State(cfg, str(tmp_root / "s.json"), str(tmp_root / "a.json"))
+        await state.load()
+        state.add_url("/a", "")
+        assert state.lease("/a", "w1", ttl=60)
+        assert not state.lease("/a", "w2", ttl=60)
+        requeued: list[str] = []
+        state.watch("l", requeued.append)
+        state.leases["/a"][1] = 0  # force expiry
+        assert state.reap_expired() == ["/a"] and requeued == ["/a"]
+        assert state.lease("/a", "w2", ttl=60)
+        await state.save()  # "crash" with /a in flight
+
+        again = State(cfg, str(tmp_root / "s.json"), str(tmp_root / "a.json"))
+        await again.load()
+        return again
+
+    again = asyncio.run(go())
+    assert again.recovered == ["/a"] and not again.leases
+    assert again.paths_with_status("l") == ["/a"]
+
+
+def test_long_work_keeps_its_lease(tmp_root):
+    class _Slow:
+        def __init__(self, seen):
+            self.seen = seen
+
+        async def run(self, queue):
+            while True:
+                path = await queue.get("w")
+                try:
+                    self.seen.append(path)
+                    await asyncio.sleep(0.5)  # well past LEASE_SECONDS
+                    queue.state.mark_discovered(path)
+                finally:
+                    queue.task_done(path, "w")
+
+    async def go():
+        cfg = SimpleNamespace(retry_limit=3, LEASE_SECONDS=0.2)
+        state = State(cfg, str(tmp_root / "s.json"), str(tmp_root / "a.json"))
+        state.add_url("/a", "")
+        seen: list[str] = []
+        await _run_phase(WorkQueue(state, "discover"), [_Slow(seen), _Slow(seen)])
+        return seen
+
+    assert asyncio.run(go()) == ["/a"]
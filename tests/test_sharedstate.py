@@ -0,0 +1,98 @@
+import asyncio
+from types import SimpleNamespace
+
+from core.sharedstate import SharedState, shard_of
+from core.state import State
+from crawler.multiproc import ShardQueue, _run_queues
+
+
+def _store(tmp_root, nshards=2):
+    cfg = SimpleNamespace(retry_limit=2)
+    state = State(cfg, str(tmp_root / "s.json"), str(tmp_root / "a.json"))
+    for i in range(10):
+        state.add_url(f"/t{i}", f"t{i}.html")
+    return state, SharedState.from_state(state, str(tmp_root / "s.sqlite"), nshards)
+
+
+def test_claims_are_exclusive_and_sharded(tmp_root):
+    _, store = _store(tmp_root)
+    a = store.claim(0, "l", "A", ttl=60, limit=100)
+    assert a and all(shard_of(p, 2) == 0 for p in a)
+    assert store.claim(0, "l", "B", ttl=60, limit=100) == []
+    store.release(a[0], "A")
+    assert store.claim(0, "l", "B", ttl=60, limit=100) == [a[0]]
+
+
+def test_expired_lease_is_reclaimed(tmp_root):
+    _, store = _store(tmp_root)
+    a = store.claim(1, "l", "A", ttl=-1, limit=100)
+    assert store.claim(1, "l", "B", ttl=60, limit=100) == a
+
+
+def test_shard_queue_renews_its_claims(tmp_root):
+    _, store = _store(tmp_root)
+    q = ShardQueue(store, "discover", 0, "A", ttl=-1, batch=2)
+
+    async def go():
+        running = await q.get("w")  # claims a batch of 2, already expired
+        q.ttl = 60
+        await q.renew()
+        return running
+
+    running = asyncio.run(go())
+    held = {running, *q._buf}
+    assert len(held) == 2
+    assert not held & set(store.claim(0, "l", "B", ttl=60, limit=100))
+
+
+def test_shard_queues_claim_release_and_join(tmp_root):
+    _, store = _store(tmp_root)
+    seen: list[str] = []
+
+    class _Worker:
+        async def run(self, queue):
+            while True:
+                path = await queue.get("w")
+                try:
+                    assert shard_of(path, 2) == queue.shard
+                    seen.append(path)
+                    await asyncio.sleep(0.01)
+                    store.mark_discovered(path)
+                finally:
+                    queue.task_done(path, "w")
+
+    async def go():
+        queues = [
+            ShardQueue(store, "discover", k, f"P{k}", ttl=60, batch=3, poll=0.01)
+            for k in (0, 1)
+        ]
+        await _run_queues(queues, [(q, _Worker()) for q in queues for _ in range(2)])
+        return queues
+
+    queues = asyncio.run(go())
+    assert sorted(seen) == sorted(f"/t{i}" for i in range(10))
+    assert all(q.pending == 0 for q in queues)
+    assert store.count_open("l", "discover") == 0
+    leased = store._db.execute("SELECT COUNT(*) FROM urls WHERE owner IS NOT NULL")
+    assert leased.fetchone()[0] == 0
+
+
+def test_retry_and_roundtrip(tmp_root):
+    state, store = _store(tmp_root)
+    store.update_after_fetch("/t1", False, "HTTP 500")
+    assert store.urls["/t1"][2:4] == ["l", 1]
+    store.update_after_fetch("/t1", False, "HTTP 500")
+    assert store.urls["/t1"][2] == "e"
+    store.mark_discovered("/t2")
+    store.add_url("/new", "new.html")
+    store.to_state(state)
+    assert state.urls["/t2"][2] == "d" and "/new" in state.urls
+    assert state.paths_with_status("e") == ["/t1"]
+
+
+def test_stopped_shards_are_not_waited_for(tmp_root):
+    _, store = _store(tmp_root)
+    total = store.count_open("l", "discover")
+    store.mark_stopped(0, "discover")
+    left = store.count_open("l", "discover")
+    assert left == sum(1 for i in range(10) if shard_of(f"/t{i}", 2) == 1) < total
@@ -0,0 +1,42 @@
+from core.urlfilter import (
+    BLACKLISTED,
+    EXTERNAL,
+    IGNORED,
+    INTERNAL,
+    SKIP,
+    TRACKER,
+    UrlFilter,
+)
+
+
+def _filter():
+    return UrlFilter(
+        "https://forum.example.com",
+        ignored_prefixes=["/admin", "/profile"],
+        blacklist_params=["vote", "mode"],
+        tracker_patterns=[r"/pixel\.gif", r"utm_source="],
+    )
+
+
+def test_classify_kinds():
+    uf = _filter()
+    assert uf.classify("mailto:a@b.c").kind == SKIP
+    assert uf.classify("#top").kind == SKIP
+    assert uf.classify("https://other.com/x").kind == EXTERNAL
+    assert uf.classify("/admin/index.php").kind == IGNORED
+    assert uf.classify("/t12-topic?mode=reply").kind == BLACKLISTED
+    assert uf.classify("/t12-topic?vote&x=1").kind == BLACKLISTED
+    assert uf.classify("https://cdn.x.com/pixel.gif").kind == TRACKER
+    assert uf.classify("/f1-cat?utm_source=x").kind == TRACKER
+
+
+def test_internal_key_and_fragment():
+    v = _filter().classify("https://FORUM.example.com/t12-topic?start=10#p5")
+    assert v.kind == INTERNAL
+    assert v.key == "/t12-topic?start=10"
+    assert v.fragment == "p5"
+
+
+def test_relative_to_base():
+    v = _filter().classify("img/a.png", "https://forum.example.com/t1-x")
+    assert v.url == "https://forum.example.com/img/a.png"
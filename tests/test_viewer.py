@@ -0,0 +1,69 @@
+import asyncio
+import gzip
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from cli.viewer import Viewer
+from utils.archive import PackedArchive
+
+PAGE = "<html><body>" + "<p>olá mundo</p>" * 200 + "</body></html>"
+
+
+def test_serves_archive_and_folder(tmp_root):
+    archive = PackedArchive(tmp_root)
+    archive.put("index.html", PAGE.encode())
+    archive.put("topicos/t1.html", b"<p>t1</p>")
+    archive.put("assets/imagens/a.png", b"\x89PNG")
+    # still open: the viewer must read a part that is being written
+    (tmp_root / "misc").mkdir()
+    (tmp_root / "misc" / "x.html").write_text("loose file")
+    for private in ("settings.yaml", "cookies.json", "crawl_state.json"):
+        (tmp_root / private).write_text("secret")
+
+    async def run():
+        async with TestClient(TestServer(Viewer(tmp_root).make_app())) as client:
+            r = await client.get("/", headers={"Accept-Encoding": "gzip"})
+            assert r.headers["Content-Encoding"] == "gzip"
+            raw = await r.read()  # the client inflates it back
+            assert raw.decode() == PAGE and r.headers["Cache-Control"] == "no-cache"
+            etag = r.headers["ETag"]
+            r = await client.get("/", headers={"If-None-Match": etag})
+            assert r.status == 304
+
+            r = await client.get("/topicos/t1.html", auto_decompress=False)
+            assert gzip.decompress(await r.read()) == b"<p>t1</p>"
+            r = await client.get("/topicos/t1.html", headers={"Accept-Encoding": ""})
+            assert (
+                await r.read() == b"<p>t1</p>" and "Content-Encoding" not in r.headers
+            )
+
+            r = await client.get("/assets/imagens/a.png")
+            assert await r.read() == b"\x89PNG"
+            assert r.headers["Content-Type"] == "image/png"
+            assert "max-age" in r.headers["Cache-Control"]
+
+            r = await client.get("/misc/x.html")
+            assert await r.text() == "loose file"
+            r = await client.get("/misc", allow_redirects=False)
+            assert r.status == 302 and r.headers["Location"] == "/misc/"
+            assert (await client.get("/topicos/nope.html")).status == 404
+            assert (await client.get("/a/../../etc/passwd")).status in (403, 404)
+
+            for private in (
+                "/settings.yaml",
+                "/cookies.json",
+                "/crawl_state.json",
+                "/archive/index.sqlite",
+                "/archive",
+            ):
+                assert (await client.get(private)).status == 404, private
+            r = await client.get("/", headers={"Host": "evil.example:8000"})
+            assert r.status == 403
+            r = await client.get("/", headers={"Host": "localhost:8000"})
+            assert r.status == 200
+
+            got = await asyncio.gather(*(client.get("/") for _ in range(50)))
+            assert {r.status for r in got} == {200}
+
+    asyncio.run(run())
+    archive.close()
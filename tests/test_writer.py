@@ -0,0 +1,60 @@
+import asyncio
+import os
+
+import pytest
+
+from utils.files import safe_file_write
+from utils.writer import FileWriter, close_writer, writer_report
+
+
+def test_writes_land_atomically_with_backpressure(tmp_root, monkeypatch):
+    monkeypatch.setattr(
+        "config.settings.FILE_WRITER", {"threads": 2, "queue": 4, "batch": 3}
+    )
+
+    async def run():
+        oks = await asyncio.gather(
+            *(
+                safe_file_write(tmp_root / f"d{i % 3}" / f"{i}.html", f"página {i}")
+                for i in range(40)
+            ),
+            safe_file_write(tmp_root / "bin" / "x.png", b"\x89PNG", mode="wb"),
+        )
+        await close_writer()
+        return oks, writer_report()
+
+    oks, report = asyncio.run(run())
+    assert all(oks)
+    assert (tmp_root / "d1" / "4.html").read_text("utf-8") == "página 4"
+    assert (tmp_root / "bin" / "x.png").read_bytes() == b"\x89PNG"
+    assert not list(tmp_root.rglob("*.tmp"))
+    assert report["writes"] == 41 and report["failed"] == 0
+    # bytes on disk: "á" is two of them
+    assert report["bytes"] == sum(len(f"página {i}") + 1 for i in range(40)) + 4
+    assert report["mkdirs"] == 4  # each folder created once
+    assert report["queue_max"] <= 4 and report["waited"] > 0
+    assert report["queue_depth"] == 0 and report["latency_ms"]["max"] > 0
+
+
+@pytest.mark.parametrize("mode, syncs", [("none", 0), ("file", 12), ("batch", 8)])
+def test_fsync_policy(tmp_root, monkeypatch, mode, syncs):
+    calls = []
+    real = os.fsync
+    monkeypatch.setattr(os, "fsync", lambda fd: calls.append(fd) or real(fd))
+
+    async def run():
+        w = FileWriter(threads=1, queue=16, batch=16, fsync=mode)
+        await asyncio.sleep(0)  # drain task waiting; the six writes form one batch
+        oks = await asyncio.gather(
+            *(w.write(tmp_root / f"d{i % 2}" / f"{i}", "x") for i in range(6))
+        )
+        await w.close()
+        return oks
+
+    assert all(asyncio.run(run()))
+    assert len(calls) == syncs  # file: 6 files + 6 dirs; batch: 6 files + 2 dirs
+
+
+def test_failed_write_reports_false(tmp_root):
+    (tmp_root / "f").write_text("a file, not a folder")
+    assert asyncio.run(safe_file_write(tmp_root / "f" / "x.html", "x")) is False
@@ -0,0 +1,328 @@
+"""
+Packed output: pages and assets go into ZIP parts instead of loose files.
+
+With `packed_output.enabled`, BACKUP_ROOT/archive holds part-00001.zip,
+part-00002.zip, ... and index.sqlite, which maps every stored file (by its
+BACKUP_ROOT-relative path) to its part, offset and sizes. Files are read
+back straight from that offset, so lookups never scan a ZIP directory.
+Every run (and every crawl process) appends to a part of its own, and a
+part is closed once it passes `part_mb`. A file written again, such as a
+page re-downloaded on a later run, is re-pointed in the index, and the
+newest copy wins.
+
+Writes arrive through the utils.files sink (see set_sink). Only the
+mirror's output goes into the archive: index.html, the FOLDER_MAPPING
+folders, misc/ and assets/ (core.pathutils.is_output_rel). Crawl state,
+settings, caches and the asset content store stay on disk. Text is
+deflated. Images and other media are stored as they are.
+
+A part left open by a crash has no ZIP central directory, but everything
+in its index is still readable. repair() copies those files into a new
+part and drops the broken one. `python -m cli --extract BACKUP_DIR`
+writes the normal tree back out.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+import time
+import warnings
+import zipfile
+import zlib
+from pathlib import Path, PurePosixPath
+
+import config.settings as settings
+from core.pathutils import is_output_rel
+from utils.files import safe_file_write, set_sink
+
+TEXT_EXTS = {".html", ".htm", ".css", ".js", ".svg", ".json", ".txt", ".xml"}
+LOCAL_HEADER = struct.Struct("<4s2B4HL2L2H")  # zipfile.structFileHeader
+_FH_CRC, _FH_NAME_LENGTH, _FH_EXTRA_LENGTH = 7, 10, 11
+CHUNK = 64  # files extracted concurrently
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS parts (
+    id INTEGER PRIMARY KEY,
+    closed INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS entries (
+    name TEXT PRIMARY KEY,
+    part INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    csize INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    method INTEGER NOT NULL
+);
+"""
+
+
+class PackedArchive:
+    def __init__(self, root: str | Path, part_mb: float = 1024, level: int = 6):
+        self.root = Path(root)
+        self.dir = self.root / "archive"
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.part_bytes = int(part_mb * 1024 * 1024)
+        self.level = level
+        self._lock = threading.Lock()  # one writer thread at a time
+        self._zip: zipfile.ZipFile | None = None
+        self._part: int | None = None
+        self._db = sqlite3.connect(
+            str(self.dir / "index.sqlite"),
+            timeout=30,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+
+    def part_path(self, part: int) -> Path:
+        return self.dir / f"part-{part:05d}.zip"
+
+    def accepts(self, rel: str) -> bool:
+        """True for the mirror's output files (see the module docstring)."""
+        return is_output_rel(rel)
+
+    # ----- writing (worker threads) -----
+    def _roll(self):
+        self._close_part()
+        self._part = self._db.execute("INSERT INTO parts DEFAULT VALUES").lastrowid
+        self._zip = zipfile.ZipFile(self.part_path(self._part), "w")
+
+    def _close_part(self):
+        if self._zip is not None:
+            self._zip.close()
+            self._db.execute("UPDATE parts SET closed=1 WHERE id=?", (self._part,))
+            self._zip = self._part = None
+
+    def put(self, rel: str, data: bytes):
+        """Store `data` as `rel` (replacing any older copy)."""
+        text = PurePosixPath(rel).suffix.lower() in TEXT_EXTS
+        info = zipfile.ZipInfo(rel, time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED if text else zipfile.ZIP_STORED
+        with self._lock:
+            if self._zip is None or self._zip.fp.tell() >= self.part_bytes:
+                self._roll()
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")  # "Duplicate name": newest wins
+                self._zip.writestr(
+                    info, data, compresslevel=self.level if text else None
+                )
+            self._zip.fp.flush()
+            # only indexed once the bytes are in the part
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    rel,
+                    self._part,
+                    info.header_offset,
+                    info.compress_size,
+                    info.file_size,
+                    info.compress_type,
+                ),
+            )
+
+    def close(self):
+        with self._lock:
+            self._close_part()
+
+    # ----- reading -----
+    def read(self, rel: str) -> bytes | None:
+        row = self._db.execute(
+            "SELECT part, offset, csize, method FROM entries WHERE name=?", (rel,)
+        ).fetchone()
+        return self._read(*row) if row else None
+
+    def _read(self, part: int, offset: int, csize: int, method: int) -> bytes:
+        with open(self.part_path(part), "rb") as fh:
+            fh.seek(offset)
+            header = LOCAL_HEADER.unpack(fh.read(LOCAL_HEADER.size))
+            fh.seek(header[_FH_NAME_LENGTH] + header[_FH_EXTRA_LENGTH], os.SEEK_CUR)
+            raw = fh.read(csize)
+        return zlib.decompress(raw, -15) if method == zipfile.ZIP_DEFLATED else raw
+
+    def has(self, rel: str) -> bool:
+        row = self._db.execute("SELECT 1 FROM entries WHERE name=?", (rel,))
+        return row.fetchone() is not None
+
+    def names(self) -> list[str]:
+        return [n for (n,) in self._db.execute("SELECT name FROM entries")]
+
+    # ----- upkeep -----
+    def repair(self) -> int:
+        """
+        Move the files of parts a crash left open into a new part. Only for
+        the process that starts a crawl: other processes' parts are open
+        while they run. Returns the files moved.
+        """
+        broken = [
+            p
+            for (p,) in self._db.execute("SELECT id FROM parts WHERE closed=0")
+            if p != self._part
+        ]
+        moved = 0
+        for part in broken:
+            rows = self._db.execute(
+                "SELECT name, offset, csize, method FROM entries WHERE part=?",
+                (part,),
+            ).fetchall()
+            for name, offset, csize, method in rows:
+                self.put(name, self._read(part, offset, csize, method))
+                moved += 1
+            self._db.execute("DELETE FROM parts WHERE id=?", (part,))
+            self.part_path(part).unlink(missing_ok=True)
+        return moved
+
+    def report(self) -> dict:
+        parts = self._db.execute("SELECT COUNT(*) FROM parts").fetchone()[0]
+        files, size, packed = self._db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(csize), 0)"
+            " FROM entries"
+        ).fetchone()
+        return {"parts": parts, "files": files, "bytes": size, "packed_bytes": packed}
+
+    # ----- utils.files sink -----
+    async def upload(self, rel: str, data: bytes) -> bool | None:
+        if not self.accepts(rel):
+            return None  # not mirror output: written to disk as usual
+        try:
+            await asyncio.to_thread(self.put, rel, data)
+            return True
+        except Exception as e:
+            print(f"[Archive] {rel}: {e}")
+            return False
+
+    async def download(self, rel: str) -> bytes | None:
+        if not self.accepts(rel):
+            return None
+        return await asyncio.to_thread(self.read, rel)
+
+    def exists(self, rel: str) -> bool | None:
+        return self.has(rel) if self.accepts(rel) else None
+
+    async def extract(self, dest: str | Path) -> int:
+        """Write every stored file under `dest`. Returns the files written."""
+        dest = Path(dest)
+        names = self.names()
+        done = 0
+        for i in range(0, len(names), CHUNK):
+            chunk = names[i : i + CHUNK]
+            blobs = await asyncio.gather(
+                *(asyncio.to_thread(self.read, n) for n in chunk)
+            )
+            oks = await asyncio.gather(
+                *(
+                    safe_file_write(dest.joinpath(*n.split("/")), b, mode="wb")
+                    for n, b in zip(chunk, blobs, strict=True)
+                )
+            )
+            done += sum(oks)
+        return done
+
+
+class ArchiveReader:
+    """
+    Read-only view of an archive for serving it (cli.viewer): parts are
+    memory-mapped, and entries come back as stored, still compressed.
+    Safe to use while a crawl is appending.
+    """
+
+    def __init__(self, root: str | Path):
+        self.dir = Path(root) / "archive"
+        db = (self.dir / "index.sqlite").resolve().as_posix()
+        self._db = sqlite3.connect(f"file:{db}?mode=ro", uri=True)
+        self._maps: dict[int, mmap.mmap] = {}
+
+    def _map(self, part: int, end: int) -> mmap.mmap:
+        mm = self._maps.get(part)
+        if mm is None or len(mm) < end:
+            # first use, or the part grew since: map it again (an older map
+            # is released with the last response still using it)
+            with open(self.dir / f"part-{part:05d}.zip", "rb") as fh:
+                mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[part] = mm
+        return mm
+
+    def entry(self, rel: str) -> tuple[memoryview, int, int, int] | None:
+        """(stored bytes, compress method, CRC-32, size) of `rel`, or None."""
+        row = self._db.execute(
+            "SELECT part, offset, csize, size, method FROM entries WHERE name=?",
+            (rel,),
+        ).fetchone()
+        if row is None:
+            return None
+        part, offset, csize, size, method = row
+        header = LOCAL_HEADER.unpack_from(
+            self._map(part, offset + LOCAL_HEADER.size), offset
+        )
+        start = offset + LOCAL_HEADER.size
+        start += header[_FH_NAME_LENGTH] + header[_FH_EXTRA_LENGTH]
+        mm = self._map(part, start + csize)
+        return memoryview(mm)[start : start + csize], method, header[_FH_CRC], size
+
+    def close(self):
+        self._db.close()
+
+
+_active: PackedArchive | None = None
+
+
+def start_packing(root: str | Path, repair: bool = True) -> PackedArchive | None:
+    """
+    Send this process's output under `root` into the archive, when
+    `packed_output.enabled`. `repair` is for the process that starts the
+    crawl (see PackedArchive.repair).
+    """
+    global _active
+    opts = settings.PACKED_OUTPUT or {}
+    if not opts.get("enabled"):
+        return None
+    archive = PackedArchive(root, opts.get("part_mb") or 1024, opts.get("level", 6))
+    if repair:
+        moved = archive.repair()
+        if moved:
+            print(f"[Archive] recovered {moved} files from an unfinished part")
+    _route(root, archive)
+    return archive
+
+
+def open_packed(root: str | Path) -> PackedArchive | None:
+    """
+    Route this process's output under `root` into the archive the backup
+    already has, whatever `packed_output` says now (for the offline
+    commands). None for a folder backup.
+    """
+    if not is_packed(root):
+        return None
+    archive = PackedArchive(root)
+    _route(root, archive)
+    return archive
+
+
+def is_packed(root: str | Path) -> bool:
+    return (Path(root) / "archive" / "index.sqlite").exists()
+
+
+def _route(root: str | Path, archive: PackedArchive):
+    global _active
+    set_sink(root, archive.upload, archive.download, archive.exists)
+    _active = archive
+
+
+def stop_packing(archive: PackedArchive | None):
+    """Restore disk writes and close the current part."""
+    global _active
+    if archive is None:
+        return
+    set_sink(None)
+    archive.close()
+    _active = None
+
+
+def packing() -> bool:
+    return _active is not None
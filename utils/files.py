@@ -1,31 +1,106 @@
 """
-Atomic file I/O helpers.
+Atomic file I/O helpers. Disk writes run off the event loop, through the
+queue in utils.writer.
 """
 
 from __future__ import annotations
 
 import asyncio
 import os
-import tempfile
 from pathlib import Path
+from typing import Callable
+
+from utils.writer import open_writer
+
+# (root, upload, download, exists, remote): writes under `root` are
+# handed to upload(rel, bytes) instead of going to disk (remote workers
+# send their output to the coordinator, packed output goes into
+# utils.archive)
+_sink: tuple[Path, Callable, Callable | None, Callable | None, bool] | None = None
+
+
+def set_sink(
+    root: str | Path | None, upload=None, download=None, exists=None, remote=False
+):
+    """
+    Redirect safe_file_write() calls for files under `root` to
+    `await upload(rel_path, data)`, safe_file_read() to
+    `await download(rel_path)` and file_exists() to `exists(rel_path)`, for
+    the hooks given. Each may return None for "not mine: use the disk".
+    `remote` says the output leaves this machine (see is_remote).
+    set_sink(None) restores disk I/O.
+    """
+    global _sink
+    _sink = (
+        (Path(root).resolve(), upload, download, exists, remote)
+        if root is not None
+        else None
+    )
+
+
+def _sink_rel(p: Path) -> str | None:
+    """`p` relative to the sink root, None if it is outside."""
+    try:
+        return p.resolve().relative_to(_sink[0]).as_posix()
+    except ValueError:
+        return None
+
+
+def is_remote(path: str | Path) -> bool:
+    """
+    True if `path` belongs to a remote sink: this machine keeps no copy, so
+    local caches and indexes of the output do not apply.
+    """
+    return _sink is not None and _sink[4] and _sink_rel(Path(path)) is not None
+
+
+def file_exists(path: str | Path) -> bool:
+    """os.path.exists() that also sees files held by the sink."""
+    if _sink is not None and _sink[3] is not None:
+        rel = _sink_rel(Path(path))
+        if rel is not None:
+            found = _sink[3](rel)
+            if found is not None:
+                return found
+    return os.path.exists(path)
+
+
+async def _write_to_sink(p: Path, data: str | bytes) -> bool | None:
+    rel = _sink_rel(p)
+    if rel is None:
+        return None  # outside the sink root: write locally
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return await _sink[1](rel, data)
 
 
 async def safe_file_write(path: str | Path, data: str | bytes, mode: str = "w") -> bool:
     try:
         p = Path(path)
-        p.parent.mkdir(parents=True, exist_ok=True)
-        fd, tmp = tempfile.mkstemp(dir=p.parent, suffix=".tmp")
-        with os.fdopen(fd, mode, encoding=None if "b" in mode else "utf-8") as fh:
-            fh.write(data)
-        os.replace(tmp, p)
-        return True
+        if _sink is not None:
+            sent = await _write_to_sink(p, data)
+            if sent is not None:
+                return sent
+        return await open_writer().write(p, data, mode)
     except Exception as e:
         print(f"[FileWrite] {e}")
         return False
 
 
+async def _read_from_sink(p: Path) -> bytes | None:
+    download = _sink[2]
+    rel = _sink_rel(p) if download is not None else None
+    if rel is None:
+        return None
+    return await download(rel)
+
+
 async def safe_file_read(path: str | Path, mode: str = "r"):
     try:
+        if _sink is not None:
+            data = await _read_from_sink(Path(path))
+            if data is not None:
+                return data if "b" in mode else data.decode("utf-8")
         return await asyncio.to_thread(
             Path(path).read_text if "b" not in mode else Path(path).read_bytes
         )
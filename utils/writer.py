@@ -0,0 +1,218 @@
+"""
+Off-loop file writer behind utils.files.safe_file_write.
+
+Writes go into a bounded queue. A few drain tasks take them in batches and
+run each batch in a thread pool, so the event loop never waits on the disk.
+When the queue is full, the writing coroutine waits, and the crawl slows to
+what the disk can take instead of buffering pages in memory.
+
+fsync policy (settings.FILE_WRITER["fsync"]):
+  none   rely on the OS (the default; a crash can lose recent files)
+  file   sync every file, then its folder, before the write returns
+  batch  sync a batch's files before their renames, then each folder once
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import config.settings as settings
+
+FSYNC_MODES = ("none", "file", "batch")
+LATENCY_SAMPLES = 4096  # recent writes kept for the p95
+
+
+def _fsync_dir(path: Path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return  # no directory handles (Windows)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class FileWriter:
+    """
+    Bounded write queue drained by `threads` worker threads; see the module
+    docstring. Bound to the event loop it was created on.
+    """
+
+    def __init__(
+        self, threads: int = 4, queue: int = 256, batch: int = 32, fsync="none"
+    ):
+        if fsync not in FSYNC_MODES:
+            raise ValueError(f"fsync must be one of {FSYNC_MODES}, not {fsync!r}")
+        self.loop = asyncio.get_running_loop()
+        self.fsync = fsync
+        self.batch = max(1, batch)
+        self.queue: asyncio.Queue = asyncio.Queue(max(1, queue))
+        self.pool = ThreadPoolExecutor(max(1, threads), "file-writer")
+        self._dirs: set[Path] = set()  # folders known to exist
+        self._dirs_lock = threading.Lock()
+        self._stats_lock = threading.Lock()  # counters bumped by the threads
+        self._latency: list[float] = []
+        self.stats = {"writes": 0, "bytes": 0, "failed": 0, "batches": 0}
+        self.stats.update(mkdirs=0, fsyncs=0, queue_max=0, waited=0)
+        self._drains = [
+            self.loop.create_task(self._drain()) for _ in range(max(1, threads))
+        ]
+        self.closed = False
+
+    async def write(self, path: Path, data: str | bytes, mode: str = "w") -> bool:
+        """Queue one atomic write and wait until it is done."""
+        done = self.loop.create_future()
+        if self.queue.full():
+            self.stats["waited"] += 1  # backpressure: the disk is behind
+        await self.queue.put((path, data, mode, done, time.perf_counter()))
+        self.stats["queue_max"] = max(self.stats["queue_max"], self.queue.qsize())
+        return await done
+
+    async def _drain(self):
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.batch and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                sizes = await self.loop.run_in_executor(
+                    self.pool, self._write_batch, batch
+                )
+            except Exception as e:
+                print(f"[FileWrite] {e}")
+                sizes = [None] * len(batch)
+            now = time.perf_counter()
+            self.stats["batches"] += 1
+            for (_, _, _, done, t0), size in zip(batch, sizes, strict=True):
+                ok = size is not None
+                self._latency.append(now - t0)
+                self.stats["writes" if ok else "failed"] += 1
+                if ok:
+                    self.stats["bytes"] += size
+                if not done.done():
+                    done.set_result(ok)
+                self.queue.task_done()
+            del self._latency[:-LATENCY_SAMPLES]
+
+    # ---- worker threads ---------------------------------------------------
+    def _write_batch(self, batch: list) -> list[int | None]:
+        """Bytes written per item of `batch`, None where the write failed."""
+        staged: list[tuple[str, int, Path] | None] = []
+        for path, data, mode, _, _ in batch:
+            try:
+                staged.append((*self._stage(path, data, mode), path))
+            except Exception as e:
+                print(f"[FileWrite] {e}")
+                staged.append(None)
+        results: list[int | None] = []
+        for item in staged:
+            if item is None:
+                results.append(None)
+                continue
+            tmp, size, path = item
+            try:
+                os.replace(tmp, path)
+                if self.fsync == "file":
+                    self._sync_dir(path.parent)
+                results.append(size)
+            except Exception as e:
+                print(f"[FileWrite] {e}")
+                results.append(None)
+        if self.fsync == "batch":
+            for folder in {item[2].parent for item in staged if item}:
+                self._sync_dir(folder)
+        return results
+
+    def _stage(self, path: Path, data: str | bytes, mode: str) -> tuple[str, int]:
+        """
+        Write `data` to a temp file next to `path`; returns its name and
+        size in bytes.
+        """
+        folder = path.parent
+        if folder not in self._dirs:
+            with self._dirs_lock:  # threads writing into the same new folder
+                if folder not in self._dirs:
+                    folder.mkdir(parents=True, exist_ok=True)
+                    self._dirs.add(folder)
+                    self._count("mkdirs")
+        fd, tmp = tempfile.mkstemp(dir=folder, suffix=".tmp")
+        try:
+            with os.fdopen(fd, mode, encoding=None if "b" in mode else "utf-8") as fh:
+                fh.write(data)
+                fh.flush()
+                size = os.fstat(fh.fileno()).st_size  # bytes, not characters
+                if self.fsync != "none":
+                    os.fsync(fh.fileno())
+                    self._count("fsyncs")
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        return tmp, size
+
+    def _sync_dir(self, folder: Path):
+        _fsync_dir(folder)
+        self._count("fsyncs")
+
+    def _count(self, key: str):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    # ---- reporting / shutdown ---------------------------------------------
+    def report(self) -> dict:
+        lat = sorted(self._latency)
+        p95 = lat[int(len(lat) * 0.95) - 1] if len(lat) > 1 else sum(lat)
+        return {
+            **self.stats,
+            "fsync": self.fsync,
+            "queue_depth": self.queue.qsize(),
+            "latency_ms": {
+                "avg": round(sum(lat) / len(lat) * 1000, 3) if lat else 0.0,
+                "p95": round(p95 * 1000, 3),
+                "max": round(lat[-1] * 1000, 3) if lat else 0.0,
+            },
+        }
+
+    async def close(self):
+        """Finish the queued writes, then stop the drain tasks and threads."""
+        self.closed = True
+        await self.queue.join()
+        for t in self._drains:
+            t.cancel()
+        self.pool.shutdown(wait=False)
+
+
+_writer: FileWriter | None = None
+
+
+def open_writer() -> FileWriter:
+    """The writer for the running event loop, created from settings."""
+    global _writer
+    loop = asyncio.get_running_loop()
+    if _writer is None or _writer.loop is not loop or _writer.closed:
+        if _writer is not None:
+            _writer.pool.shutdown(wait=False)  # its loop is gone
+        cfg = settings.FILE_WRITER or {}
+        _writer = FileWriter(
+            threads=cfg.get("threads", 4),
+            queue=cfg.get("queue", 256),
+            batch=cfg.get("batch", 32),
+            fsync=cfg.get("fsync") or "none",
+        )
+    return _writer
+
+
+async def close_writer():
+    """Flush and stop the current writer; its report stays available."""
+    if _writer is not None and not _writer.closed:
+        await _writer.close()
+
+
+def writer_report() -> dict | None:
+    """Metrics of the current writer, None if nothing was written."""
+    return _writer.report() if _writer is not None else None